@@ -1,13 +1,20 @@
 import argparse
+import collections
 import dataclasses
-import glob
+import json
 import logging
 import sys
-import time
-from typing import Iterable
-from urllib.error import HTTPError
+from typing import TYPE_CHECKING, Iterable
 
-from .transfer import migrate_repo
+# Only the parser's defaults are imported here, so that --help starts fast.
+# Each command imports what it needs when it runs, so the quick ones stay
+# quick and only the commands that talk to github pay for the heavy modules
+# (fastcore, GitPython).
+from .constants import CLONE, DRY_RUN_DIR, LEASE_TTL, MAX_BLOB_SIZE, OUTPUTS
+
+if TYPE_CHECKING:
+    from .plan import Plan
+    from .schedule import RepoCost
 
 logger = logging.getLogger("afs_ioc_migration")
 
@@ -16,82 +23,678 @@ logger = logging.getLogger("afs_ioc_migration")
 class MainArgs:
     org: str = ""
     stop_on_error: bool = False
+    max_attempts: int = 5
+    retry_delay: float = 5.0
     dry_run: bool = False
+    dry_run_dir: str = DRY_RUN_DIR
+    dry_run_output: str = CLONE
+    dry_run_budget: int = 0
+    verbose: bool = False
+    jobs: int = 1
+    publish_jobs: int = 0
+    queue_size: int = 0
+    no_org_index: bool = False
+    journal: str = ""
+    cache_dir: str = ""
+    no_checkout: bool = False
+    largest_first: bool = False
+    timings: str = ""
+    prometheus_textfile: str = ""
+    api_url: str = ""
+    push_url_template: str = ""
+    sync: bool = False
+    work_dir: str = ""
+    lease_ttl: float = LEASE_TTL
+    manifest: str = ""
+    plan: str = ""
+    paths: Iterable[str] = ()
+
+
+@dataclasses.dataclass
+class PreflightArgs:
     verbose: bool = False
+    jobs: int = 1
+    output: str = "-"
+    max_blob_size: int = MAX_BLOB_SIZE
+    manifest: str = ""
+    plan: str = ""
+    paths: Iterable[str] = ()
+
+
+@dataclasses.dataclass
+class PlanArgs:
+    verbose: bool = False
+    org: str = ""
+    output: str = "-"
+    manifest: str = ""
     paths: Iterable[str] = ()
 
 
+@dataclasses.dataclass
+class LockArgs:
+    verbose: bool = False
+    org: str = ""
+    jobs: int = 1
+    manifest: str = ""
+    plan: str = ""
+    paths: Iterable[str] = ()
+
+
+@dataclasses.dataclass
+class StatusArgs(LockArgs):
+    output: str = "-"
+
+
+@dataclasses.dataclass
+class VerifyArgs:
+    verbose: bool = False
+    org: str = ""
+    jobs: int = 1
+    output: str = "-"
+    api_url: str = ""
+    push_url_template: str = ""
+    manifest: str = ""
+    plan: str = ""
+    paths: Iterable[str] = ()
+
+
+@dataclasses.dataclass
+class InventoryArgs:
+    verbose: bool = False
+    jobs: int = 1
+    output: str = "-"
+    max_depth: int = 3
+    roots: Iterable[str] = ()
+
+
 parser = argparse.ArgumentParser(
     "afs_ioc_migration",
     description="Migrate afs filesystem EPICS IOC repositories to GitHub.",
 )
-parser.add_argument(
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+common = argparse.ArgumentParser(add_help=False)
+common.add_argument(
+    "--verbose",
+    "-v",
+    action="store_true",
+    help="Show additional debug statements",
+)
+
+repos = argparse.ArgumentParser(add_help=False)
+repos.add_argument(
+    "--manifest",
+    action="store",
+    default="",
+    help="Path to a manifest written by the inventory command. The repositories are read from it instead of searching afs, and any paths given are matched against it as globs.",
+)
+repos.add_argument(
+    "paths",
+    action="store",
+    nargs="*",
+    help="Paths to the .git file bare repositories. Accepts specific filenames and globs. Required unless --manifest or --plan is provided.",
+)
+
+planned = argparse.ArgumentParser(add_help=False)
+planned.add_argument(
+    "--plan",
+    action="store",
+    default="",
+    help="Path to a plan written by the plan command. The repositories and their github names are read from it, and any paths given are matched against it as globs. Repositories the plan found problems with are not migrated.",
+)
+
+migrate_parser = subparsers.add_parser(
+    "migrate",
+    parents=[common, repos, planned],
+    help="Migrate the repositories to GitHub.",
+    description="Migrate afs filesystem EPICS IOC repositories to GitHub.",
+)
+migrate_parser.add_argument(
     "--org",
     action="store",
     default="pcdshub",
     help="The name of the github organization to migrate repositories to.",
 )
-parser.add_argument(
+migrate_parser.add_argument(
     "--stop-on-error",
     action="store_true",
     help="If provided, we'll stop at the first error instead of proceeding to the next file.",
 )
-parser.add_argument(
+migrate_parser.add_argument(
+    "--max-attempts",
+    action="store",
+    type=int,
+    default=5,
+    help="How many times to try a repository that fails for a reason that may go away, such as a github server error, a rate limit or a dropped push. Other repositories carry on while it waits. Defaults to 5.",
+)
+migrate_parser.add_argument(
+    "--retry-delay",
+    action="store",
+    type=float,
+    default=5.0,
+    help="Seconds to wait before the first retry of a repository, doubling for every retry after that, with some random jitter. Defaults to 5.",
+)
+migrate_parser.add_argument(
     "--dry-run",
     action="store_true",
     help="If provided, we won't make any real changes to the afs or github areas, and we'll prepare the repo clones in the user's current directory for inspection.",
 )
-parser.add_argument(
-    "--verbose",
-    "-v",
+migrate_parser.add_argument(
+    "--dry-run-dir",
+    action="store",
+    default=DRY_RUN_DIR,
+    help=f"Where dry runs leave their output for each repository. Defaults to {DRY_RUN_DIR} in the current directory.",
+)
+migrate_parser.add_argument(
+    "--dry-run-output",
+    action="store",
+    choices=OUTPUTS,
+    default=CLONE,
+    help="What dry runs leave for each repository: the full clone with a working tree, a summary with our new commits as patches, the refs that would be pushed and stats about the tree, or the summary and a git bundle of the new commits. Defaults to clone.",
+)
+migrate_parser.add_argument(
+    "--dry-run-budget",
+    action="store",
+    type=int,
+    default=0,
+    help="If provided, remove the oldest outputs from earlier dry runs until the dry run directory uses at most this many megabytes.",
+)
+migrate_parser.add_argument(
+    "--jobs",
+    "-j",
+    action="store",
+    type=int,
+    default=1,
+    help="The number of repositories to prepare locally at the same time. Defaults to 1.",
+)
+migrate_parser.add_argument(
+    "--publish-jobs",
+    action="store",
+    type=int,
+    default=0,
+    help="The number of repositories to create and push to github at the same time. Defaults to the same as --jobs.",
+)
+migrate_parser.add_argument(
+    "--queue-size",
+    action="store",
+    type=int,
+    default=0,
+    help="The number of prepared repositories that may wait on disk to be pushed. Defaults to the same as --jobs.",
+)
+migrate_parser.add_argument(
+    "--no-org-index",
     action="store_true",
-    help="Show additional debug statements",
+    help="If provided, ask github about each repository separately instead of listing the whole organization once at the start.",
 )
-parser.add_argument(
-    "paths",
+migrate_parser.add_argument(
+    "--journal",
+    action="store",
+    default="",
+    help="Path to a sqlite file that records each finished migration stage. Reruns with the same journal skip repos and stages that are already done.",
+)
+migrate_parser.add_argument(
+    "--cache-dir",
+    action="store",
+    default="",
+    help="Path to a directory to keep local mirrors of the afs repositories in. Later runs, dry or real, only read new objects from afs. Dry run clones made this way depend on the mirrors.",
+)
+migrate_parser.add_argument(
+    "--no-checkout",
+    action="store_true",
+    help="If provided, build the standard file commits directly from git trees and blobs instead of checking out each repository. The resulting history is the same.",
+)
+migrate_parser.add_argument(
+    "--largest-first",
+    action="store_true",
+    help="If provided, estimate each repository's cost from its size on disk and migrate the most expensive ones first so that the small ones fill in the gaps at the end. The predicted and actual times are logged at the end.",
+)
+migrate_parser.add_argument(
+    "--timings",
+    action="store",
+    default="",
+    help="Path to a file to append a json line to for every timed stage of every repository, with its duration, bytes moved, and github api calls. A summary of the slowest stages and repositories is always logged at the end.",
+)
+migrate_parser.add_argument(
+    "--prometheus-textfile",
+    action="store",
+    default="",
+    help="Path to write the per-stage timing summary to at the end, in the format of the node exporter's textfile collector.",
+)
+migrate_parser.add_argument(
+    "--api-url",
+    action="store",
+    default="",
+    help="Send github api calls to this server instead, e.g. the fake github from python -m afs_ioc_migration.benchmark.server.",
+)
+migrate_parser.add_argument(
+    "--push-url-template",
+    action="store",
+    default="",
+    help="Push to this url instead of github, with {org} and {name} filled in, e.g. /tmp/fake_github/{org}/{name}.git.",
+)
+migrate_parser.add_argument(
+    "--sync",
+    action="store_true",
+    help="If provided, catch up github repositories that already have commits instead of refusing them. Only the branches and tags that are new or moved on afs are pushed, and if afs HEAD moved, its new commits are merged into master, which is never force pushed. Anything that would overwrite commits made on github is reported and left alone.",
+)
+migrate_parser.add_argument(
+    "--work-dir",
+    action="store",
+    default="",
+    help="If provided, share the migration with other workers, on this host or others, through this directory on a shared filesystem. The first worker's repositories become the work list, later workers may be started without any, and every worker claims repositories from it one at a time. A repository is never migrated twice, and those of a worker that died are taken over once its leases expire.",
+)
+migrate_parser.add_argument(
+    "--lease-ttl",
+    action="store",
+    type=float,
+    default=LEASE_TTL,
+    help=f"With --work-dir, how many seconds a worker's claim on a repository lasts after its last heartbeat. Must be much longer than any pause of a live worker. Defaults to {LEASE_TTL:.0f}.",
+)
+
+preflight_parser = subparsers.add_parser(
+    "preflight",
+    parents=[common, repos, planned],
+    help="Check the repositories for problems without changing anything.",
+    description="Check afs repositories for problems that would make the migration fail, using only read-only git queries. Writes a json report.",
+)
+preflight_parser.add_argument(
+    "--jobs",
+    "-j",
+    action="store",
+    type=int,
+    default=1,
+    help="The number of repositories to check at the same time. Defaults to 1.",
+)
+preflight_parser.add_argument(
+    "--output",
+    "-o",
+    action="store",
+    default="-",
+    help="Where to write the json report. Defaults to stdout.",
+)
+preflight_parser.add_argument(
+    "--max-blob-size",
+    action="store",
+    type=int,
+    default=MAX_BLOB_SIZE,
+    help="Report files larger than this many bytes. Defaults to github's 100 MB limit.",
+)
+
+plan_parser = subparsers.add_parser(
+    "plan",
+    parents=[common, repos],
+    help="Work out every github name up front and check for clashes.",
+    description="Work out the github name of every repository from its path alone, without touching afs. Reports repositories that can't be named and names that more than one repository would get, and writes a json plan for the other commands to use with --plan.",
+)
+plan_parser.add_argument(
+    "--org",
+    action="store",
+    default="pcdshub",
+    help="The name of the github organization to plan for.",
+)
+plan_parser.add_argument(
+    "--output",
+    "-o",
+    action="store",
+    default="-",
+    help="Where to write the json plan. Defaults to stdout.",
+)
+
+fleet = argparse.ArgumentParser(add_help=False)
+fleet.add_argument(
+    "--org",
+    action="store",
+    default="pcdshub",
+    help="The name of the github organization the hooks point to.",
+)
+fleet.add_argument(
+    "--jobs",
+    "-j",
+    action="store",
+    type=int,
+    default=1,
+    help="The number of repositories to work on at the same time. Defaults to 1.",
+)
+
+lock_parser = subparsers.add_parser(
+    "lock",
+    parents=[common, repos, planned, fleet],
+    help="Lock every repository against pushes at once.",
+    description="Install our pre-receive hook in every repository at once, so that the whole fleet is frozen before the migration starts instead of one repository at a time. Repositories that are already locked are left alone.",
+)
+unlock_parser = subparsers.add_parser(
+    "unlock",
+    parents=[common, repos, planned, fleet],
+    help="Undo the lock command.",
+    description="Remove our pre-receive hook from every repository, putting back any hook it replaced.",
+)
+status_parser = subparsers.add_parser(
+    "status",
+    parents=[common, repos, planned, fleet],
+    help="Check which repositories are locked.",
+    description="Check every repository for our pre-receive hook and write a json report.",
+)
+status_parser.add_argument(
+    "--output",
+    "-o",
+    action="store",
+    default="-",
+    help="Where to write the json report. Defaults to stdout.",
+)
+
+verify_parser = subparsers.add_parser(
+    "verify",
+    parents=[common, repos, planned],
+    help="Check that every repository arrived on GitHub intact.",
+    description="Compare every branch and tag on afs with github using git ls-remote on both sides, without cloning anything. Master must be afs HEAD with our standard file commits on top, and the topics and custom properties must be set. Writes a json report of every mismatch.",
+)
+verify_parser.add_argument(
+    "--org",
+    action="store",
+    default="pcdshub",
+    help="The name of the github organization the repositories were migrated to.",
+)
+verify_parser.add_argument(
+    "--jobs",
+    "-j",
+    action="store",
+    type=int,
+    default=1,
+    help="The number of git ls-remote calls to run at the same time. Defaults to 1.",
+)
+verify_parser.add_argument(
+    "--output",
+    "-o",
+    action="store",
+    default="-",
+    help="Where to write the json report. Defaults to stdout.",
+)
+verify_parser.add_argument(
+    "--api-url",
+    action="store",
+    default="",
+    help="Send github api calls to this server instead, like migrate --api-url.",
+)
+verify_parser.add_argument(
+    "--push-url-template",
+    action="store",
+    default="",
+    help="List refs at this url instead of github, like migrate --push-url-template.",
+)
+
+inventory_parser = subparsers.add_parser(
+    "inventory",
+    parents=[common],
+    help="Find every repository once and write a manifest for the other commands.",
+    description="Walk the afs directory tree once, in parallel, and write a json manifest of the resolved repository paths with their sizes and ref counts. Pass it to the other commands with --manifest to skip searching afs.",
+)
+inventory_parser.add_argument(
+    "--jobs",
+    "-j",
+    action="store",
+    type=int,
+    default=1,
+    help="The number of directories to list at the same time. Defaults to 1.",
+)
+inventory_parser.add_argument(
+    "--output",
+    "-o",
+    action="store",
+    default="-",
+    help="Where to write the json manifest. Defaults to stdout.",
+)
+inventory_parser.add_argument(
+    "--max-depth",
+    action="store",
+    type=int,
+    default=3,
+    help="How many directories deep to look for repositories. Defaults to 3, enough for area/sub/name.git below the ioc directory.",
+)
+inventory_parser.add_argument(
+    "roots",
     action="store",
     nargs="+",
-    help="Paths to the .git file bare repositories to migrate. Accepts specific filenames and globs.",
+    help="The directories to search, e.g. the epics/ioc directory.",
 )
 
 
+def read_plan(path: str) -> "Plan | None":
+    """Read the plan at path, or return None if there is no path."""
+    if not path:
+        return None
+    from .plan import Plan
+
+    return Plan.read(path)
+
+
+def get_repos(
+    paths: Iterable[str], manifest: str, plan: "Plan | None" = None
+) -> tuple[list[str], dict[str, "RepoCost"]]:
+    """
+    Find the repos to work on, from afs, from a manifest, or from a plan.
+
+    Also returns what we know about each repo's cost, if anything.
+    """
+    from .inventory import expand_paths, read_manifest, select
+    from .schedule import RepoCost
+
+    if manifest and plan is not None:
+        parser.error("Only one of --manifest and --plan may be provided.")
+    if plan is not None:
+        costs = select([RepoCost(afs_path=afs_path) for afs_path in plan.repos], paths)
+        return [cost.afs_path for cost in costs], {}
+    if not manifest:
+        if not paths:
+            parser.error("Either paths or --manifest is required.")
+        return list(expand_paths(paths)), {}
+    costs = select(read_manifest(manifest), paths)
+    return [cost.afs_path for cost in costs], {cost.afs_path: cost for cost in costs}
+
+
 def main(args: MainArgs) -> int:
-    first_loop = True
-    n_errors = 0
-    for user_glob in args.paths:
-        for user_path in glob.glob(user_glob):
-            if first_loop:
-                first_loop = False
-            else:
-                # Slightly pace out the migrations to help avoid API rate limits
-                # Github recommends waiting 1s between mutative requests
-                # We make 2 mutative requests per call (create repo, replace topics)
-                # So, we sleep 2 seconds
-                logger.debug("Sleeping 2s to avoid rate limits")
-                time.sleep(2)
-            logger.info(
-                f"Migrating {user_path} to org={args.org} with dry_run={args.dry_run}"
-            )
-            try:
-                migrate_repo(afs_path=user_path, org=args.org, dry_run=args.dry_run)
-            except HTTPError:
-                logger.error("Stopping on HTTPError")
-                raise
-            except Exception:
-                if args.stop_on_error:
-                    raise
-                else:
-                    logger.exception(f"Exception while transferring {user_path}")
-                n_errors += 1
-
-    return n_errors
+    """Migrate the repos, returning the number that failed."""
+    from .retry import RetryPolicy
+    from .runner import migrate_many
+
+    plan = read_plan(args.plan)
+    if plan is not None and plan.org != args.org:
+        parser.error(f"The plan is for --org {plan.org}, not {args.org}.")
+    if args.work_dir and not (args.paths or args.manifest or plan is not None):
+        # Join the other workers, using the work list they shared
+        paths, known_costs = [], {}
+    else:
+        paths, known_costs = get_repos(args.paths, args.manifest, plan)
+    return migrate_many(
+        paths=paths,
+        org=args.org,
+        dry_run=args.dry_run,
+        dry_run_dir=args.dry_run_dir,
+        dry_run_output=args.dry_run_output,
+        dry_run_budget=args.dry_run_budget * 1024**2,
+        jobs=args.jobs,
+        stop_on_error=args.stop_on_error,
+        retry=RetryPolicy(max_attempts=args.max_attempts, base_delay=args.retry_delay),
+        publish_jobs=args.publish_jobs,
+        queue_size=args.queue_size,
+        use_org_index=not args.no_org_index,
+        journal_path=args.journal,
+        cache_dir=args.cache_dir,
+        checkout=not args.no_checkout,
+        schedule_largest_first=args.largest_first,
+        known_costs=known_costs,
+        timings_path=args.timings,
+        prometheus_path=args.prometheus_textfile,
+        api_url=args.api_url,
+        push_url_template=args.push_url_template,
+        sync=args.sync,
+        resolve=not args.manifest,
+        plan=plan,
+        work_dir=args.work_dir,
+        lease_ttl=args.lease_ttl,
+    )
+
+
+def preflight_main(args: PreflightArgs) -> int:
+    """Check the repos and write the report, returning the number that failed."""
+    from .preflight import preflight_many, write_report
+
+    plan = read_plan(args.plan)
+    paths, _ = get_repos(args.paths, args.manifest, plan)
+    reports = preflight_many(
+        paths=paths,
+        jobs=args.jobs,
+        max_blob_size=args.max_blob_size,
+        resolve=not args.manifest,
+        plan=plan,
+    )
+    if args.output == "-":
+        write_report(reports, sys.stdout)
+    else:
+        with open(args.output, "w") as fd:
+            write_report(reports, fd)
+    n_failed = sum(1 for report in reports if not report.ok)
+    logger.info(f"Checked {len(reports)} repos, {n_failed} would fail to migrate")
+    return n_failed
+
+
+def plan_main(args: PlanArgs) -> int:
+    """
+    Plan every repo and write the plan.
+
+    Returns the number of repos that can't be migrated as planned.
+    """
+    from .plan import Plan
+
+    paths, _ = get_repos(args.paths, args.manifest)
+    plan = Plan.build(paths, org=args.org)
+    if args.output == "-":
+        plan.write(sys.stdout)
+    else:
+        with open(args.output, "w") as fd:
+            plan.write(fd)
+    n_bad = len(plan.invalid) + sum(len(paths) for paths in plan.collisions.values())
+    logger.info(f"Planned {len(plan.repos)} repos, {n_bad} can't be migrated")
+    return n_bad
+
+
+def lock_main(args: LockArgs) -> int:
+    """Lock every repo, returning the number that failed."""
+    from .lock_repo import lock_many
+
+    plan = read_plan(args.plan)
+    paths, _ = get_repos(args.paths, args.manifest, plan)
+    return lock_many(
+        paths=paths,
+        org=args.org,
+        jobs=args.jobs,
+        resolve=not args.manifest,
+        plan=plan,
+    )
+
+
+def unlock_main(args: LockArgs) -> int:
+    """Unlock every repo, returning the number that failed."""
+    from .lock_repo import unlock_many
+
+    plan = read_plan(args.plan)
+    paths, _ = get_repos(args.paths, args.manifest, plan)
+    return unlock_many(
+        paths=paths,
+        org=args.org,
+        jobs=args.jobs,
+        resolve=not args.manifest,
+        plan=plan,
+    )
+
+
+def status_main(args: StatusArgs) -> int:
+    """Write every repo's lock status, returning the number we couldn't check."""
+    from .lock_repo import status_many
+
+    plan = read_plan(args.plan)
+    paths, _ = get_repos(args.paths, args.manifest, plan)
+    statuses = status_many(
+        paths=paths,
+        org=args.org,
+        jobs=args.jobs,
+        resolve=not args.manifest,
+        plan=plan,
+    )
+    summary = collections.Counter(
+        "error" if status.startswith("error") else status
+        for status in statuses.values()
+    )
+    report = {"summary": dict(summary), "repos": statuses}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as fd:
+            json.dump(report, fd, indent=2)
+            fd.write("\n")
+    return summary["error"]
+
+
+def verify_main(args: VerifyArgs) -> int:
+    """Verify the repos and write the report, returning the number that failed."""
+    from .verify import verify_many
+    from .verify import write_report as write_verify_report
+
+    plan = read_plan(args.plan)
+    if plan is not None and plan.org != args.org:
+        parser.error(f"The plan is for --org {plan.org}, not {args.org}.")
+    paths, _ = get_repos(args.paths, args.manifest, plan)
+    reports = verify_many(
+        paths=paths,
+        org=args.org,
+        jobs=args.jobs,
+        resolve=not args.manifest,
+        plan=plan,
+        api_url=args.api_url,
+        push_url_template=args.push_url_template,
+    )
+    if args.output == "-":
+        write_verify_report(reports, sys.stdout)
+    else:
+        with open(args.output, "w") as fd:
+            write_verify_report(reports, fd)
+    n_failed = sum(1 for report in reports if not report.ok)
+    logger.info(f"Verified {len(reports)} repos, {n_failed} do not match afs")
+    return n_failed
+
+
+def inventory_main(args: InventoryArgs) -> int:
+    """Find the repos and write the manifest."""
+    from .inventory import scan, write_manifest
+
+    costs = scan(roots=args.roots, jobs=args.jobs, max_depth=args.max_depth)
+    if args.output == "-":
+        write_manifest(costs, sys.stdout)
+    else:
+        with open(args.output, "w") as fd:
+            write_manifest(costs, fd)
+    return 0
+
+
+commands = {
+    "migrate": (MainArgs, main),
+    "preflight": (PreflightArgs, preflight_main),
+    "plan": (PlanArgs, plan_main),
+    "lock": (LockArgs, lock_main),
+    "unlock": (LockArgs, unlock_main),
+    "status": (StatusArgs, status_main),
+    "verify": (VerifyArgs, verify_main),
+    "inventory": (InventoryArgs, inventory_main),
+}
 
 
 if __name__ == "__main__":
-    args = MainArgs()
-    parser.parse_args(namespace=args)
+    namespace = parser.parse_args()
+    args_type, command = commands[namespace.command]
+    del namespace.command
+    args = args_type(**vars(namespace))
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
     else:
         logging.basicConfig(level=logging.INFO)
-    sys.exit(main(args))
+    sys.exit(command(args))
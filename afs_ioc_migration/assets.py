@@ -0,0 +1,143 @@
+import dataclasses
+import functools
+import hashlib
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import jinja2
+
+PACKAGE_DIR = Path(__file__).parent
+
+
+def object_id(type_: str, data: bytes) -> str:
+    """The id git gives an object, assuming the default sha1 object format."""
+    return hashlib.sha1(f"{type_} {len(data)}\0".encode() + data).hexdigest()
+
+
+def write_object(objects_dir: Path, type_: str, data: bytes) -> str:
+    """
+    Write a loose object into a repo's objects directory and return its id.
+
+    This is what git hash-object -w does, without starting git.
+    Objects that are already there are left alone.
+    """
+    oid = object_id(type_, data)
+    path = objects_dir / oid[:2] / oid[2:]
+    if not path.exists():
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(
+            f"tmp_{oid[2:]}_{os.getpid()}_{threading.get_ident()}"
+        )
+        tmp_path.write_bytes(zlib.compress(f"{type_} {len(data)}\0".encode() + data))
+        tmp_path.chmod(0o444)
+        os.replace(tmp_path, path)
+    return oid
+
+
+def file_mode(path: Path) -> str:
+    """The git mode a file would be added with."""
+    return "100755" if os.stat(path).st_mode & 0o111 else "100644"
+
+
+@dataclasses.dataclass(frozen=True)
+class Blob:
+    """A file we add to every repo, with its git id worked out in advance."""
+
+    data: bytes
+    mode: str = "100644"
+
+    @functools.cached_property
+    def oid(self) -> str:
+        return object_id("blob", self.data)
+
+    @classmethod
+    def from_path(cls, path: Path) -> "Blob":
+        return cls(data=path.read_bytes(), mode=file_mode(path))
+
+    def write_file(self, path: Path) -> None:
+        """Write this blob into a working tree."""
+        path.write_bytes(self.data)
+        path.chmod(0o755 if self.mode == "100755" else 0o644)
+
+
+@dataclasses.dataclass(frozen=True)
+class Tree:
+    """A folder of files we add to every repo, with its git id worked out."""
+
+    blobs: dict[str, Blob]
+
+    @functools.cached_property
+    def data(self) -> bytes:
+        """The raw tree object, entries sorted by name like git does."""
+        return b"".join(
+            f"{blob.mode} {name}\0".encode() + bytes.fromhex(blob.oid)
+            for name, blob in sorted(self.blobs.items())
+        )
+
+    @functools.cached_property
+    def oid(self) -> str:
+        return object_id("tree", self.data)
+
+    @classmethod
+    def from_path(cls, path: Path) -> "Tree":
+        return cls(
+            blobs={child.name: Blob.from_path(child) for child in path.iterdir()}
+        )
+
+    def write_files(self, path: Path) -> None:
+        """Write this tree into a working tree, failing if it's already there."""
+        path.mkdir()
+        for name, blob in self.blobs.items():
+            blob.write_file(path / name)
+
+
+@dataclasses.dataclass(frozen=True)
+class Assets:
+    """
+    Everything we add to each repo, read from disk once per process.
+
+    Use get_assets rather than making these directly.
+    """
+
+    license: Blob
+    gitignore: Blob
+    github_folder: Tree
+    readme_template: "jinja2.Template"
+
+    @functools.cached_property
+    def gitignore_lines(self) -> list[str]:
+        return self.gitignore.data.decode().splitlines()
+
+    def write_objects(self, objects_dir: Path) -> None:
+        """
+        Make sure a repo has every fixed object we might refer to by id.
+
+        Only new objects are written, and they are loose objects that git
+        will pack along with everything else when we push.
+        """
+        for blob in (self.license, self.gitignore, *self.github_folder.blobs.values()):
+            write_object(objects_dir, "blob", blob.data)
+        write_object(objects_dir, "tree", self.github_folder.data)
+
+
+@functools.cache
+def get_assets() -> Assets:
+    """Load the shared assets the first time they are needed."""
+    # Not at the top, jinja2 is slow to import and most commands don't need it
+    import jinja2
+
+    jinja_env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(PACKAGE_DIR),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    return Assets(
+        license=Blob.from_path(PACKAGE_DIR / "sample_license.md"),
+        gitignore=Blob.from_path(PACKAGE_DIR / "sample_gitignore.txt"),
+        github_folder=Tree.from_path(PACKAGE_DIR / "sample_github_folder"),
+        readme_template=jinja_env.get_template("readme_template.md"),
+    )
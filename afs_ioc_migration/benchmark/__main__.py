@@ -0,0 +1,238 @@
+import argparse
+import dataclasses
+import logging
+import sys
+import tempfile
+
+from .fleet import FleetSpec, generate_fleet
+from .run import MODES, compare, read_baseline, run_benchmark, write_results
+from .server import Faults
+
+logger = logging.getLogger("afs_ioc_migration")
+
+
+@dataclasses.dataclass
+class BenchmarkArgs:
+    verbose: bool = False
+    repos: int = 10
+    areas: tuple[str, ...] = ("tst",)
+    commits: int = 20
+    files: int = 20
+    file_size: int = 2048
+    branches: int = 2
+    tags: int = 2
+    large_blobs: int = 0
+    large_blob_size: int = 10 * 1024**2
+    seed: int = 0
+    mode: tuple[str, ...] = MODES
+    latency: float = 0.0
+    server_error_rate: float = 0.0
+    secondary_rate: float = 0.0
+    jobs: int = 1
+    no_checkout: bool = False
+    workdir: str = ""
+    output: str = "-"
+    save: str = ""
+    compare: str = ""
+    max_regression: float = 0.0
+
+
+parser = argparse.ArgumentParser(
+    "afs_ioc_migration.benchmark",
+    description="Time migrations of a synthetic fleet of afs ioc repos without touching afs or github.",
+)
+parser.add_argument(
+    "--verbose",
+    "-v",
+    action="store_true",
+    help="Show additional debug statements",
+)
+fleet_group = parser.add_argument_group("fleet")
+fleet_group.add_argument(
+    "--repos", type=int, default=10, help="How many repos to generate."
+)
+fleet_group.add_argument(
+    "--areas",
+    nargs="+",
+    default=["tst"],
+    help="The ioc areas to spread the repos over.",
+)
+fleet_group.add_argument(
+    "--commits", type=int, default=20, help="Commits on master in each repo."
+)
+fleet_group.add_argument(
+    "--files", type=int, default=20, help="Text files in each repo's tree."
+)
+fleet_group.add_argument(
+    "--file-size", type=int, default=2048, help="Bytes in each text file."
+)
+fleet_group.add_argument(
+    "--branches", type=int, default=2, help="Extra branches in each repo."
+)
+fleet_group.add_argument("--tags", type=int, default=2, help="Tags in each repo.")
+fleet_group.add_argument(
+    "--large-blobs",
+    type=int,
+    default=0,
+    help="Large incompressible files in each repo.",
+)
+fleet_group.add_argument(
+    "--large-blob-size",
+    type=int,
+    default=10 * 1024**2,
+    help="Bytes in each large file.",
+)
+fleet_group.add_argument(
+    "--seed", type=int, default=0, help="Seed for the generated contents."
+)
+parser.add_argument(
+    "--mode",
+    nargs="+",
+    choices=MODES,
+    default=list(MODES),
+    help="Which migrations to time: dry-run only prepares each repo, local also creates and pushes to bare repos standing in for github, and server does the same through a fake github api over http. Default: all three.",
+)
+server_group = parser.add_argument_group("server mode")
+server_group.add_argument(
+    "--latency",
+    type=float,
+    default=0.0,
+    help="Seconds the fake github waits before each response.",
+)
+server_group.add_argument(
+    "--server-error-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of api requests the fake github answers with 502.",
+)
+server_group.add_argument(
+    "--secondary-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of api requests the fake github rejects with a secondary rate limit.",
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="How many repos to migrate at the same time.",
+)
+parser.add_argument(
+    "--no-checkout",
+    action="store_true",
+    help="Make the maintenance commits without a working tree, like migrate --no-checkout.",
+)
+parser.add_argument(
+    "--workdir",
+    default="",
+    help="Where to put the fleet and the stand-in github. Default: a temporary directory that is removed afterwards.",
+)
+parser.add_argument(
+    "--output",
+    "-o",
+    default="-",
+    help="Where to write the results as json. Default: stdout.",
+)
+parser.add_argument(
+    "--save",
+    default="",
+    help="Also save the results here as a baseline for later runs.",
+)
+parser.add_argument(
+    "--compare",
+    default="",
+    help="Compare the results with a baseline saved by an earlier run.",
+)
+parser.add_argument(
+    "--max-regression",
+    type=float,
+    default=0.0,
+    help="With --compare, exit nonzero if any metric is worse than the baseline by more than this fraction, e.g. 0.2.",
+)
+
+
+def main(args: BenchmarkArgs) -> int:
+    """Generate the fleet and time each mode, returning nonzero on failures."""
+    spec = FleetSpec(
+        repos=args.repos,
+        areas=tuple(args.areas),
+        commits=args.commits,
+        files=args.files,
+        file_size=args.file_size,
+        branches=args.branches,
+        tags=args.tags,
+        large_blobs=args.large_blobs,
+        large_blob_size=args.large_blob_size,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory(prefix="afs_benchmark_") as tmpdir:
+        workdir = args.workdir or tmpdir
+        results = []
+        for mode in args.mode:
+            # Each mode gets a fresh fleet, since local mode locks the repos
+            paths = generate_fleet(f"{workdir}/{mode}", spec, jobs=args.jobs)
+            result = run_benchmark(
+                paths,
+                mode=mode,
+                workdir=f"{workdir}/{mode}",
+                spec=spec,
+                jobs=args.jobs,
+                checkout=not args.no_checkout,
+                faults=Faults(
+                    latency=args.latency,
+                    server_error_rate=args.server_error_rate,
+                    secondary_rate=args.secondary_rate,
+                    seed=args.seed,
+                ),
+            )
+            logger.info(
+                f"{mode}: {len(result.repos)} repos in {result.seconds:.1f}s, "
+                f"{result.repos_per_minute:.1f} repos/min, "
+                f"{result.megabytes_per_second:.2f} MB/s, "
+                f"{result.failed} failed"
+            )
+            for stage, stats in result.stage_stats().items():
+                logger.info(
+                    f"{mode}: {stage} mean {stats['mean']:.3f}s, "
+                    f"median {stats['median']:.3f}s, max {stats['max']:.3f}s"
+                )
+            results.append(result)
+
+    if args.output == "-":
+        write_results(results, sys.stdout)
+    else:
+        with open(args.output, "w") as fd:
+            write_results(results, fd)
+    if args.save:
+        with open(args.save, "w") as fd:
+            write_results(results, fd)
+        logger.info(f"Saved baseline to {args.save}")
+
+    n_bad = sum(result.failed for result in results)
+    if args.compare:
+        baselines = read_baseline(args.compare)
+        for result in results:
+            if result.mode not in baselines:
+                logger.warning(f"No {result.mode} baseline in {args.compare}")
+                continue
+            for metric, change in compare(result, baselines[result.mode]).items():
+                logger.info(
+                    f"{result.mode}: {metric} {change['baseline']:.3f} -> "
+                    f"{change['current']:.3f} ({change['change']:+.1%})"
+                )
+                if args.max_regression and change["regression"] > args.max_regression:
+                    logger.error(
+                        f"{result.mode}: {metric} regressed by "
+                        f"{change['regression']:.1%}"
+                    )
+                    n_bad += 1
+    return n_bad
+
+
+if __name__ == "__main__":
+    args = BenchmarkArgs(**vars(parser.parse_args()))
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+    sys.exit(main(args))
@@ -0,0 +1,151 @@
+import dataclasses
+import logging
+import random
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Fixed so that the same spec always makes byte for byte the same fleet
+_COMMITTER = "Benchmark <benchmark@example.com>"
+_START_TIME = 1_500_000_000
+
+
+@dataclasses.dataclass(frozen=True)
+class FleetSpec:
+    """The shape of a synthetic fleet of afs ioc repos."""
+
+    # Total number of repos, spread evenly over the areas
+    repos: int = 10
+    areas: tuple[str, ...] = ("tst",)
+    # Commits on master, i.e. the history depth
+    commits: int = 20
+    # Text files in the tree, and how many bytes each one holds
+    files: int = 20
+    file_size: int = 2048
+    # Extra branches with one commit each, and annotated tags on master
+    branches: int = 2
+    tags: int = 2
+    # Random, incompressible files added in the first commit
+    large_blobs: int = 0
+    large_blob_size: int = 10 * 1024**2
+    seed: int = 0
+
+
+def repo_paths(root: str | Path, spec: FleetSpec) -> list[Path]:
+    """Where each repo in the fleet lives, as root/ioc/<area>/bench<num>.git."""
+    return [
+        Path(root) / "ioc" / spec.areas[num % len(spec.areas)] / f"bench{num:04d}.git"
+        for num in range(spec.repos)
+    ]
+
+
+def _data(chunks: list[bytes], content: bytes) -> None:
+    chunks.append(f"data {len(content)}\n".encode())
+    chunks.append(content)
+    chunks.append(b"\n")
+
+
+def _commit(
+    chunks: list[bytes],
+    ref: str,
+    mark: int,
+    parent: int,
+    when: int,
+    message: str,
+    changes: dict[str, bytes],
+) -> None:
+    chunks.append(f"commit {ref}\nmark :{mark}\n".encode())
+    chunks.append(f"committer {_COMMITTER} {when} +0000\n".encode())
+    _data(chunks, message.encode())
+    if parent:
+        chunks.append(f"from :{parent}\n".encode())
+    for path, content in changes.items():
+        chunks.append(f"M 100644 inline {path}\n".encode())
+        _data(chunks, content)
+
+
+def fast_import_stream(spec: FleetSpec, seed: int) -> bytes:
+    """
+    The git fast-import input for one repo.
+
+    Master gets spec.commits commits. The first adds every file, including
+    a readme and a gitignore so the maintenance commits have something to
+    replace, and each later commit rewrites a tenth of the text files.
+    """
+    rng = random.Random(seed)
+
+    def text() -> bytes:
+        return rng.randbytes(spec.file_size // 2).hex().encode()
+
+    file_names = [f"src/file{num:04d}.txt" for num in range(spec.files)]
+    changes = {name: text() for name in file_names}
+    changes["README"] = b"An ioc made up for benchmarks\n"
+    changes[".gitignore"] = b"*.o\nO.*\n/build/\n"
+    for num in range(spec.large_blobs):
+        changes[f"data/large{num:02d}.bin"] = rng.randbytes(spec.large_blob_size)
+
+    chunks: list[bytes] = []
+    when = _START_TIME
+    _commit(chunks, "refs/heads/master", 1, 0, when, "Initial commit", changes)
+    for mark in range(2, spec.commits + 1):
+        when += 3600
+        touched = rng.sample(file_names, k=min(len(file_names), spec.files // 10 + 1))
+        _commit(
+            chunks,
+            "refs/heads/master",
+            mark,
+            mark - 1,
+            when,
+            f"Commit {mark}",
+            {name: text() for name in touched},
+        )
+    last = max(spec.commits, 1)
+    for num in range(spec.branches):
+        mark = last + 1 + num
+        when += 3600
+        _commit(
+            chunks,
+            f"refs/heads/branch{num:02d}",
+            mark,
+            rng.randint(1, last),
+            when,
+            f"Work on branch {num}",
+            {f"src/branch{num:02d}.txt": text()},
+        )
+    for num in range(spec.tags):
+        when += 3600
+        chunks.append(f"tag v{num}.0.0\nfrom :{rng.randint(1, last)}\n".encode())
+        chunks.append(f"tagger {_COMMITTER} {when} +0000\n".encode())
+        _data(chunks, f"Release {num}".encode())
+    return b"".join(chunks)
+
+
+def make_repo(path: Path, spec: FleetSpec, seed: int) -> None:
+    """Make one bare repo at path with git fast-import."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        ["git", "init", "--quiet", "--bare", "--initial-branch=master", str(path)],
+        check=True,
+    )
+    subprocess.run(
+        ["git", "fast-import", "--quiet"],
+        cwd=path,
+        input=fast_import_stream(spec, seed),
+        check=True,
+    )
+
+
+def generate_fleet(root: str | Path, spec: FleetSpec, jobs: int = 1) -> list[str]:
+    """Make every repo in the fleet under root, jobs at a time, returning the paths."""
+    paths = repo_paths(root, spec)
+
+    def make(num: int) -> str:
+        make_repo(paths[num], spec, seed=spec.seed * 100_003 + num)
+        return str(paths[num])
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        made = list(executor.map(make, range(spec.repos)))
+    logger.info(f"Generated {len(made)} repos under {root}")
+    return made
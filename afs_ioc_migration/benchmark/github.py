@@ -0,0 +1,141 @@
+import logging
+import subprocess
+import threading
+from pathlib import Path
+
+from fastcore.net import HTTP4xxClientError, HTTP404NotFoundError
+
+logger = logging.getLogger(__name__)
+
+
+class LocalRepos:
+    """The few repos api calls we make, answered from bare repos on disk."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.topics: dict[str, list[str]] = {}
+        self.properties: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def path(self, org: str, name: str) -> Path:
+        return self.root / org / f"{name}.git"
+
+    def create_in_org(self, org: str, name: str, **kwargs) -> dict:
+        path = self.path(org, name)
+        if path.exists():
+            raise HTTP4xxClientError(str(path), 422, "Unprocessable Entity", {}, None)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run(["git", "init", "--quiet", "--bare", str(path)], check=True)
+        with self._lock:
+            self.properties[f"{org}/{name}"] = dict(
+                kwargs.get("custom_properties") or {}
+            )
+        return {"name": name, "full_name": f"{org}/{name}"}
+
+    def replace_all_topics(self, owner: str, repo: str, names: list[str]) -> dict:
+        with self._lock:
+            self.topics[f"{owner}/{repo}"] = list(names)
+        return {"names": names}
+
+    def _page(self, org: str, per_page: int, page: int) -> list[Path]:
+        paths = sorted((self.root / org).glob("*.git"))
+        return paths[(page - 1) * per_page : page * per_page]
+
+    def list_for_org(self, org: str, per_page: int = 30, page: int = 1) -> list[dict]:
+        """One page of the org's repos, with the fields OrgRepo.from_api reads."""
+        listing = []
+        for path in self._page(org, per_page, page):
+            name = path.name.removesuffix(".git")
+            has_commits = bool(self._commits(path))
+            with self._lock:
+                topics = self.topics.get(f"{org}/{name}", [])
+            listing.append(
+                {
+                    "name": name,
+                    "size": 1 if has_commits else 0,
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "pushed_at": "2024-01-02T00:00:00Z" if has_commits else None,
+                    "topics": topics,
+                }
+            )
+        return listing
+
+    def custom_properties_for_repos_get_organization_values(
+        self, org: str, per_page: int = 30, page: int = 1
+    ) -> list[dict]:
+        """One page of the custom property values of the org's repos."""
+        listing = []
+        for path in self._page(org, per_page, page):
+            name = path.name.removesuffix(".git")
+            with self._lock:
+                properties = self.properties.get(f"{org}/{name}", {})
+            listing.append(
+                {
+                    "repository_name": name,
+                    "repository_full_name": f"{org}/{name}",
+                    "properties": [
+                        {"property_name": key, "value": value}
+                        for key, value in properties.items()
+                    ],
+                }
+            )
+        return listing
+
+    def _commits(self, path: Path) -> list[str]:
+        return subprocess.run(
+            ["git", "log", "--all", "--max-count=30", "--format=%H"],
+            cwd=path,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+
+    def list_commits(
+        self, owner: str, repo: str, sha: str = "", per_page: int = 30
+    ) -> list[dict]:
+        """The newest commits from sha, or from every ref, with their parents."""
+        path = self.path(owner, repo)
+        if not path.exists():
+            raise HTTP404NotFoundError(str(path), {}, None)
+        log = subprocess.run(
+            [
+                "git",
+                "log",
+                f"--max-count={per_page}",
+                "--format=%H%x00%P%x00%s",
+                sha or "--all",
+            ],
+            cwd=path,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()
+        if not log:
+            # What github says about a repo without commits
+            raise HTTP4xxClientError(str(path), 409, "Conflict", {}, None)
+        commits = []
+        for line in log:
+            commit, parents, subject = line.split("\0")
+            commits.append(
+                {
+                    "sha": commit,
+                    "commit": {"message": subject},
+                    "parents": [{"sha": parent} for parent in parents.split()],
+                }
+            )
+        return commits
+
+
+class LocalGitHub:
+    """
+    Stands in for the github api with bare repos under root/<org>/<name>.git.
+
+    Pass it as gh and push_url_template to migrate_repo to run a real,
+    non-dry-run migration without touching the network.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.repos = LocalRepos(self.root)
+
+    @property
+    def push_url_template(self) -> str:
+        return str(self.root / "{org}" / "{name}.git")
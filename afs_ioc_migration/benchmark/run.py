@@ -0,0 +1,249 @@
+import contextlib
+import dataclasses
+import json
+import logging
+import shutil
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, TextIO
+
+from ..schedule import estimate_cost
+from ..timing import SpanRecorder
+from ..transfer import prepare_repo, publish_repo
+from .fleet import FleetSpec
+from .github import LocalGitHub
+from .server import FakeGitHub, Faults
+
+logger = logging.getLogger(__name__)
+
+# Which migration we time
+DRY_RUN = "dry-run"
+LOCAL = "local"
+SERVER = "server"
+MODES = (DRY_RUN, LOCAL, SERVER)
+
+# Higher is better for these, lower is better for everything else
+_THROUGHPUT = ("repos_per_minute", "megabytes_per_second")
+# Stage times shorter than this are mostly noise and never compared
+_MIN_SECONDS = 0.01
+
+
+@dataclasses.dataclass
+class RepoTiming:
+    """How long each stage of one repo's migration took, in seconds."""
+
+    afs_path: str
+    size: int = 0
+    prepare: float = 0.0
+    publish: float = 0.0
+    error: str = ""
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """The timings of one benchmark run over a whole fleet."""
+
+    mode: str
+    spec: dict
+    jobs: int
+    checkout: bool
+    seconds: float
+    repos: list[RepoTiming]
+    # The span summary of every finer stage, see timing.SpanRecorder
+    spans: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for repo in self.repos if repo.error)
+
+    @property
+    def megabytes(self) -> float:
+        return sum(repo.size for repo in self.repos) / 1024**2
+
+    @property
+    def repos_per_minute(self) -> float:
+        return 60 * len(self.repos) / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.megabytes / self.seconds if self.seconds else 0.0
+
+    def stage_stats(self) -> dict[str, dict[str, float]]:
+        """Mean, median and max seconds per repo for each stage."""
+        stats = {}
+        for stage in ("prepare", "publish"):
+            times = [getattr(repo, stage) for repo in self.repos if not repo.error]
+            if times:
+                stats[stage] = {
+                    "mean": statistics.mean(times),
+                    "median": statistics.median(times),
+                    "max": max(times),
+                }
+        return stats
+
+    def metrics(self) -> dict[str, float]:
+        """The flat numbers we save in baselines and compare between runs."""
+        metrics = {
+            "repos_per_minute": self.repos_per_minute,
+            "megabytes_per_second": self.megabytes_per_second,
+        }
+        for stage, stats in self.stage_stats().items():
+            metrics[f"{stage}_mean_seconds"] = stats["mean"]
+        return metrics
+
+    def to_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "spec": self.spec,
+            "jobs": self.jobs,
+            "checkout": self.checkout,
+            "seconds": self.seconds,
+            "failed": self.failed,
+            "megabytes": self.megabytes,
+            "metrics": self.metrics(),
+            "stages": self.stage_stats(),
+            "spans": self.spans,
+            "repos": [dataclasses.asdict(repo) for repo in self.repos],
+        }
+
+
+def run_benchmark(
+    paths: Iterable[str],
+    mode: str,
+    workdir: str | Path,
+    spec: FleetSpec | None = None,
+    org: str = "pcdshub",
+    jobs: int = 1,
+    checkout: bool = True,
+    faults: Faults | None = None,
+) -> BenchmarkResult:
+    """
+    Migrate every repo in paths and time it, jobs repos at a time.
+
+    Each repo goes through prepare_repo and publish_repo, the two stages
+    of migrate_repo, so that we can time them separately, and the finer
+    stages inside them are recorded as spans. Nothing touches github.
+
+    In DRY_RUN mode nothing is created or pushed and the clones are
+    deleted as soon as they are timed. In LOCAL mode each repo is
+    created and pushed to a bare repo under workdir by a LocalGitHub,
+    and the afs repos are locked like a real migration would. SERVER
+    mode is the same, but the api calls go over http to a FakeGitHub
+    that adds the latency and errors in faults.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown benchmark mode {mode}, expected one of {MODES}")
+    workdir = Path(workdir)
+    dry_run_dir = workdir / "dry_run"
+    recorder = SpanRecorder()
+    with contextlib.ExitStack() as stack:
+        if mode == SERVER:
+            server = stack.enter_context(FakeGitHub(workdir / "github", faults))
+            github_kwargs = {
+                "api_url": server.url,
+                "push_url_template": server.push_url_template,
+            }
+        else:
+            local = LocalGitHub(workdir / "github")
+            github_kwargs = {
+                "gh": local,
+                "push_url_template": local.push_url_template,
+            }
+        start = time.perf_counter()
+        timings = _migrate_all(
+            paths,
+            jobs=jobs,
+            org=org,
+            dry_run=mode == DRY_RUN,
+            dry_run_dir=str(dry_run_dir),
+            checkout=checkout,
+            recorder=recorder,
+            **github_kwargs,
+        )
+        seconds = time.perf_counter() - start
+    return BenchmarkResult(
+        mode=mode,
+        # Lists rather than tuples, to compare equal to a saved baseline
+        spec={**dataclasses.asdict(spec), "areas": list(spec.areas)} if spec else {},
+        jobs=jobs,
+        checkout=checkout,
+        seconds=seconds,
+        repos=timings,
+        spans=recorder.summary()["stages"],
+    )
+
+
+def _migrate_all(
+    paths: Iterable[str], jobs: int, dry_run: bool, **prepare_kwargs
+) -> list[RepoTiming]:
+    """Migrate every repo, jobs at a time, timing prepare and publish."""
+
+    def migrate(afs_path: str) -> RepoTiming:
+        timing = RepoTiming(afs_path=afs_path, size=estimate_cost(afs_path).size)
+        start = time.perf_counter()
+        try:
+            prepared = prepare_repo(
+                afs_path=afs_path, dry_run=dry_run, **prepare_kwargs
+            )
+            timing.prepare = time.perf_counter() - start
+            start = time.perf_counter()
+            path = publish_repo(prepared)
+            timing.publish = time.perf_counter() - start
+        except Exception as exc:
+            logger.error(f"Benchmark failed to migrate {afs_path}", exc_info=exc)
+            timing.error = repr(exc)
+            return timing
+        if dry_run:
+            shutil.rmtree(path, ignore_errors=True)
+        return timing
+
+    logger.info(f"Benchmarking migrations with {jobs} jobs")
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return list(executor.map(migrate, paths))
+
+
+def write_results(results: list[BenchmarkResult], fd: TextIO) -> None:
+    """Write the results as json, in the format read_baseline expects."""
+    json.dump({"results": [result.to_dict() for result in results]}, fd, indent=2)
+    fd.write("\n")
+
+
+def read_baseline(path: str) -> dict[str, dict]:
+    """Load results written by write_results, keyed by mode."""
+    with open(path, "r") as fd:
+        data = json.load(fd)
+    return {result["mode"]: result for result in data["results"]}
+
+
+def compare(result: BenchmarkResult, baseline: dict) -> dict[str, dict[str, float]]:
+    """
+    Compare a result with the baseline for the same mode.
+
+    For each metric, change is the fractional change from the baseline,
+    and regression is how much worse it got, which is negative if it
+    improved. Throughput regresses when it drops, and stage times
+    regress when they grow.
+    """
+    for key in ("spec", "jobs", "checkout"):
+        if baseline.get(key) != getattr(result, key):
+            logger.warning(
+                f"The {result.mode} baseline used a different {key}: "
+                f"{baseline.get(key)} instead of {getattr(result, key)}"
+            )
+    comparison = {}
+    for metric, current in result.metrics().items():
+        before = baseline["metrics"].get(metric)
+        if not before:
+            continue
+        if metric not in _THROUGHPUT and max(before, current) < _MIN_SECONDS:
+            continue
+        change = (current - before) / before
+        comparison[metric] = {
+            "baseline": before,
+            "current": current,
+            "change": change,
+            "regression": -change if metric in _THROUGHPUT else change,
+        }
+    return comparison
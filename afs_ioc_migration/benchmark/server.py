@@ -0,0 +1,324 @@
+import argparse
+import collections
+import dataclasses
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from fastcore.net import HTTP4xxClientError
+
+from .github import LocalRepos
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Faults:
+    """How badly the fake github should behave."""
+
+    # Seconds added to every response, plus up to jitter more at random
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Fractions of requests answered with an error instead
+    conflict_rate: float = 0.0
+    server_error_rate: float = 0.0
+    secondary_rate: float = 0.0
+    # Seconds a secondary rate limit asks us to wait in Retry-After
+    retry_after: int = 1
+    # The primary rate limit: requests allowed per window of seconds
+    rate_limit: int = 5000
+    rate_window: float = 3600.0
+    seed: int | None = None
+
+
+class FakeGitHub:
+    """
+    A local http server that answers the github api calls we make.
+
+    Repos are bare repos under root/<org>/<name>.git, the same layout as
+    LocalGitHub, so migrations push to push_url_template on disk.
+    Every response carries the X-RateLimit headers, and faults adds
+    latency and errors to see how a migration copes with them.
+    counts records how often each route answered with each status.
+
+    Use it as a context manager, or call start and stop.
+    """
+
+    # method, path regex, handler method name
+    routes = (
+        ("GET", re.compile(r"/repos/([^/]+)/([^/]+)/commits"), "_list_commits"),
+        ("PUT", re.compile(r"/repos/([^/]+)/([^/]+)/topics"), "_replace_all_topics"),
+        ("POST", re.compile(r"/orgs/([^/]+)/repos"), "_create_in_org"),
+        ("GET", re.compile(r"/orgs/([^/]+)/repos"), "_list_for_org"),
+        (
+            "GET",
+            re.compile(r"/orgs/([^/]+)/properties/values"),
+            "_custom_properties_for_repos_get_organization_values",
+        ),
+    )
+
+    def __init__(
+        self,
+        root: str | Path,
+        faults: Faults | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.root = Path(root)
+        self.repos = LocalRepos(self.root)
+        self.faults = faults if faults is not None else Faults()
+        self.counts: collections.Counter = collections.Counter()
+        self._random = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._used = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def push_url_template(self) -> str:
+        return str(self.root / "{org}" / "{name}.git")
+
+    def start(self) -> "FakeGitHub":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-github", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Fake github listening on {self.url}, storing repos in {self.root}"
+        )
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeGitHub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _rate_limit(self) -> tuple[dict[str, str], bool]:
+        """Spend one request from the budget, returning the headers and if it's over."""
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.faults.rate_window:
+                self._window_start = now
+                self._used = 0
+            self._used += 1
+            used = self._used
+            reset = int(self._window_start + self.faults.rate_window)
+        headers = {
+            "X-RateLimit-Limit": str(self.faults.rate_limit),
+            "X-RateLimit-Remaining": str(max(self.faults.rate_limit - used, 0)),
+            "X-RateLimit-Reset": str(reset),
+            "X-RateLimit-Used": str(min(used, self.faults.rate_limit)),
+            "X-RateLimit-Resource": "core",
+        }
+        return headers, used > self.faults.rate_limit
+
+    def _injected_fault(self) -> tuple[int, dict[str, str], str] | None:
+        """Maybe pick an error to answer with instead of the real response."""
+        with self._lock:
+            roll = self._random.random()
+            delay = self.faults.latency + self._random.random() * self.faults.jitter
+        time.sleep(delay)
+        for rate, fault in (
+            (self.faults.conflict_rate, (409, {}, "Conflict")),
+            (self.faults.server_error_rate, (502, {}, "Server Error")),
+            (
+                self.faults.secondary_rate,
+                (
+                    403,
+                    {"Retry-After": str(self.faults.retry_after)},
+                    "You have exceeded a secondary rate limit.",
+                ),
+            ),
+        ):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def handle(
+        self, method: str, url: str, body: bytes
+    ) -> tuple[int, dict[str, str], object]:
+        """Answer one request, returning the status, extra headers and json body."""
+        parsed = urlparse(url)
+        for route_method, regex, name in self.routes:
+            match = regex.fullmatch(parsed.path.rstrip("/"))
+            if route_method == method and match:
+                break
+        else:
+            return 404, {}, {"message": "Not Found"}
+        headers, over_limit = self._rate_limit()
+        if over_limit:
+            status, result = 403, {"message": "API rate limit exceeded"}
+        elif (fault := self._injected_fault()) is not None:
+            status, extra, message = fault
+            headers.update(extra)
+            result = {"message": message}
+        else:
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            data = json.loads(body) if body else {}
+            try:
+                status, result = getattr(self, name)(*match.groups(), query, data)
+            except HTTP4xxClientError as exc:
+                status, result = exc.code, {"message": exc.msg}
+        with self._lock:
+            self.counts[(name.removeprefix("_"), status)] += 1
+        return status, headers, result
+
+    def _list_commits(self, owner: str, repo: str, query: dict, data: dict):
+        return 200, self.repos.list_commits(
+            owner,
+            repo,
+            sha=query.get("sha", ""),
+            per_page=int(query.get("per_page", 30)),
+        )
+
+    def _replace_all_topics(self, owner: str, repo: str, query: dict, data: dict):
+        if not self.repos.path(owner, repo).exists():
+            return 404, {"message": "Not Found"}
+        return 200, self.repos.replace_all_topics(owner, repo, data.get("names", []))
+
+    def _create_in_org(self, org: str, query: dict, data: dict):
+        return 201, self.repos.create_in_org(org, **data)
+
+    def _list_for_org(self, org: str, query: dict, data: dict):
+        return 200, self.repos.list_for_org(
+            org,
+            per_page=int(query.get("per_page", 30)),
+            page=int(query.get("page", 1)),
+        )
+
+    def _custom_properties_for_repos_get_organization_values(
+        self, org: str, query: dict, data: dict
+    ):
+        return 200, self.repos.custom_properties_for_repos_get_organization_values(
+            org,
+            per_page=int(query.get("per_page", 30)),
+            page=int(query.get("page", 1)),
+        )
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, headers, result = fake.handle(self.command, self.path, body)
+                payload = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format % args)
+
+        return Handler
+
+
+parser = argparse.ArgumentParser(
+    "afs_ioc_migration.benchmark.server",
+    description="Serve a fake github api for load testing. Point migrate at it with --api-url and push to --push-url-template.",
+)
+parser.add_argument("root", help="Where to store the pushed repos.")
+parser.add_argument("--host", default="127.0.0.1", help="Default: 127.0.0.1")
+parser.add_argument("--port", type=int, default=8000, help="Default: 8000")
+parser.add_argument(
+    "--latency", type=float, default=0.0, help="Seconds to wait before each response."
+)
+parser.add_argument(
+    "--jitter", type=float, default=0.0, help="Up to this many more seconds, at random."
+)
+parser.add_argument(
+    "--conflict-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of requests to answer with 409.",
+)
+parser.add_argument(
+    "--server-error-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of requests to answer with 502.",
+)
+parser.add_argument(
+    "--secondary-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of requests to reject with a secondary rate limit.",
+)
+parser.add_argument(
+    "--retry-after",
+    type=int,
+    default=1,
+    help="Seconds secondary rate limits ask clients to wait.",
+)
+parser.add_argument(
+    "--rate-limit",
+    type=int,
+    default=5000,
+    help="Requests allowed per --rate-window before answering 403.",
+)
+parser.add_argument(
+    "--rate-window", type=float, default=3600.0, help="Seconds. Default: 3600"
+)
+parser.add_argument("--seed", type=int, default=None, help="Seed for the faults.")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeGitHub(
+        root=args.root,
+        host=args.host,
+        port=args.port,
+        faults=Faults(
+            latency=args.latency,
+            jitter=args.jitter,
+            conflict_rate=args.conflict_rate,
+            server_error_rate=args.server_error_rate,
+            secondary_rate=args.secondary_rate,
+            retry_after=args.retry_after,
+            rate_limit=args.rate_limit,
+            rate_window=args.rate_window,
+            seed=args.seed,
+        ),
+    )
+    logger.info(
+        f"Use --api-url {fake.url} --push-url-template {fake.push_url_template}"
+    )
+    try:
+        fake.start()
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+        logger.info(f"Requests served: {dict(fake.counts)}")
@@ -0,0 +1,97 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def mirror_path(cache_dir: str, afs_path: str) -> Path:
+    """
+    Where the local mirror of an afs repo lives inside cache_dir.
+
+    The name keeps the repo's own name for readability and adds a hash of
+    the full absolute path so that repos with the same name can't clash.
+    """
+    abs_path = os.path.abspath(afs_path)
+    digest = hashlib.sha1(abs_path.encode()).hexdigest()[:12]
+    name = Path(abs_path).name.removesuffix(".git")
+    return Path(cache_dir).resolve() / f"{name}-{digest}.git"
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on path's lockfile so only one of us updates it."""
+    lock_path = path.with_name(path.name + ".lock")
+    with lock_path.open("w") as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def update_mirror(afs_path: str, cache_dir: str) -> str:
+    """
+    Create or refresh the local mirror of an afs repo and return its path.
+
+    The first time, this is a full mirror clone from afs.
+    Afterwards, only new objects are fetched, refs that were deleted on
+    afs are pruned, and HEAD is pointed at the same branch as afs.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    mirror = mirror_path(cache_dir=cache_dir, afs_path=afs_path)
+    with _locked(mirror):
+        if (mirror / "HEAD").is_file():
+            logger.info(f"Refreshing cached mirror {mirror}")
+            subprocess.run(
+                ["git", "fetch", "--prune", "--quiet", "origin"],
+                cwd=mirror,
+                check=True,
+            )
+            head = subprocess.run(
+                ["git", "symbolic-ref", "-q", "HEAD"],
+                cwd=afs_path,
+                capture_output=True,
+                universal_newlines=True,
+            ).stdout.strip()
+            if head:
+                subprocess.run(
+                    ["git", "symbolic-ref", "HEAD", head], cwd=mirror, check=True
+                )
+        else:
+            logger.info(f"Creating cached mirror of {afs_path} at {mirror}")
+            # Clone next to the final location so a failed clone is never used
+            partial = mirror.with_name(mirror.name + ".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            subprocess.run(
+                [
+                    "git",
+                    "clone",
+                    "--mirror",
+                    "--quiet",
+                    os.path.abspath(afs_path),
+                    str(partial),
+                ],
+                check=True,
+            )
+            partial.rename(mirror)
+    return str(mirror)
+
+
+def use_alternates(repo_path: str, mirror: str) -> None:
+    """
+    Let a repo borrow objects from the mirror instead of copying them.
+
+    repo_path is a non-bare repo with a .git directory.
+    After this, fetching from the mirror transfers almost nothing.
+    """
+    info_dir = Path(repo_path) / ".git" / "objects" / "info"
+    info_dir.mkdir(parents=True, exist_ok=True)
+    with (info_dir / "alternates").open("a") as fd:
+        fd.write(str(Path(mirror) / "objects") + "\n")
@@ -0,0 +1,18 @@
+# Settings the command line needs for its defaults and choices. They live
+# here, with no imports, so that building the parser doesn't import the
+# modules that use them.
+
+# Where dry runs leave their output
+DRY_RUN_DIR = "dry_run_transfer"
+
+# What a dry run leaves behind for each repo
+CLONE = "clone"
+SUMMARY = "summary"
+BUNDLE = "bundle"
+OUTPUTS = (CLONE, SUMMARY, BUNDLE)
+
+# How long a coordinator's lease lasts without a heartbeat, in seconds
+LEASE_TTL = 120.0
+
+# GitHub rejects any push that contains a blob larger than this
+MAX_BLOB_SIZE = 100 * 1024**2
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .constants import LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+# The shared list of repos that every worker works from
+WORK_LIST = "work.json"
+
+
+class LeaseLostError(RuntimeError): ...
+
+
+def repo_key(afs_path: str) -> str:
+    """A file name for an afs path that is unique and still readable."""
+    digest = hashlib.sha1(afs_path.encode()).hexdigest()[:12]
+    return f"{os.path.basename(afs_path.rstrip('/'))}-{digest}"
+
+
+class Coordinator:
+    """
+    Share one migration between workers, on one host or many.
+
+    Every worker points at the same directory on a shared filesystem.
+    The first one writes the work list there, and each worker then
+    claims repos from it by taking a lease, migrates them, and records
+    each finished repo so that no one ever starts it again.
+
+    A lease is a file named leases/<repo>/<generation>. Workers claim
+    the next generation with os.link, which is atomic even on NFS,
+    so only one of them can win. The holder keeps its leases alive by
+    touching them from a heartbeat thread. A lease that hasn't been
+    touched for ttl seconds belongs to a dead worker, and the next
+    generation can be claimed by anyone. A holder that finds a newer
+    generation than its own has lost the repo and must not publish it.
+    Generations are never reused, so a lost lease stays lost.
+
+    Lease ages are measured with the shared filesystem's clock, by
+    touching this worker's own file under workers/, not the local clock,
+    so hosts with skewed clocks agree on which leases expired. ttl must
+    still be much longer than any pause of a live worker, such as a slow
+    afs fetch that holds up the whole process.
+
+    Finished repos are recorded in done/<repo>.json, ok or not, and are
+    never claimed again. Remove a failed repo's record, or use a new
+    directory, to try it again.
+    """
+
+    def __init__(self, root: str, worker: str = "", ttl: float = LEASE_TTL) -> None:
+        self.root = Path(root)
+        self.worker = worker or f"{os.uname().nodename}-{os.getpid()}"
+        self.ttl = ttl
+        for subdir in ("leases", "done", "workers", "tmp"):
+            (self.root / subdir).mkdir(parents=True, exist_ok=True)
+        # afs_path: generation, for every lease we hold
+        self._held: dict[str, int] = {}
+        self._lost: set[str] = set()
+        self._reclaimed: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def __enter__(self) -> "Coordinator":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start renewing our leases in the background."""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._heartbeat_worker, name="heartbeat", daemon=True
+            )
+            self._heartbeat.start()
+
+    def close(self) -> None:
+        """Stop the heartbeat and release every repo we didn't finish."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        with self._lock:
+            unfinished = list(self._held)
+        for afs_path in unfinished:
+            self.release(afs_path)
+
+    def share(self, paths: Iterable[str], org: str, dry_run: bool) -> list[str]:
+        """
+        Write the work list, or read the one another worker wrote.
+
+        The first worker's list wins, later workers may pass no paths at
+        all. Raises ValueError if the list is for another org or the other
+        kind of run, since the done records would not mean the same thing.
+        """
+        work_list = self.root / WORK_LIST
+        paths = [os.path.abspath(afs_path) for afs_path in paths]
+        if not work_list.exists():
+            if not paths:
+                raise ValueError(f"There is no work list in {self.root} yet.")
+            data = {"org": org, "dry_run": dry_run, "repos": paths}
+            if self._create(work_list, json.dumps(data, indent=2) + "\n"):
+                logger.info(f"Shared a work list of {len(paths)} repos in {self.root}")
+                return paths
+        data = json.loads(work_list.read_text())
+        if data["org"] != org or data["dry_run"] != dry_run:
+            raise ValueError(
+                f"The work list in {self.root} is for org={data['org']} with "
+                f"dry_run={data['dry_run']}, not org={org} with dry_run={dry_run}."
+            )
+        if paths and paths != data["repos"]:
+            logger.warning(
+                f"Using the work list of {len(data['repos'])} repos already in "
+                f"{self.root}, not the {len(paths)} repos given."
+            )
+        return data["repos"]
+
+    def claims(
+        self, paths: list[str], stop: threading.Event | None = None
+    ) -> Iterator[str]:
+        """
+        Claim and yield repos from the work list until none are left.
+
+        Claims happen one at a time as the caller asks for more, so a
+        worker never holds leases on more repos than it is working on.
+        Once every remaining repo is leased by someone else, we wait,
+        and reclaim any whose leases expire, until they are all done
+        or stop is set.
+        """
+        pending = list(paths)
+        while pending:
+            waiting = []
+            for afs_path in pending:
+                if self.is_done(afs_path):
+                    continue
+                with self._lock:
+                    mine = afs_path in self._held
+                if mine:
+                    continue
+                if self.claim(afs_path):
+                    yield afs_path
+                else:
+                    waiting.append(afs_path)
+            pending = waiting
+            if pending and self._wait(self.ttl / 4, stop):
+                return
+
+    def claim(self, afs_path: str) -> bool:
+        """Try to take the lease on a repo, returning True if we got it."""
+        if self.is_done(afs_path):
+            return False
+        lease_dir = self.root / "leases" / repo_key(afs_path)
+        lease_dir.mkdir(exist_ok=True)
+        generation = self._generation(lease_dir)
+        previous = lease_dir / str(generation)
+        if generation:
+            try:
+                age = self._now() - previous.stat().st_mtime
+            except FileNotFoundError:
+                return False
+            if age < self.ttl:
+                return False
+        content = json.dumps({"worker": self.worker, "afs_path": afs_path})
+        if not self._create(lease_dir / str(generation + 1), content):
+            # Someone else got there first
+            return False
+        if self.is_done(afs_path):
+            # Finished between our first look and our claim
+            os.utime(lease_dir / str(generation + 1), (0, 0))
+            return False
+        with self._lock:
+            self._held[afs_path] = generation + 1
+            self._lost.discard(afs_path)
+        if generation:
+            owner = self._read_worker(previous)
+            logger.warning(f"Reclaimed {afs_path} from {owner}, its lease expired")
+            with self._lock:
+                self._reclaimed.add(afs_path)
+        return True
+
+    def held(self, afs_path: str) -> bool:
+        """
+        Check that we still hold the lease on a repo, right now.
+
+        This is what keeps a worker that lost a repo, e.g. after a long
+        pause, from publishing it after someone else reclaimed it.
+        """
+        with self._lock:
+            generation = self._held.get(afs_path)
+            if generation is None or afs_path in self._lost:
+                return False
+        lease_dir = self.root / "leases" / repo_key(afs_path)
+        try:
+            age = self._now() - (lease_dir / str(generation)).stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return age < self.ttl and not (lease_dir / str(generation + 1)).exists()
+
+    def reclaimed(self, afs_path: str) -> bool:
+        """True if we took this repo over from a worker that died."""
+        with self._lock:
+            return afs_path in self._reclaimed
+
+    def is_done(self, afs_path: str) -> bool:
+        return (self.root / "done" / f"{repo_key(afs_path)}.json").exists()
+
+    def finish(self, afs_path: str, ok: bool, error: str = "") -> None:
+        """Record that we are done with a repo, ok or not, and let the lease go."""
+        if not self.held(afs_path):
+            logger.error(
+                f"Lost the lease on {afs_path} before it finished, "
+                "leaving it to whoever reclaimed it"
+            )
+            self._forget(afs_path)
+            return
+        record = json.dumps({"worker": self.worker, "ok": ok, "error": error})
+        if not self._create(
+            self.root / "done" / f"{repo_key(afs_path)}.json", record + "\n"
+        ):
+            logger.error(f"{afs_path} was already recorded as done")
+        self.release(afs_path)
+
+    def release(self, afs_path: str) -> None:
+        """Give up a lease without finishing, so another worker can claim it."""
+        with self._lock:
+            generation = self._held.get(afs_path)
+            lost = afs_path in self._lost
+        if generation is None:
+            return
+        if not lost:
+            lease = self.root / "leases" / repo_key(afs_path) / str(generation)
+            try:
+                # Expired right away, but kept so the generation isn't reused
+                os.utime(lease, (0, 0))
+            except FileNotFoundError:
+                pass
+        self._forget(afs_path)
+
+    def status(self, paths: list[str]) -> dict[str, int]:
+        """Count the repos in the work list that are ok, failed, leased or pending."""
+        counts = {"ok": 0, "failed": 0, "leased": 0, "pending": 0}
+        now = self._now()
+        for afs_path in paths:
+            done = self.root / "done" / f"{repo_key(afs_path)}.json"
+            lease_dir = self.root / "leases" / repo_key(afs_path)
+            if done.exists():
+                ok = json.loads(done.read_text())["ok"]
+                counts["ok" if ok else "failed"] += 1
+            elif lease_dir.is_dir() and (generation := self._generation(lease_dir)):
+                try:
+                    age = now - (lease_dir / str(generation)).stat().st_mtime
+                except FileNotFoundError:
+                    age = self.ttl
+                counts["leased" if age < self.ttl else "pending"] += 1
+            else:
+                counts["pending"] += 1
+        return counts
+
+    def _heartbeat_worker(self) -> None:
+        while not self._stop.wait(timeout=self.ttl / 3):
+            with self._lock:
+                held = dict(self._held)
+            for afs_path, generation in held.items():
+                lease_dir = self.root / "leases" / repo_key(afs_path)
+                try:
+                    if (lease_dir / str(generation + 1)).exists():
+                        raise FileNotFoundError
+                    os.utime(lease_dir / str(generation))
+                except FileNotFoundError:
+                    with self._lock:
+                        if afs_path in self._held and afs_path not in self._lost:
+                            logger.error(f"Lost the lease on {afs_path}")
+                            self._lost.add(afs_path)
+
+    def _wait(self, timeout: float, stop: threading.Event | None) -> bool:
+        """Sleep for timeout seconds, returning True early if we should stop."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._stop.is_set() or (stop is not None and stop.is_set()):
+                return True
+            time.sleep(min(0.1, timeout))
+        return False
+
+    def _forget(self, afs_path: str) -> None:
+        with self._lock:
+            self._held.pop(afs_path, None)
+            self._lost.discard(afs_path)
+            self._reclaimed.discard(afs_path)
+
+    def _now(self) -> float:
+        """The time on the shared filesystem, from touching our own file."""
+        beat = self.root / "workers" / self.worker
+        try:
+            os.utime(beat)
+        except FileNotFoundError:
+            beat.touch()
+        return beat.stat().st_mtime
+
+    def _create(self, path: Path, content: str) -> bool:
+        """Write a new file atomically, returning False if it already exists."""
+        tmp = self.root / "tmp" / f"{self.worker}-{os.urandom(8).hex()}"
+        tmp.write_text(content)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink()
+        return True
+
+    @staticmethod
+    def _generation(lease_dir: Path) -> int:
+        """The newest lease generation on a repo, 0 if it was never leased."""
+        return max((int(lease.name) for lease in lease_dir.iterdir()), default=0)
+
+    @staticmethod
+    def _read_worker(lease: Path) -> str:
+        try:
+            return json.loads(lease.read_text())["worker"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return "an unknown worker"
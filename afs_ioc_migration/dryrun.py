@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from .rename import RepoInfo
+
+logger = logging.getLogger(__name__)
+
+# Where the afs HEAD is in a prepared clone, our commits are on top of it
+AFS_HEAD = "refs/remotes/afs_remote/HEAD"
+
+
+def _git(repo_path: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=repo_path,
+        capture_output=True,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+
+
+def _has_ref(repo_path: str, ref: str) -> bool:
+    return (
+        subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", ref],
+            cwd=repo_path,
+            capture_output=True,
+        ).returncode
+        == 0
+    )
+
+
+def tree_stats(repo_path: str, treeish: str) -> dict:
+    """Count the files in a tree and find the largest, without a checkout."""
+    files = 0
+    total = 0
+    largest = ("", 0)
+    for line in _git(repo_path, "ls-tree", "-r", "-l", "-z", treeish).split("\0"):
+        if not line:
+            continue
+        meta, path = line.split("\t", 1)
+        size = meta.split()[3]
+        if size == "-":
+            # A submodule
+            continue
+        files += 1
+        total += int(size)
+        if int(size) > largest[1]:
+            largest = (path, int(size))
+    return {
+        "files": files,
+        "bytes": total,
+        "largest_file": largest[0],
+        "largest_file_bytes": largest[1],
+    }
+
+
+def write_summary(
+    repo_path: str,
+    info: RepoInfo,
+    dry_run_dir: str,
+    refs: dict[str, str] | None = None,
+    bundle: bool = False,
+) -> str:
+    """
+    Write what a prepared clone would push in a few small files.
+
+    In a new directory under dry_run_dir, this writes:
+
+    - summary.json: where the repo goes, the refs that would be pushed,
+      and stats about the tree of the new master.
+    - patches/: our new commits on master, from git format-patch.
+    - <name>.bundle, if bundle is True: the same commits as a git bundle
+      that needs only the afs repo to apply.
+
+    refs are the refs that would be pushed, by default every local branch
+    and tag. Returns the new directory.
+    """
+    out = Path(tempfile.mkdtemp(prefix=f"{info.name}_", dir=dry_run_dir))
+    if refs is None:
+        refs = {}
+        for line in _git(
+            repo_path,
+            "for-each-ref",
+            "--format=%(objectname) %(refname)",
+            "refs/heads",
+            "refs/tags",
+        ).splitlines():
+            sha, ref = line.split(" ", 1)
+            refs[ref] = sha
+    has_master = _has_ref(repo_path, "refs/heads/master")
+    new_commits = []
+    if has_master:
+        new_commits = _git(
+            repo_path, "rev-list", "--reverse", f"{AFS_HEAD}..refs/heads/master"
+        ).split()
+    if new_commits:
+        _git(
+            repo_path,
+            "format-patch",
+            "--quiet",
+            "-o",
+            str(out / "patches"),
+            f"{AFS_HEAD}..refs/heads/master",
+        )
+        if bundle:
+            _git(
+                repo_path,
+                "bundle",
+                "create",
+                "--quiet",
+                str(out / f"{info.name}.bundle"),
+                f"{AFS_HEAD}..refs/heads/master",
+            )
+    summary = {
+        "name": info.name,
+        "github_url": info.github_url,
+        "afs_source": info.afs_source,
+        "afs_head": _git(repo_path, "rev-parse", AFS_HEAD).strip(),
+        "new_commits": new_commits,
+        "refs": refs,
+        "tree": tree_stats(repo_path, "refs/heads/master" if has_master else AFS_HEAD),
+    }
+    with (out / "summary.json").open("w") as fd:
+        json.dump(summary, fd, indent=2)
+        fd.write("\n")
+    logger.info(f"Dry run: wrote a summary of {len(refs)} refs to {out}")
+    return str(out)
+
+
+def dir_size(path: str | Path) -> int:
+    """The bytes used by the files under path, not following links."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def is_output(path: Path) -> bool:
+    """
+    True if path is a dry run output we wrote, so it is safe to remove.
+
+    Outputs are named <repo name>_<random suffix>, and are either a
+    summary, with its summary.json, or a prepared clone, which has the
+    afs HEAD we fetched. Anything else, including hidden directories,
+    belongs to someone else.
+    """
+    if path.name.startswith(".") or "_" not in path.name:
+        return False
+    if path.is_symlink() or not path.is_dir():
+        return False
+    if (path / "summary.json").is_file():
+        return True
+    return (path / ".git").is_dir() and _has_ref(str(path), AFS_HEAD)
+
+
+def prune_outputs(
+    dry_run_dir: str, budget: int, keep: frozenset[str] = frozenset()
+) -> list[str]:
+    """
+    Remove the oldest dry run outputs until the rest fit in budget bytes.
+
+    Every output in dry_run_dir is one repo's clone or summary from some
+    run. Nothing else there is touched, or counted towards the budget,
+    see is_output. Outputs in keep, e.g. from the current run, are never
+    removed, even if they alone are over budget.
+    Returns the removed paths.
+    """
+    root = Path(dry_run_dir)
+    if not root.is_dir():
+        return []
+    keep = frozenset(str(Path(path).resolve()) for path in keep)
+    outputs = sorted(
+        (path for path in root.iterdir() if is_output(path)),
+        key=lambda path: path.stat().st_mtime,
+    )
+    sizes = {path: dir_size(path) for path in outputs}
+    total = sum(sizes.values())
+    removed = []
+    for path in outputs:
+        if total <= budget:
+            break
+        if str(path.resolve()) in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= sizes[path]
+        removed.append(str(path))
+    if removed:
+        logger.info(
+            f"Removed {len(removed)} old dry run outputs from {dry_run_dir}, "
+            f"{total / 1024**2:.1f} MB remain"
+        )
+    if total > budget:
+        logger.warning(
+            f"Dry run outputs in {dry_run_dir} use {total / 1024**2:.1f} MB, "
+            f"over the budget of {budget / 1024**2:.1f} MB"
+        )
+    return removed
@@ -0,0 +1,333 @@
+import asyncio
+import dataclasses
+import functools
+import http.client
+import json
+import logging
+import os
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode, urljoin, urlsplit
+
+from fastcore.net import ExceptionsHTTP, HTTP4xxClientError, HTTP5xxServerError
+
+from .ratelimit import RateLimiter, default_limiter
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.github.com"
+# Requests in flight at once, which is also the most connections we keep open
+MAX_IN_FLIGHT = 8
+# Redirects we follow, and how many in a row before we give up
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+@dataclasses.dataclass
+class Response:
+    status: int
+    reason: str
+    headers: http.client.HTTPMessage
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+class AsyncGitHub:
+    """
+    An asyncio client for the github api calls we make.
+
+    Each request runs on an http.client connection in a worker thread.
+    Connections are kept alive and reused between requests, and at most
+    max_in_flight requests are sent at once. Every request goes through
+    the shared RateLimiter, and rate limit rejections are retried up to
+    max_retries times after waiting as long as GitHub asked us to.
+    Redirects within the api server, which GitHub sends for renamed
+    and transferred repos, are followed like urllib would.
+
+    Errors mean the same as they do with GhApi: a 4xx response raises
+    the matching fastcore HTTP4xxClientError subclass, such as
+    HTTP404NotFoundError, a 5xx raises HTTP5xxServerError, and anything
+    else that isn't a success raises a plain urllib HTTPError.
+
+    Every method must run on the same event loop.
+    """
+
+    def __init__(
+        self,
+        api_url: str = "",
+        token: str | None = None,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        limiter: RateLimiter | None = None,
+        max_retries: int = 3,
+        timeout: float = 60.0,
+    ) -> None:
+        self.api_url = (api_url or API_URL).rstrip("/")
+        parts = urlsplit(self.api_url)
+        self._https = parts.scheme == "https"
+        self._netloc = parts.netloc
+        self._prefix = parts.path
+        token = token if token is not None else os.environ.get("GITHUB_TOKEN", "")
+        self.headers = {
+            "User-Agent": "afs_ioc_migration",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        }
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.limiter = limiter if limiter is not None else default_limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._in_flight = asyncio.Semaphore(max(max_in_flight, 1))
+        # One thread per request in flight, so none waits for a thread
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(max_in_flight, 1), thread_name_prefix="github-request"
+        )
+        self._idle: list[http.client.HTTPConnection] = []
+        self._idle_lock = threading.Lock()
+
+    def _connect(self) -> tuple[http.client.HTTPConnection, bool]:
+        """An idle connection if there is one, or a new one, and if it was idle."""
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop(), True
+        if self._https:
+            connection = http.client.HTTPSConnection(
+                self._netloc,
+                timeout=self.timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            connection = http.client.HTTPConnection(self._netloc, timeout=self.timeout)
+        return connection, False
+
+    def _exchange(
+        self,
+        connection: http.client.HTTPConnection,
+        verb: str,
+        target: str,
+        body: bytes,
+    ) -> Response:
+        connection.request(verb, target, body=body, headers=self.headers)
+        response = connection.getresponse()
+        return Response(
+            status=response.status,
+            reason=response.reason,
+            headers=response.headers,
+            body=response.read(),
+        )
+
+    def _send(self, verb: str, target: str, body: bytes) -> Response:
+        """Send on a pooled connection, retrying once if it went stale."""
+        connection, reused = self._connect()
+        try:
+            response = self._exchange(connection, verb, target, body)
+        except ConnectionError:
+            connection.close()
+            if not reused:
+                raise
+            # The server closed an idle connection, which is normal
+            connection, _ = self._connect()
+            try:
+                response = self._exchange(connection, verb, target, body)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+        if response.headers.get("Connection", "").lower() == "close":
+            connection.close()
+        else:
+            with self._idle_lock:
+                self._idle.append(connection)
+        return response
+
+    async def request(
+        self,
+        verb: str,
+        path: str,
+        query: dict | None = None,
+        data: dict | None = None,
+    ) -> Any:
+        """Call the api and return the decoded json response."""
+        target = self._prefix + path
+        if query:
+            target += "?" + urlencode(query)
+        body = json.dumps(data).encode() if data is not None else b""
+        attempt = 0
+        redirects = 0
+        while True:
+            url = f"{'https' if self._https else 'http'}://{self._netloc}{target}"
+            # The limiter blocks, so wait for it without blocking the loop
+            await asyncio.to_thread(self.limiter.acquire, verb)
+            async with self._in_flight:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._send, verb, target, body
+                )
+            if 200 <= response.status < 300:
+                self.limiter.update(response.headers)
+                return response.json()
+            if response.status in REDIRECTS:
+                self.limiter.update(response.headers)
+                location = urlsplit(urljoin(url, response.headers.get("Location", "")))
+                # Only to the same server, which is the one our token is for
+                if location.netloc == self._netloc and redirects < MAX_REDIRECTS:
+                    redirects += 1
+                    target = location.path + (
+                        f"?{location.query}" if location.query else ""
+                    )
+                    if response.status == 303 or (
+                        response.status in (301, 302) and verb != "GET"
+                    ):
+                        verb, body = "GET", b""
+                    logger.debug(f"Following a {response.status} redirect to {target}")
+                    continue
+                raise _http_error(url, response)
+            retry = self.limiter.update(response.headers, status=response.status)
+            if retry and attempt < self.max_retries:
+                attempt += 1
+                logger.warning(
+                    f"Rate limited on {verb} {path}, retry {attempt} of {self.max_retries}"
+                )
+                continue
+            raise _http_error(url, response)
+
+    async def list_commits(
+        self, owner: str, repo: str, sha: str = "", per_page: int = 1
+    ) -> list:
+        query = {"sha": sha, "per_page": per_page} if sha else {"per_page": per_page}
+        return await self.request(
+            "GET", f"/repos/{_q(owner)}/{_q(repo)}/commits", query
+        )
+
+    async def create_in_org(self, org: str, name: str, **data) -> dict:
+        return await self.request(
+            "POST", f"/orgs/{_q(org)}/repos", data={"name": name, **data}
+        )
+
+    async def replace_all_topics(self, owner: str, repo: str, names: list[str]) -> dict:
+        return await self.request(
+            "PUT", f"/repos/{_q(owner)}/{_q(repo)}/topics", data={"names": names}
+        )
+
+    async def list_for_org(self, org: str, per_page: int = 30, page: int = 1) -> list:
+        return await self.request(
+            "GET", f"/orgs/{_q(org)}/repos", {"per_page": per_page, "page": page}
+        )
+
+    async def custom_properties_for_repos_get_organization_values(
+        self, org: str, per_page: int = 30, page: int = 1
+    ) -> list:
+        return await self.request(
+            "GET",
+            f"/orgs/{_q(org)}/properties/values",
+            {"per_page": per_page, "page": page},
+        )
+
+    async def close(self) -> None:
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+        self._executor.shutdown(wait=False)
+
+
+def _q(part: str) -> str:
+    return quote(str(part), safe="")
+
+
+def _http_error(url: str, response: Response) -> HTTPError:
+    """The same exception GhApi would raise for this response."""
+    msg = f"{response.reason}\n====Error Body====\n{response.body.decode(errors='ignore')}"
+    if response.status in ExceptionsHTTP:
+        return ExceptionsHTTP[response.status](url, response.headers, None, msg=msg)
+    if 400 <= response.status < 500:
+        return HTTP4xxClientError(url, response.status, msg, response.headers, None)
+    if 500 <= response.status < 600:
+        return HTTP5xxServerError(url, response.status, msg, response.headers, None)
+    return HTTPError(url, response.status, msg, response.headers, None)
+
+
+class _Repos:
+    """The blocking gh.repos calls, with the same signatures as GhApi."""
+
+    def __init__(self, client: "GitHubClient") -> None:
+        self._client = client
+
+    def list_commits(
+        self, owner: str, repo: str, sha: str = "", per_page: int = 1
+    ) -> list:
+        return self._client.run(
+            self._client.aio.list_commits(owner, repo, sha=sha, per_page=per_page)
+        )
+
+    def create_in_org(self, org: str, name: str, **data) -> dict:
+        return self._client.run(self._client.aio.create_in_org(org, name, **data))
+
+    def replace_all_topics(self, owner: str, repo: str, names: list[str]) -> dict:
+        return self._client.run(self._client.aio.replace_all_topics(owner, repo, names))
+
+    def list_for_org(self, org: str, per_page: int = 30, page: int = 1) -> list:
+        return self._client.run(self._client.aio.list_for_org(org, per_page, page))
+
+
+class _Orgs:
+    """The blocking gh.orgs calls, with the same signatures as GhApi."""
+
+    def __init__(self, client: "GitHubClient") -> None:
+        self._client = client
+
+    def custom_properties_for_repos_get_organization_values(
+        self, org: str, per_page: int = 30, page: int = 1
+    ) -> list:
+        return self._client.run(
+            self._client.aio.custom_properties_for_repos_get_organization_values(
+                org, per_page, page
+            )
+        )
+
+
+class GitHubClient:
+    """
+    A blocking front end to an AsyncGitHub running in its own thread.
+
+    This can stand in for GhApi, so the migration's worker threads can
+    keep calling gh.repos.create_in_org and friends. Their requests all
+    run on one event loop and share one connection pool, so api calls
+    for many repos overlap while the git work carries on in the workers.
+    Coroutines that want to overlap many calls themselves can await
+    the aio client's methods through run.
+
+    Use get_client to share one per process.
+    """
+
+    def __init__(self, api_url: str = "", **kwargs) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="github-client", daemon=True
+        )
+        self._thread.start()
+        self.aio = AsyncGitHub(api_url=api_url, **kwargs)
+        self.repos = _Repos(self)
+        self.orgs = _Orgs(self)
+
+    def run(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the client's event loop and wait for the result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self) -> None:
+        self.run(self.aio.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+@functools.cache
+def get_client(api_url: str = "") -> GitHubClient:
+    """The one client per api server that every thread in the process shares."""
+    return GitHubClient(api_url=api_url)
@@ -0,0 +1,259 @@
+import dataclasses
+import logging
+import re
+import subprocess
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Git ignores trailing spaces unless they are escaped with a backslash
+_TRAILING_SPACES = re.compile(r"(?<!\\) +$")
+
+
+@dataclasses.dataclass(frozen=True)
+class Pattern:
+    """One gitignore pattern, parsed the way git reads it."""
+
+    # The pattern as it should be written back out, slashes and all
+    text: str
+    # The glob without any ! prefix or leading and trailing slashes
+    glob: str
+    negate: bool = False
+    dir_only: bool = False
+    anchored: bool = False
+
+    @classmethod
+    def parse(cls, line: str) -> "Pattern | None":
+        """Parse one gitignore line, returning None for blanks and comments."""
+        line = _TRAILING_SPACES.sub("", line)
+        if not line or line.startswith("#"):
+            return None
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith(("\\#", "\\!")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        glob = line.strip("/")
+        if not glob:
+            return None
+        # A slash anywhere but the end ties the pattern to the top directory
+        anchored = "/" in line.rstrip("/")
+        # **/name matches name at any depth, the same as a bare name
+        if glob.startswith("**/") and "/" not in glob[3:]:
+            glob = glob[3:]
+            anchored = False
+        text = line
+        if not negate and line.startswith(("#", "!")):
+            # Without the backslash, git would read a comment or a negation
+            text = "\\" + line
+        return cls(
+            text=("!" if negate else "") + text,
+            glob=glob,
+            negate=negate,
+            dir_only=dir_only,
+            anchored=anchored,
+        )
+
+    @property
+    def key(self) -> tuple[bool, str, bool, bool]:
+        """
+        Patterns with the same key are treated as the same rule when merging.
+
+        They match the same paths, e.g. foo and **/foo, or a/b and /a/b.
+        A leading or trailing slash changes what a pattern matches, so
+        /foo and foo/ each have a key of their own.
+        """
+        return (self.negate, self.glob, self.anchored, self.dir_only)
+
+    def to_regex(self) -> str:
+        """A regex that matches the full slash-separated paths this pattern does."""
+        body = _glob_to_regex(self.glob)
+        if self.anchored:
+            return body
+        return f"(?:.*/)?{body}"
+
+
+def _glob_to_regex(glob: str) -> str:
+    """Translate a gitignore glob, where * never matches a slash but ** can."""
+    out = []
+    pos = 0
+    while pos < len(glob):
+        char = glob[pos]
+        if glob.startswith("**/", pos) and (pos == 0 or glob[pos - 1] == "/"):
+            # Leading or middle **/ matches zero or more directories
+            out.append("(?:.*/)?")
+            pos += 3
+        elif glob.startswith("**", pos) and pos + 2 == len(glob) and pos > 0:
+            # Trailing /** matches everything inside
+            out.append(".+")
+            pos += 2
+        elif char == "*":
+            out.append("[^/]*")
+            pos += 1
+            while pos < len(glob) and glob[pos] == "*":
+                pos += 1
+        elif char == "?":
+            out.append("[^/]")
+            pos += 1
+        elif char == "[":
+            end = glob.find("]", pos + 2)
+            if end == -1:
+                out.append(re.escape(char))
+                pos += 1
+                continue
+            chars = glob[pos + 1 : end]
+            if chars[0] in "!^":
+                chars = "^" + chars[1:]
+            out.append("[" + chars.replace("\\", "\\\\") + "]")
+            pos = end + 1
+        elif char == "\\" and pos + 1 < len(glob):
+            out.append(re.escape(glob[pos + 1]))
+            pos += 2
+        else:
+            out.append(re.escape(char))
+            pos += 1
+    return "".join(out)
+
+
+def parse(lines: Iterable[str]) -> list[Pattern]:
+    return [pattern for line in lines if (pattern := Pattern.parse(line)) is not None]
+
+
+def merge(ours: list[str], theirs: Iterable[str]) -> list[str]:
+    """
+    Return our gitignore lines followed by any new rules from theirs.
+
+    Each rule is compared by its key in a set, so equivalent spellings
+    like foo and **/foo are only kept once, and repeated comments are
+    dropped. Blank lines from theirs are not kept.
+    """
+    seen_rules = {pattern.key for pattern in parse(ours)}
+    seen_comments = {line.strip() for line in ours if line.startswith("#")}
+    to_add = []
+    for line in theirs:
+        if line.startswith("#"):
+            if line.strip() not in seen_comments:
+                seen_comments.add(line.strip())
+                to_add.append(line.strip())
+            continue
+        pattern = Pattern.parse(line)
+        if pattern is None or pattern.key in seen_rules:
+            continue
+        seen_rules.add(pattern.key)
+        to_add.append(pattern.text)
+    merged = list(ours)
+    if to_add:
+        merged.append("")
+        merged.append("# From original afs gitignore")
+        merged.extend(to_add)
+    return merged
+
+
+class Matcher:
+    """
+    Answers whether paths are ignored by a list of gitignore lines.
+
+    Every pattern is compiled once. A single combined regex rejects the
+    many paths that no pattern matches before we look for the last
+    matching pattern, which is the one git obeys. Results for
+    directories are cached, so checking every path in a tree listing
+    costs about one regex search per path.
+    """
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        patterns = parse(lines)
+        self.rules = [
+            (re.compile(pattern.to_regex()), pattern) for pattern in reversed(patterns)
+        ]
+        self._any = {}
+        for is_dir in (False, True):
+            regexes = [
+                pattern.to_regex()
+                for pattern in patterns
+                if is_dir or not pattern.dir_only
+            ]
+            self._any[is_dir] = (
+                re.compile("|".join(f"(?:{regex})" for regex in regexes))
+                if regexes
+                else None
+            )
+        self._dirs: dict[str, bool] = {}
+
+    def _matches(self, path: str, is_dir: bool) -> bool:
+        combined = self._any[is_dir]
+        if combined is None or combined.fullmatch(path) is None:
+            return False
+        for regex, pattern in self.rules:
+            if pattern.dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not pattern.negate
+        return False
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        """
+        True if git would ignore this path.
+
+        Anything inside an ignored directory is ignored too,
+        no matter what later patterns say.
+        """
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            parent = "/".join(parts[:depth])
+            ignored = self._dirs.get(parent)
+            if ignored is None:
+                ignored = self._matches(parent, is_dir=True)
+                self._dirs[parent] = ignored
+            if ignored:
+                return True
+        return self._matches(path, is_dir=is_dir)
+
+
+def newly_ignored(paths: Iterable[str], old: list[str], new: list[str]) -> list[str]:
+    """Return the paths that the new gitignore ignores but the old one didn't."""
+    old_matcher = Matcher(old)
+    new_matcher = Matcher(new)
+    return [
+        path
+        for path in paths
+        if new_matcher.is_ignored(path) and not old_matcher.is_ignored(path)
+    ]
+
+
+def tracked_paths(repo_path: str, treeish: str = "HEAD") -> list[str]:
+    """
+    Every file path in a commit, from one recursive tree listing.
+
+    git allows any bytes in a file name. These paths are only used to
+    report what a gitignore hides, so names that aren't utf-8 get
+    replacement characters rather than stopping the migration.
+    """
+    output = subprocess.run(
+        ["git", "ls-tree", "-r", "-z", "--name-only", treeish],
+        cwd=repo_path,
+        capture_output=True,
+        check=True,
+    ).stdout
+    return [path.decode(errors="replace") for path in output.split(b"\0") if path]
+
+
+def report_newly_ignored(
+    repo_path: str, old: str, new: str, treeish: str = "HEAD"
+) -> list[str]:
+    """
+    Warn about tracked files in treeish that the new gitignore would hide.
+
+    Only the top level gitignore is considered.
+    Returns the newly ignored paths.
+    """
+    hidden = newly_ignored(
+        tracked_paths(repo_path, treeish), old.splitlines(), new.splitlines()
+    )
+    if hidden:
+        shown = ", ".join(hidden[:10])
+        more = f" and {len(hidden) - 10} more" if len(hidden) > 10 else ""
+        logger.warning(
+            f"The new gitignore ignores {len(hidden)} tracked files: {shown}{more}"
+        )
+    return hidden
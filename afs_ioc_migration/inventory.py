@@ -0,0 +1,113 @@
+import dataclasses
+import fnmatch
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, TextIO
+
+from .schedule import RepoCost, estimate_cost
+
+logger = logging.getLogger(__name__)
+
+
+def expand_paths(user_globs: Iterable[str]) -> Iterator[str]:
+    """Expand each user-provided glob, in order, into matching paths."""
+    for user_glob in user_globs:
+        yield from glob.glob(user_glob)
+
+
+def _list_dir(path: str) -> tuple[list[str], list[str]]:
+    """
+    List one directory, returning (repos, other subdirectories).
+
+    Any subdirectory named *.git is a repo, we never look inside it.
+    Hidden directories, such as a working copy's .git, are skipped.
+    Paths are built from the already resolved parent, so only symlinks
+    need to be resolved again.
+    """
+    repos = []
+    subdirs = []
+    try:
+        entries = list(os.scandir(path))
+    except OSError as exc:
+        logger.warning(f"Cannot list {path}: {exc}")
+        return repos, subdirs
+    for entry in entries:
+        if entry.name.startswith(".") or not entry.is_dir():
+            continue
+        child = entry.path
+        if entry.is_symlink():
+            child = os.path.realpath(child)
+        if entry.name.endswith(".git"):
+            repos.append(child)
+        else:
+            subdirs.append(child)
+    return repos, subdirs
+
+
+def scan(roots: Iterable[str], jobs: int = 1, max_depth: int = 3) -> list[RepoCost]:
+    """
+    Find every *.git repo under the roots and measure it.
+
+    Each level of the tree is listed with jobs directories at a time,
+    which hides most of afs's per-directory latency. Each root is
+    resolved once and every path below it is built from that.
+
+    The default max_depth covers ioc/area/name.git and ioc/area/sub/name.git
+    when given the ioc directory.
+    """
+    repos = []
+    level = [os.path.realpath(root) for root in roots]
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for _ in range(max_depth):
+            if not level:
+                break
+            next_level = []
+            for found, subdirs in executor.map(_list_dir, level):
+                repos.extend(found)
+                next_level.extend(subdirs)
+            level = next_level
+        costs = list(executor.map(estimate_cost, sorted(set(repos))))
+    logger.info(f"Found {len(costs)} repos")
+    return costs
+
+
+def write_manifest(costs: list[RepoCost], fd: TextIO) -> None:
+    """Write the repos found by scan as json."""
+    json.dump(
+        {
+            "created": time.time(),
+            "repos": [dataclasses.asdict(cost) for cost in costs],
+        },
+        fd,
+        indent=2,
+    )
+    fd.write("\n")
+
+
+def read_manifest(path: str) -> list[RepoCost]:
+    """Load the repos from a manifest written by write_manifest."""
+    with open(path, "r") as fd:
+        manifest = json.load(fd)
+    return [RepoCost(**repo) for repo in manifest["repos"]]
+
+
+def select(costs: list[RepoCost], patterns: Iterable[str]) -> list[RepoCost]:
+    """
+    Keep the manifest repos that match any of the glob patterns.
+
+    This matches against the recorded paths without touching afs.
+    Unlike a shell glob, * also matches across / here.
+    With no patterns, every repo is kept.
+    """
+    patterns = list(patterns)
+    if not patterns:
+        return costs
+    return [
+        cost
+        for cost in costs
+        if any(fnmatch.fnmatchcase(cost.afs_path, pattern) for pattern in patterns)
+    ]
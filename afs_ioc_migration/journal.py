@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The stages of a migration, in the order they are finished
+STAGES = ("locked", "prepared", "created", "topics", "pushed")
+# The stages that need to be redone if the afs refs change
+CONTENT_STAGES = ("prepared", "pushed")
+
+
+def journal_key(afs_path: str) -> str:
+    """
+    The key we use for an afs path in the journal.
+
+    This is just the absolute path as given, it is not resolved
+    because that would need to touch afs.
+    """
+    return os.path.abspath(afs_path)
+
+
+def ref_fingerprint(afs_path: str) -> str:
+    """
+    Summarize every ref in an afs repo as one short hash.
+
+    If anyone pushes to the afs repo, the fingerprint changes.
+    """
+    output = subprocess.check_output(
+        ["git", "for-each-ref", "--format=%(objectname) %(refname)"],
+        cwd=afs_path,
+    )
+    head = subprocess.run(
+        ["git", "symbolic-ref", "-q", "HEAD"],
+        cwd=afs_path,
+        capture_output=True,
+    ).stdout
+    return hashlib.sha1(head + b"\n" + output).hexdigest()
+
+
+class Journal:
+    """
+    A local sqlite record of which migration stages have finished.
+
+    Each stage is recorded as soon as it is done, together with the
+    fingerprint of the afs refs at the time. On a rerun, repos that were
+    fully pushed are skipped without touching afs or github, and repos
+    that were partially done skip the stages they already finished.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit: every stage is on disk as soon as it is marked
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "afs_path TEXT NOT NULL, "
+                "stage TEXT NOT NULL, "
+                "fingerprint TEXT NOT NULL, "
+                "finished_at REAL NOT NULL, "
+                "PRIMARY KEY (afs_path, stage))"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def finished(self, afs_path: str) -> dict[str, str]:
+        """Return a mapping of finished stage to fingerprint for this repo."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, fingerprint FROM stages WHERE afs_path = ?",
+                (journal_key(afs_path),),
+            ).fetchall()
+        return dict(rows)
+
+    def is_complete(self, afs_path: str, fingerprint: str | None = None) -> bool:
+        """
+        True if this repo was fully migrated in an earlier run.
+
+        If a fingerprint is given, the afs refs must also be the same
+        as they were when the repo was pushed.
+        """
+        pushed = self.finished(afs_path).get("pushed")
+        if pushed is None:
+            return False
+        return fingerprint is None or pushed == fingerprint
+
+    def mark(self, afs_path: str, stage: str, fingerprint: str) -> None:
+        """Record that stage has finished for this repo."""
+        if stage not in STAGES:
+            raise ValueError(f"{stage} is not one of the migration stages {STAGES}")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?)",
+                (journal_key(afs_path), stage, fingerprint, time.time()),
+            )
+
+    def forget(self, afs_path: str, stages: tuple[str, ...] = STAGES) -> None:
+        """Forget that these stages were finished for this repo."""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM stages WHERE afs_path = ? AND stage = ?",
+                [(journal_key(afs_path), stage) for stage in stages],
+            )
+
+    def check_fingerprint(self, afs_path: str, fingerprint: str) -> dict[str, str]:
+        """
+        Return the finished stages that are still valid for this fingerprint.
+
+        If the afs refs changed since a stage that depends on them was
+        finished, that stage is forgotten so it gets redone.
+        """
+        finished = self.finished(afs_path)
+        stale = tuple(
+            stage
+            for stage in CONTENT_STAGES
+            if stage in finished and finished[stage] != fingerprint
+        )
+        if stale:
+            logger.warning(
+                f"{afs_path} changed since the last run, redoing {', '.join(stale)}"
+            )
+            self.forget(afs_path, stale)
+            for stage in stale:
+                del finished[stage]
+        return finished
@@ -1,39 +1,93 @@
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from shutil import copy
+from typing import Callable, Iterable
 
+from .plan import Plan
 from .rename import RepoInfo
 
+logger = logging.getLogger(__name__)
+
 
 class AlreadyLockedError(RuntimeError): ...
 
 
-def lock_file_repo(path: str, org: str) -> None:
-    """
-    Add a pre-receive hook to a filepath repo to prevent further pushes.
+class NotLockedError(RuntimeError): ...
+
+
+# Results of hook_status
+LOCKED = "locked"
+UNLOCKED = "unlocked"
+OTHER_HOOK = "other hook"
 
-    The intention is to run this prior to the migration so that no new
-    changes are introduced during the move to github.
-    """
-    repo_info = RepoInfo.from_afs(afs_source=path, org=org)
-    hooks_dir = Path(repo_info.afs_source) / "hooks"
-    if not hooks_dir.is_dir():
-        hooks_dir = Path(repo_info.afs_source) / ".git" / "hooks"
-        if not hooks_dir.is_dir():
-            raise ValueError(
-                f"{path} is not a valid git repo, it has no hooks subdirectory."
-            )
 
+@functools.cache
+def _hook_template() -> str:
+    """Read the hook template once per process."""
     template_path = Path(__file__).parent / "hook_template.txt"
     with template_path.open("r") as fd:
-        template = fd.read()
+        return fd.read()
 
-    filled_hooks = template.format(
+
+def render_hook(repo_info: RepoInfo) -> str:
+    """The pre-receive hook that points people at the new github repo."""
+    return _hook_template().format(
         name=repo_info.name,
         github_url=repo_info.github_url,
         github_ssh=repo_info.github_ssh,
         afs_source=repo_info.afs_source,
     )
 
+
+def _hooks_dir(path: str, repo_info: RepoInfo) -> Path:
+    hooks_dir = Path(repo_info.afs_source) / "hooks"
+    if not hooks_dir.is_dir():
+        hooks_dir = Path(repo_info.afs_source) / ".git" / "hooks"
+        if not hooks_dir.is_dir():
+            raise ValueError(
+                f"{path} is not a valid git repo, it has no hooks subdirectory."
+            )
+    return hooks_dir
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """
+    Replace path with text so that readers only ever see a complete file.
+
+    A push that runs while we lock sees either the old hook or the new one,
+    never a half-written or non-executable one.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp_path.open("w") as fd:
+            fd.write(text)
+        tmp_path.chmod(0o775)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def lock_file_repo(
+    path: str, org: str, resolve: bool = True, repo_info: RepoInfo | None = None
+) -> None:
+    """
+    Add a pre-receive hook to a filepath repo to prevent further pushes.
+
+    The intention is to run this prior to the migration so that no new
+    changes are introduced during the move to github.
+
+    Pass resolve=False if path is already a resolved path,
+    or pass the repo_info if you already have it.
+    """
+    if repo_info is None:
+        repo_info = RepoInfo.from_afs(afs_source=path, org=org, resolve=resolve)
+    hooks_dir = _hooks_dir(path=path, repo_info=repo_info)
+    filled_hooks = render_hook(repo_info)
+
     pre_receive_path = hooks_dir / "pre-receive"
     if pre_receive_path.exists():
         with pre_receive_path.open("r") as fd:
@@ -50,7 +104,145 @@ def lock_file_repo(path: str, org: str) -> None:
                     copy(pre_receive_path, backup_path)
                     break
 
-    with pre_receive_path.open("w") as fd:
-        fd.write(filled_hooks)
+    _write_atomic(pre_receive_path, filled_hooks)
+
+
+def hook_status(
+    path: str, org: str, resolve: bool = True, repo_info: RepoInfo | None = None
+) -> str:
+    """Return LOCKED, UNLOCKED, or OTHER_HOOK for a filepath repo."""
+    if repo_info is None:
+        repo_info = RepoInfo.from_afs(afs_source=path, org=org, resolve=resolve)
+    pre_receive_path = _hooks_dir(path=path, repo_info=repo_info) / "pre-receive"
+    try:
+        with pre_receive_path.open("r") as fd:
+            existing = fd.read()
+    except FileNotFoundError:
+        return UNLOCKED
+    if existing == render_hook(repo_info):
+        return LOCKED
+    return OTHER_HOOK
+
+
+def unlock_file_repo(
+    path: str, org: str, resolve: bool = True, repo_info: RepoInfo | None = None
+) -> None:
+    """
+    Remove our pre-receive hook from a filepath repo.
+
+    If lock_file_repo backed up an earlier hook, the newest backup is put back.
+    Raises NotLockedError if our hook isn't there.
+    """
+    if repo_info is None:
+        repo_info = RepoInfo.from_afs(afs_source=path, org=org, resolve=resolve)
+    hooks_dir = _hooks_dir(path=path, repo_info=repo_info)
+    if hook_status(path=path, org=org, repo_info=repo_info) != LOCKED:
+        raise NotLockedError(f"Our pre-receive hook is not installed in {hooks_dir}.")
+    pre_receive_path = hooks_dir / "pre-receive"
+    backups = sorted(
+        hooks_dir.glob("pre-receive.bak.*"),
+        key=lambda backup: int(backup.suffix.removeprefix(".")),
+    )
+    if backups:
+        os.replace(backups[-1], pre_receive_path)
+    else:
+        pre_receive_path.unlink()
+
+
+def _for_each_repo(
+    func: Callable[..., object],
+    paths: Iterable[str],
+    org: str,
+    jobs: int = 1,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> dict[str, object]:
+    """
+    Call func on every repo at once, returning each result or exception.
+
+    Each repo only needs a few small file operations, and on afs those
+    are mostly spent waiting on the network, so threads overlap them well.
+    """
+
+    def run(path: str) -> tuple[str, object]:
+        try:
+            repo_info = plan.get_info(path) if plan is not None else None
+            return path, func(path=path, org=org, resolve=resolve, repo_info=repo_info)
+        except Exception as exc:
+            return path, exc
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return dict(executor.map(run, paths))
+
+
+def lock_many(
+    paths: Iterable[str],
+    org: str,
+    jobs: int = 1,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> int:
+    """
+    Lock every repo, jobs at a time, returning the number that failed.
+
+    Repos that were already locked count as a success.
+    """
+    results = _for_each_repo(
+        lock_file_repo, paths=paths, org=org, jobs=jobs, resolve=resolve, plan=plan
+    )
+    n_failed = 0
+    for path, result in results.items():
+        if isinstance(result, AlreadyLockedError):
+            logger.info(f"{path} was already locked")
+        elif isinstance(result, Exception):
+            logger.error(f"Failed to lock {path}: {result}")
+            n_failed += 1
+        else:
+            logger.debug(f"Locked {path}")
+    logger.info(f"Locked {len(results) - n_failed} of {len(results)} repos")
+    return n_failed
+
+
+def unlock_many(
+    paths: Iterable[str],
+    org: str,
+    jobs: int = 1,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> int:
+    """
+    Unlock every repo, jobs at a time, returning the number that failed.
 
-    pre_receive_path.chmod(0o775)
+    Repos that were not locked count as a success.
+    """
+    results = _for_each_repo(
+        unlock_file_repo, paths=paths, org=org, jobs=jobs, resolve=resolve, plan=plan
+    )
+    n_failed = 0
+    for path, result in results.items():
+        if isinstance(result, NotLockedError):
+            logger.info(f"{path} was not locked")
+        elif isinstance(result, Exception):
+            logger.error(f"Failed to unlock {path}: {result}")
+            n_failed += 1
+        else:
+            logger.debug(f"Unlocked {path}")
+    logger.info(f"Unlocked {len(results) - n_failed} of {len(results)} repos")
+    return n_failed
+
+
+def status_many(
+    paths: Iterable[str],
+    org: str,
+    jobs: int = 1,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> dict[str, str]:
+    """Check every repo's lock, returning its status or what went wrong."""
+    results = _for_each_repo(
+        hook_status, paths=paths, org=org, jobs=jobs, resolve=resolve, plan=plan
+    )
+    return {
+        path: f"error: {result}" if isinstance(result, Exception) else str(result)
+        for path, result in results.items()
+    }
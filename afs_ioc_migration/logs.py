@@ -0,0 +1,113 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Hashable, Iterator
+
+
+class LogGrouper:
+    """
+    Hold back log records from worker threads until their repo is done.
+
+    When several repos are migrated at once, their log lines would normally
+    interleave into an unreadable mess. While a thread is inside
+    ``group()``, every record it emits is buffered instead of written out,
+    and the whole block is written in one go when the ``group()`` exits.
+    Records from threads that are not grouping are written immediately.
+
+    A group can be given a key and left open with ``flush=False`` so that
+    a repo handed from one thread to another still comes out as one block
+    when ``flush(key)`` is finally called.
+    """
+
+    def __init__(self) -> None:
+        self._buffers: dict[
+            Hashable, list[tuple[logging.Handler, logging.LogRecord]]
+        ] = {}
+        self._keys: dict[int, Hashable] = {}
+        self._installed: list[tuple[logging.Handler, logging.Filter]] = []
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+
+    def install(self, logger: logging.Logger | None = None) -> None:
+        """Attach to every handler on logger (default: the root logger)."""
+        if logger is None:
+            logger = logging.getLogger()
+        for handler in logger.handlers:
+            filt = _GroupingFilter(grouper=self, handler=handler)
+            handler.addFilter(filt)
+            self._installed.append((handler, filt))
+
+    def uninstall(self) -> None:
+        """Detach from all handlers, leaving them as they were."""
+        for handler, filt in self._installed:
+            handler.removeFilter(filt)
+        self._installed.clear()
+
+    @contextmanager
+    def group(self, key: Hashable = None, flush: bool = True) -> Iterator[None]:
+        """
+        Buffer this thread's log records under key until the block exits.
+
+        The key defaults to the current thread.
+        If flush is False, the records stay buffered after the block exits.
+        """
+        ident = threading.get_ident()
+        if key is None:
+            key = ident
+        self._buffers.setdefault(key, [])
+        self._keys[ident] = key
+        try:
+            yield
+        finally:
+            del self._keys[ident]
+            if flush:
+                self.flush(key)
+
+    def flush(self, key: Hashable) -> None:
+        """Write out and forget every record buffered under key."""
+        records = self._buffers.pop(key, [])
+        with self._flush_lock:
+            # The thread that made these records may be grouping something
+            # else by now, so make sure they don't get captured again.
+            self._local.flushing = True
+            try:
+                for handler, record in records:
+                    handler.handle(record)
+            finally:
+                self._local.flushing = False
+
+    def _capture(self, handler: logging.Handler, record: logging.LogRecord) -> bool:
+        if getattr(self._local, "flushing", False):
+            return True
+        key = self._keys.get(record.thread)
+        if key is None:
+            return True
+        self._buffers[key].append((handler, record))
+        return False
+
+
+class _GroupingFilter(logging.Filter):
+    def __init__(self, grouper: LogGrouper, handler: logging.Handler) -> None:
+        super().__init__()
+        self.grouper = grouper
+        self.handler = handler
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.grouper._capture(self.handler, record)
+
+
+@contextmanager
+def grouped_logging(enabled: bool = True) -> Iterator[LogGrouper]:
+    """
+    Install a LogGrouper on the root handlers for the duration of the block.
+
+    If enabled is False, the grouper is still yielded so that callers can use
+    it unconditionally, but it never holds anything back.
+    """
+    grouper = LogGrouper()
+    if enabled:
+        grouper.install()
+    try:
+        yield grouper
+    finally:
+        grouper.uninstall()
@@ -1,31 +1,16 @@
 from os import remove
 from pathlib import Path
-from shutil import copy, copytree
-from typing import Any, Callable
-
-import jinja2
 
+from .assets import get_assets
+from .gitignore import merge
 from .rename import RepoInfo
 
 
-def add_file(
-    cloned_path: str,
-    source_name: str,
-    dest_name: str,
-    copy_func: Callable[[Path, Path], Any] = copy,
-) -> Path:
-    """Add some sample file to the repo, overriding the destination file."""
-    src_path = Path(__file__).parent / source_name
-    dst_path = Path(cloned_path) / dest_name
-    copy_func(src_path, dst_path)
-    return dst_path
-
-
 def add_license_file(cloned_path: str) -> Path:
     """Add a standard SLAC license file to the repo."""
-    return add_file(
-        cloned_path=cloned_path, source_name="sample_license.md", dest_name="LICENSE.md"
-    )
+    dst_path = Path(cloned_path) / "LICENSE.md"
+    get_assets().license.write_file(dst_path)
+    return dst_path
 
 
 def add_gitignore(cloned_path: str) -> Path:
@@ -39,41 +24,35 @@ def add_gitignore(cloned_path: str) -> Path:
     """
     target_path = Path(cloned_path) / ".gitignore"
     if not target_path.exists():
-        return add_file(
-            cloned_path=cloned_path,
-            source_name="sample_gitignore.txt",
-            dest_name=".gitignore",
-        )
+        get_assets().gitignore.write_file(target_path)
+        return target_path
     with target_path.open("r") as fd:
-        orig_gitignore = fd.read().splitlines()
-    # Leading and trailing directory slashes don't do anything except
-    # make it harder to match existing entries in gitignore.
-    orig_gitignore = [line.strip("/") for line in orig_gitignore]
-
-    src_path = Path(__file__).parent / "sample_gitignore.txt"
-    with src_path.open("r") as fd:
-        new_gitignore = fd.read().splitlines()
-
-    lines_to_add = [line for line in orig_gitignore if line not in new_gitignore]
-    if lines_to_add:
-        new_gitignore.append("")
-        new_gitignore.append("# From original afs gitignore")
-        new_gitignore.extend(lines_to_add)
+        orig_gitignore = fd.read()
 
     with target_path.open("w") as fd:
-        fd.write("\n".join(new_gitignore) + "\n")
+        fd.write(merge_gitignore(orig_gitignore))
 
     return target_path
 
 
+def merge_gitignore(orig_gitignore: str) -> str:
+    """
+    Return the text of our standard gitignore with orig_gitignore merged in.
+
+    Any unique extra elements from orig_gitignore are added to the end
+    in a labelled section.
+    """
+    # Equivalent spellings of the same rule are only kept once,
+    # see gitignore.merge for what counts as equivalent.
+    merged = merge(get_assets().gitignore_lines, orig_gitignore.splitlines())
+    return "\n".join(merged) + "\n"
+
+
 def add_github_folder(cloned_path: str) -> Path:
     """Add a .github folder with PR and issue templates to the repo."""
-    return add_file(
-        cloned_path=cloned_path,
-        source_name="sample_github_folder",
-        dest_name=".github",
-        copy_func=copytree,
-    )
+    dst_path = Path(cloned_path) / ".github"
+    get_assets().github_folder.write_files(dst_path)
+    return dst_path
 
 
 def add_readme_file(cloned_path: str, repo_info: RepoInfo) -> tuple[Path, list[Path]]:
@@ -102,14 +81,7 @@ def add_readme_file(cloned_path: str, repo_info: RepoInfo) -> tuple[Path, list[P
         with path.open("r") as fd:
             original_readmes.append(fd.read())
 
-    jinja_loader = jinja2.FileSystemLoader(Path(__file__).parent)
-    jinja_env = jinja2.Environment(
-        loader=jinja_loader,
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    template = jinja_env.get_template("readme_template.md")
-    output_text = template.render(
+    output_text = render_readme(
         repo_info=repo_info,
         original_readme_info=list(
             zip([path.name for path in original_paths], original_readmes)
@@ -124,3 +96,18 @@ def add_readme_file(cloned_path: str, repo_info: RepoInfo) -> tuple[Path, list[P
         fd.write(output_text)
 
     return dst_path, original_paths
+
+
+def render_readme(
+    repo_info: RepoInfo, original_readme_info: list[tuple[str, str]]
+) -> str:
+    """
+    Return the text of our standard README.md.
+
+    original_readme_info is a list of (filename, text) for every
+    pre-existing readme that should be included.
+    """
+    return get_assets().readme_template.render(
+        repo_info=repo_info,
+        original_readme_info=original_readme_info,
+    )
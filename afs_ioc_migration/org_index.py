@@ -0,0 +1,81 @@
+import dataclasses
+import logging
+
+from .github_client import GitHubClient, get_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class OrgRepo:
+    """What we know about one repo that already exists in the github org."""
+
+    name: str
+    has_commits: bool
+    topics: tuple[str, ...] = ()
+
+    @classmethod
+    def from_api(cls, data: dict) -> "OrgRepo":
+        """
+        Create an OrgRepo from one element of the github org repo listing.
+
+        Github has no "empty" flag in this listing, so we infer it:
+        a repo that has never been pushed to has a size of zero and a
+        pushed_at that is either missing or the same as its created_at.
+        If we guess wrong, the push or the final RepoExistsError check
+        will still refuse to clobber anything.
+        """
+        pushed_at = data.get("pushed_at")
+        never_pushed = pushed_at is None or pushed_at == data.get("created_at")
+        return cls(
+            name=data["name"],
+            has_commits=not (data.get("size", 0) == 0 and never_pushed),
+            topics=tuple(data.get("topics") or ()),
+        )
+
+
+class OrgIndex:
+    """
+    In-memory index of every repo in a github org.
+
+    Built once per run with a paginated listing of the whole org,
+    so that we don't need one api call per repo to find out if
+    it already exists.
+
+    Lookups are case-insensitive, like github repo names.
+    """
+
+    def __init__(self, org: str, repos: dict[str, OrgRepo]) -> None:
+        self.org = org
+        self.repos = {name.lower(): repo for name, repo in repos.items()}
+
+    @classmethod
+    def fetch(
+        cls, org: str, gh: GitHubClient | None = None, per_page: int = 100
+    ) -> "OrgIndex":
+        """List every repo in the org, one page at a time."""
+        if gh is None:
+            gh = get_client()
+        logger.info(f"Listing every existing repo in github org {org}")
+        repos = {}
+        page = 1
+        while True:
+            batch = gh.repos.list_for_org(org, per_page=per_page, page=page)
+            for data in batch:
+                repo = OrgRepo.from_api(data)
+                repos[repo.name] = repo
+            if len(batch) < per_page:
+                break
+            page += 1
+        logger.info(f"Found {len(repos)} existing repos in {org} in {page} pages")
+        return cls(org=org, repos=repos)
+
+    def get(self, name: str) -> OrgRepo | None:
+        """Return the repo with this name, or None if it doesn't exist."""
+        return self.repos.get(name.lower())
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self.repos
+
+    def __len__(self) -> int:
+        return len(self.repos)
@@ -0,0 +1,366 @@
+import dataclasses
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Iterable
+from urllib.error import HTTPError
+
+from .coordinator import Coordinator, LeaseLostError
+from .journal import Journal
+from .logs import LogGrouper
+from .retry import PERMANENT, RetryPolicy, classify
+from .transfer import is_migrated, prepare_repo, publish_repo
+
+logger = logging.getLogger(__name__)
+
+# Put on a queue to tell a worker there is no more work
+_DONE = object()
+
+
+@dataclasses.dataclass
+class RepoResult:
+    """The outcome of migrating one repo through the pipeline."""
+
+    afs_path: str
+    path: str = ""
+    stage: str = ""
+    error: BaseException | None = None
+    skipped: bool = False
+    # Seconds spent preparing and publishing, not waiting in between
+    duration: float = 0.0
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class MigrationPipeline:
+    """
+    Run migrations as two stages connected by a bounded queue.
+
+    The local stage (prepare_repo: lock, fetch from afs, maintenance commits)
+    runs in prepare_jobs threads. The network stage (publish_repo: create,
+    topics, push) runs in publish_jobs threads. At most queue_size prepared
+    clones wait between the stages, which keeps the local stage from
+    filling the disk when the network stage is the bottleneck.
+
+    Failures are classified with retry.classify. A transient failure,
+    e.g. a github 502, a secondary rate limit or a dropped push, sends
+    the repo to the back of its stage's queue after a jittered backoff
+    from the retry policy, while other repos carry on. A repo that failed
+    to publish keeps its prepared clone and only publishes again.
+    Once a repo runs out of attempts, it counts as failed.
+
+    A permanent HTTPError, e.g. a bad token, stops the pipeline, as does
+    any other error that isn't retried if stop_on_error is True. When we
+    stop, no new repos are started, repos waiting between stages or for
+    a retry are cleaned up without being published, work already in
+    progress is allowed to finish, and then the first such error is
+    re-raised from run.
+
+    If a journal is provided, repos it says were already migrated are
+    skipped right away, and the rest skip any stages already finished.
+    When syncing, a migrated repo is only skipped if afs hasn't changed.
+
+    If a coordinator is provided, the paths are a work list shared with
+    other workers, and we only migrate the repos we claim a lease on.
+    Each repo is recorded as done with the coordinator when it finishes.
+    Repos reclaimed from a dead worker are synced, to pick up whatever
+    it left half done, and are looked up on github rather than in an org
+    index that predates its work. A repo whose lease was lost is never
+    published.
+
+    Any other keyword arguments, such as org_index or cache_dir, are
+    passed on to every prepare_repo call.
+    """
+
+    def __init__(
+        self,
+        org: str,
+        dry_run: bool,
+        prepare_jobs: int = 1,
+        publish_jobs: int = 1,
+        queue_size: int = 1,
+        stop_on_error: bool = False,
+        grouper: LogGrouper | None = None,
+        journal: Journal | None = None,
+        retry: RetryPolicy | None = None,
+        coordinator: Coordinator | None = None,
+        **prepare_kwargs,
+    ) -> None:
+        self.org = org
+        self.dry_run = dry_run
+        self.prepare_jobs = max(prepare_jobs, 1)
+        self.publish_jobs = max(publish_jobs, 1)
+        self.queue_size = max(queue_size, 1)
+        self.stop_on_error = stop_on_error
+        self.grouper = grouper if grouper is not None else LogGrouper()
+        self.journal = journal
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.coordinator = coordinator
+        self.prepare_kwargs = prepare_kwargs
+        self.results: list[RepoResult] = []
+        self._results_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._fatal: BaseException | None = None
+        # Repos started but not finished, including those waiting to retry
+        self._outstanding = 0
+        self._idle = threading.Condition(self._results_lock)
+        self._attempts: dict[str, int] = {}
+        # (due time, tie breaker, afs_path, prepared repo or None, duration)
+        self._retries: list[tuple] = []
+        self._retry_count = itertools.count()
+        self._finished = threading.Event()
+
+    def run(self, paths: Iterable[str]) -> list[RepoResult]:
+        """Migrate every path and return the results in completion order."""
+        todo: queue.Queue = queue.Queue(maxsize=self.prepare_jobs)
+        ready: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        prepare_threads = [
+            threading.Thread(
+                target=self._prepare_worker,
+                args=(todo, ready),
+                name=f"prepare-{num}",
+                daemon=True,
+            )
+            for num in range(self.prepare_jobs)
+        ]
+        publish_threads = [
+            threading.Thread(
+                target=self._publish_worker,
+                args=(ready,),
+                name=f"publish-{num}",
+                daemon=True,
+            )
+            for num in range(self.publish_jobs)
+        ]
+        retry_thread = threading.Thread(
+            target=self._retry_worker, args=(todo, ready), name="retry", daemon=True
+        )
+        for thread in prepare_threads + publish_threads + [retry_thread]:
+            thread.start()
+        if self.coordinator is not None:
+            paths = self.coordinator.claims(list(paths), stop=self._stop)
+        try:
+            for afs_path in paths:
+                with self._idle:
+                    self._outstanding += 1
+                if not self._put(todo, afs_path):
+                    break
+            # Repos can come back to try again until every one is done
+            with self._idle:
+                while self._outstanding and not self._stop.is_set():
+                    self._idle.wait(timeout=0.1)
+        except BaseException:
+            # e.g. ctrl+c, wrap up what is in progress and quit
+            self._stop.set()
+            raise
+        finally:
+            self._finished.set()
+            retry_thread.join()
+            for _ in prepare_threads:
+                todo.put(_DONE)
+            for thread in prepare_threads:
+                thread.join()
+            for _ in publish_threads:
+                ready.put(_DONE)
+            for thread in publish_threads:
+                thread.join()
+        if self._fatal is not None:
+            raise self._fatal
+        return self.results
+
+    def _put(self, target: queue.Queue, item: object) -> bool:
+        """Put item on target, giving up and returning False if we stop."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def _prepare_worker(self, todo: queue.Queue, ready: queue.Queue) -> None:
+        while True:
+            afs_path = todo.get()
+            if afs_path is _DONE:
+                return
+            if self._stop.is_set():
+                continue
+            prepare_kwargs = self.prepare_kwargs
+            if self.coordinator is not None and self.coordinator.reclaimed(afs_path):
+                # Whoever had it may have created or pushed some of it, after
+                # our org index was fetched, so ask github what's there now
+                prepare_kwargs = dict(prepare_kwargs, sync=True, org_index=None)
+            if is_migrated(
+                afs_path=afs_path,
+                journal=self.journal,
+                dry_run=self.dry_run,
+                sync=prepare_kwargs.get("sync", False),
+            ):
+                self._record(RepoResult(afs_path=afs_path, skipped=True))
+                continue
+            with self.grouper.group(key=afs_path, flush=False):
+                logger.info(
+                    f"Migrating {afs_path} to org={self.org} with dry_run={self.dry_run}"
+                )
+                start = time.monotonic()
+                try:
+                    prepared = prepare_repo(
+                        afs_path=afs_path,
+                        org=self.org,
+                        dry_run=self.dry_run,
+                        journal=self.journal,
+                        **prepare_kwargs,
+                    )
+                except Exception as exc:
+                    self._fail(
+                        afs_path=afs_path,
+                        stage="prepare",
+                        exc=exc,
+                        duration=time.monotonic() - start,
+                    )
+                    prepared = None
+            if prepared is None:
+                self.grouper.flush(afs_path)
+            elif not self._put(ready, (afs_path, prepared, time.monotonic() - start)):
+                prepared.cleanup()
+                self.grouper.flush(afs_path)
+
+    def _publish_worker(self, ready: queue.Queue) -> None:
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                return
+            afs_path, prepared, duration = item
+            if self._stop.is_set():
+                prepared.cleanup()
+                self.grouper.flush(afs_path)
+                continue
+            with self.grouper.group(key=afs_path):
+                start = time.monotonic()
+                try:
+                    if self.coordinator is not None and not self.coordinator.held(
+                        afs_path
+                    ):
+                        raise LeaseLostError(
+                            f"Lost the lease on {afs_path}, another worker has it now"
+                        )
+                    path = publish_repo(prepared, cleanup=False)
+                except Exception as exc:
+                    self._fail(
+                        afs_path=afs_path,
+                        stage="publish",
+                        exc=exc,
+                        duration=duration + time.monotonic() - start,
+                        prepared=prepared,
+                    )
+                else:
+                    prepared.cleanup()
+                    self._record(
+                        RepoResult(
+                            afs_path=afs_path,
+                            path=path,
+                            duration=duration + time.monotonic() - start,
+                        )
+                    )
+
+    def _retry_worker(self, todo: queue.Queue, ready: queue.Queue) -> None:
+        """Put repos back on their stage's queue once their backoff is over."""
+        while not self._finished.wait(timeout=0.05):
+            due = []
+            with self._results_lock:
+                while self._retries and self._retries[0][0] <= time.monotonic():
+                    due.append(heapq.heappop(self._retries))
+            for _, _, afs_path, prepared, duration in due:
+                if prepared is None:
+                    self._put(todo, afs_path)
+                elif not self._put(ready, (afs_path, prepared, duration)):
+                    prepared.cleanup()
+        # Anything still waiting was stopped
+        for _, _, _, prepared, _ in self._retries:
+            if prepared is not None:
+                prepared.cleanup()
+
+    def _fail(
+        self,
+        afs_path: str,
+        stage: str,
+        exc: Exception,
+        duration: float = 0.0,
+        prepared: object = None,
+    ) -> None:
+        """
+        Retry or record a failure, deciding whether it should stop everything.
+
+        prepared is the prepared repo if publishing failed, it is either
+        kept for the retry or cleaned up here.
+        """
+        kind = classify(exc)
+        with self._results_lock:
+            attempt = self._attempts.get(afs_path, 1)
+            retry = (
+                kind != PERMANENT
+                and attempt < self.retry.max_attempts
+                and not self._stop.is_set()
+            )
+            if retry:
+                delay = self.retry.delay(attempt, exc)
+                self._attempts[afs_path] = attempt + 1
+                heapq.heappush(
+                    self._retries,
+                    (
+                        time.monotonic() + delay,
+                        next(self._retry_count),
+                        afs_path,
+                        prepared,
+                        duration,
+                    ),
+                )
+        if retry:
+            logger.warning(
+                f"{kind.capitalize()} failure during {stage} of {afs_path}: {exc}. "
+                f"Trying again in {delay:.1f}s "
+                f"(attempt {attempt + 1} of {self.retry.max_attempts})"
+            )
+            return
+        if prepared is not None:
+            prepared.cleanup()
+        if kind != PERMANENT:
+            logger.error(
+                f"Giving up on {afs_path} after {attempt} attempts", exc_info=exc
+            )
+            fatal = self.stop_on_error
+        elif isinstance(exc, HTTPError):
+            logger.error("Stopping on HTTPError")
+            fatal = True
+        elif self.stop_on_error:
+            logger.error(f"Stopping on error while transferring {afs_path}")
+            fatal = True
+        else:
+            logger.error(f"Exception while transferring {afs_path}", exc_info=exc)
+            fatal = False
+        if fatal:
+            with self._results_lock:
+                if self._fatal is None:
+                    self._fatal = exc
+            self._stop.set()
+        self._record(
+            RepoResult(afs_path=afs_path, stage=stage, error=exc, duration=duration)
+        )
+
+    def _record(self, result: RepoResult) -> None:
+        if self.coordinator is not None:
+            # Before run can return and the coordinator lets go of our leases
+            self.coordinator.finish(
+                result.afs_path, ok=result.ok, error=str(result.error or "")
+            )
+        with self._idle:
+            result.attempts = self._attempts.get(result.afs_path, 1)
+            self.results.append(result)
+            self._outstanding -= 1
+            self._idle.notify_all()
@@ -0,0 +1,142 @@
+import dataclasses
+import json
+import logging
+import os
+from typing import Iterable, TextIO
+
+from .rename import RepoInfo
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class PlannedRepo:
+    """Where one afs repo will go, or why it can't go anywhere."""
+
+    afs_path: str
+    info: RepoInfo | None = None
+    error: str = ""
+
+    @property
+    def area_renamed(self) -> bool:
+        """True if the area in the github name differs from the afs area."""
+        return self.info is not None and f"/ioc/{self.info.area}/" not in self.afs_path
+
+
+class Plan:
+    """
+    The github name of every afs repo, worked out once and up front.
+
+    Names are derived from the paths alone, so building a plan never
+    touches the filesystem. index maps each lowercased github name to
+    every afs path that would be migrated there. github names are case
+    insensitive, so any name with more than one path is a collision.
+    """
+
+    def __init__(self, org: str, repos: Iterable[PlannedRepo]) -> None:
+        self.org = org
+        self.repos = {repo.afs_path: repo for repo in repos}
+        self.index: dict[str, list[str]] = {}
+        for repo in self.repos.values():
+            if repo.info is not None:
+                self.index.setdefault(repo.info.name.lower(), []).append(repo.afs_path)
+
+    @classmethod
+    def build(cls, paths: Iterable[str], org: str) -> "Plan":
+        """Plan every path, which must already be resolved if it is absolute."""
+        repos = []
+        for afs_path in paths:
+            afs_path = os.path.abspath(afs_path)
+            try:
+                info = RepoInfo.from_afs(afs_source=afs_path, org=org, resolve=False)
+            except (ValueError, IndexError) as exc:
+                repos.append(PlannedRepo(afs_path=afs_path, error=str(exc)))
+            else:
+                repos.append(PlannedRepo(afs_path=afs_path, info=info))
+        plan = cls(org=org, repos=repos)
+        for name, afs_paths in plan.collisions.items():
+            logger.warning(f"{len(afs_paths)} repos would be named {name}: {afs_paths}")
+        for repo in plan.invalid:
+            logger.warning(f"{repo.afs_path} can't be migrated: {repo.error}")
+        return plan
+
+    @property
+    def collisions(self) -> dict[str, list[str]]:
+        """Every github name that more than one afs repo would be migrated to."""
+        return {
+            self.repos[afs_paths[0]].info.name: afs_paths
+            for afs_paths in self.index.values()
+            if len(afs_paths) > 1
+        }
+
+    @property
+    def invalid(self) -> list[PlannedRepo]:
+        return [repo for repo in self.repos.values() if repo.info is None]
+
+    def get_info(self, afs_path: str) -> RepoInfo:
+        """
+        Look up the planned RepoInfo for afs_path.
+
+        Raises ValueError if the repo isn't in the plan, couldn't be named,
+        or shares its name with another repo.
+        """
+        repo = self.repos.get(os.path.abspath(afs_path))
+        if repo is None:
+            raise ValueError(f"{afs_path} is not in the plan.")
+        if repo.info is None:
+            raise ValueError(repo.error)
+        afs_paths = self.index[repo.info.name.lower()]
+        if len(afs_paths) > 1:
+            raise ValueError(
+                f"{afs_path} would be named {repo.info.name}, "
+                f"the same as {[path for path in afs_paths if path != repo.afs_path]}"
+            )
+        return repo.info
+
+    def write(self, fd: TextIO) -> None:
+        """Write the plan as json."""
+        json.dump(
+            {
+                "org": self.org,
+                "summary": {
+                    "total": len(self.repos),
+                    "invalid": len(self.invalid),
+                    "collisions": len(self.collisions),
+                    "area_renamed": sum(
+                        1 for repo in self.repos.values() if repo.area_renamed
+                    ),
+                },
+                "collisions": self.collisions,
+                "repos": [
+                    {
+                        "afs_path": repo.afs_path,
+                        "info": None
+                        if repo.info is None
+                        else dataclasses.asdict(repo.info),
+                        "error": repo.error,
+                        "area_renamed": repo.area_renamed,
+                    }
+                    for repo in self.repos.values()
+                ],
+            },
+            fd,
+            indent=2,
+        )
+        fd.write("\n")
+
+    @classmethod
+    def read(cls, path: str) -> "Plan":
+        """Load a plan written by write."""
+        with open(path, "r") as fd:
+            data = json.load(fd)
+        return cls(
+            org=data["org"],
+            repos=[
+                PlannedRepo(
+                    afs_path=repo["afs_path"],
+                    info=None if repo["info"] is None else RepoInfo(**repo["info"]),
+                    error=repo["error"],
+                )
+                for repo in data["repos"]
+            ],
+        )
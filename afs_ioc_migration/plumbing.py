@@ -0,0 +1,249 @@
+import dataclasses
+import fnmatch
+import logging
+import subprocess
+from pathlib import Path
+
+from .assets import get_assets
+from .gitignore import report_newly_ignored
+from .modify import merge_gitignore, render_readme
+from .rename import RepoInfo
+
+logger = logging.getLogger(__name__)
+
+# The subjects of our maintenance commits, oldest first
+MAINTENANCE_SUBJECTS = (
+    "MAINT: add standard license file",
+    "MAINT: update gitignore",
+    "MAINT: add github templates",
+    "MAINT: update readme",
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class TreeEntry:
+    """One line of git ls-tree output."""
+
+    mode: str
+    type: str
+    oid: str
+    name: str
+
+    def to_mktree(self) -> bytes:
+        return (
+            f"{self.mode} {self.type} {self.oid}\t{self.name}".encode(
+                errors="surrogateescape"
+            )
+            + b"\0"
+        )
+
+
+def git(repo_path: str, *args: str, input: bytes | None = None) -> bytes:
+    """Run a git command in repo_path and return its stdout."""
+    return subprocess.run(
+        ["git", *args],
+        cwd=repo_path,
+        input=input,
+        capture_output=True,
+        check=True,
+    ).stdout
+
+
+def hash_blob(repo_path: str, data: bytes) -> str:
+    """Write data into the repo as a blob and return its id."""
+    return git(repo_path, "hash-object", "-w", "--stdin", input=data).decode().strip()
+
+
+def read_blob(repo_path: str, oid: str) -> bytes:
+    return git(repo_path, "cat-file", "blob", oid)
+
+
+def ls_tree(repo_path: str, treeish: str) -> list[TreeEntry]:
+    """List the top level of a tree, without recursing."""
+    entries = []
+    for line in git(repo_path, "ls-tree", "-z", treeish).split(b"\0"):
+        if not line:
+            continue
+        meta, name = line.split(b"\t", 1)
+        mode, type_, oid = meta.decode().split()
+        entries.append(
+            TreeEntry(
+                mode=mode,
+                type=type_,
+                oid=oid,
+                name=name.decode(errors="surrogateescape"),
+            )
+        )
+    return entries
+
+
+def make_tree(repo_path: str, entries: list[TreeEntry]) -> str:
+    """Write a tree with exactly these entries and return its id."""
+    data = b"".join(entry.to_mktree() for entry in entries)
+    return git(repo_path, "mktree", "-z", input=data).decode().strip()
+
+
+def commit_tree(repo_path: str, tree: str, parent: str, msg: str) -> str:
+    """Make a commit of tree on top of parent and return its id."""
+    return git(repo_path, "commit-tree", tree, "-p", parent, "-m", msg).decode().strip()
+
+
+def objects_dir(repo_path: str) -> Path:
+    """The objects directory of a bare or non-bare repo."""
+    git_dir = Path(repo_path) / ".git"
+    if git_dir.is_dir():
+        return git_dir / "objects"
+    return Path(repo_path) / "objects"
+
+
+def _decode(data: bytes) -> str:
+    """Decode like reading the file in text mode would."""
+    return data.decode().replace("\r\n", "\n").replace("\r", "\n")
+
+
+class TreeBuilder:
+    """Edit the top level of a tree and commit each version in turn."""
+
+    def __init__(self, repo_path: str, head: str) -> None:
+        self.repo_path = repo_path
+        self.head = head
+        self.entries = {
+            entry.name: entry for entry in ls_tree(repo_path, f"{head}^{{tree}}")
+        }
+
+    def add_blob(self, name: str, data: bytes, mode: str = "100644") -> None:
+        oid = hash_blob(self.repo_path, data)
+        self.entries[name] = TreeEntry(mode=mode, type="blob", oid=oid, name=name)
+
+    def add_entry(self, name: str, mode: str, type: str, oid: str) -> None:
+        """Add an object that is already in the repo."""
+        self.entries[name] = TreeEntry(mode=mode, type=type, oid=oid, name=name)
+
+    def remove(self, name: str) -> None:
+        del self.entries[name]
+
+    def commit(self, msg: str) -> str:
+        tree = make_tree(self.repo_path, list(self.entries.values()))
+        self.head = commit_tree(self.repo_path, tree=tree, parent=self.head, msg=msg)
+        return self.head
+
+
+def commit_maintenance(
+    repo_path: str, info: RepoInfo, start: str = "refs/remotes/afs_remote/HEAD"
+) -> str:
+    """
+    Make our four maintenance commits on top of start without a checkout.
+
+    Instead of checking out the whole afs HEAD and going through the
+    index four times, we only read the few blobs we need, write new
+    blobs and trees directly, and chain the commits on top of start.
+    Our fixed files are referred to by their precomputed ids, so only
+    the merged gitignore and the readme are hashed for each repo.
+    The trees and commit messages match the checkout-based commits.
+
+    Afterwards, refs/heads/master points at the last commit and HEAD points
+    at refs/heads/master, just like after the checkout-based path.
+    Returns the id of the last commit.
+    """
+    head = git(repo_path, "rev-parse", "--verify", f"{start}^{{commit}}")
+    builder = TreeBuilder(repo_path=repo_path, head=head.decode().strip())
+
+    # The fixed files are already hashed, we just make sure they're in the repo
+    assets = get_assets()
+    assets.write_objects(objects_dir(repo_path))
+
+    builder.add_entry("LICENSE.md", assets.license.mode, "blob", assets.license.oid)
+    builder.commit("MAINT: add standard license file")
+
+    existing = builder.entries.get(".gitignore")
+    if existing is None:
+        old_gitignore = ""
+        new_gitignore = assets.gitignore.data.decode()
+        builder.add_entry(
+            ".gitignore", assets.gitignore.mode, "blob", assets.gitignore.oid
+        )
+    else:
+        old_gitignore = _decode(read_blob(repo_path, existing.oid))
+        new_gitignore = merge_gitignore(old_gitignore)
+        builder.add_blob(".gitignore", new_gitignore.encode(), mode=existing.mode)
+    report_newly_ignored(
+        repo_path=repo_path, old=old_gitignore, new=new_gitignore, treeish=builder.head
+    )
+    builder.commit("MAINT: update gitignore")
+
+    if ".github" in builder.entries:
+        # Same as copytree refusing to overwrite an existing folder
+        raise FileExistsError(f"{info.afs_source} already has a .github folder")
+    builder.add_entry(".github", "040000", "tree", assets.github_folder.oid)
+    builder.commit("MAINT: add github templates")
+
+    readme_entries = sorted(
+        (
+            entry
+            for entry in builder.entries.values()
+            if entry.type == "blob"
+            and fnmatch.fnmatchcase(entry.name.lower(), "*readme*")
+        ),
+        key=lambda entry: entry.name,
+    )
+    original_readme_info = [
+        (entry.name, _decode(read_blob(repo_path, entry.oid)))
+        for entry in readme_entries
+    ]
+    for entry in readme_entries:
+        builder.remove(entry.name)
+    readme_text = render_readme(
+        repo_info=info, original_readme_info=original_readme_info
+    )
+    builder.add_blob("README.md", readme_text.encode())
+    final = builder.commit("MAINT: update readme")
+
+    git(repo_path, "update-ref", "refs/heads/master", final)
+    git(repo_path, "symbolic-ref", "HEAD", "refs/heads/master")
+    return final
+
+
+def create_branches(repo_path: str, remote: str = "afs_remote") -> int:
+    """
+    Make a same-named local branch for every branch fetched from remote.
+
+    The remote's branches are under refs/remotes/<remote>/refs/heads/,
+    as build_local_repo fetches them. The listing is streamed from
+    for-each-ref straight into one update-ref --stdin transaction, so
+    thousands of branches cost two git processes instead of one call each,
+    and either every branch is created or none are.
+
+    master is skipped, since ours is already the remote HEAD with our
+    commits on top. Returns the number of branches created.
+    """
+    prefix = f"refs/remotes/{remote}/refs/heads/"
+    head = git(repo_path, "rev-parse", f"refs/remotes/{remote}/HEAD").decode().strip()
+    count = 0
+    with (
+        subprocess.Popen(
+            ["git", "for-each-ref", "--format=%(objectname) %(refname)", prefix],
+            cwd=repo_path,
+            stdout=subprocess.PIPE,
+        ) as lister,
+        subprocess.Popen(
+            ["git", "update-ref", "--stdin"],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+        ) as updater,
+    ):
+        for line in lister.stdout:
+            sha, ref = line.decode().rstrip("\n").split(" ", 1)
+            branch = ref.removeprefix(prefix)
+            if branch == "master":
+                if sha != head:
+                    logger.warning(
+                        f"{remote} branch master is not {remote} HEAD and is replaced by it"
+                    )
+                continue
+            logger.debug(f"Found branch named {branch}")
+            updater.stdin.write(f"create refs/heads/{branch} {sha}\n".encode())
+            count += 1
+    for proc in (lister, updater):
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    return count
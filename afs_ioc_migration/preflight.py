@@ -0,0 +1,249 @@
+import dataclasses
+import json
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, TextIO
+
+from .assets import get_assets
+from .constants import MAX_BLOB_SIZE
+from .gitignore import newly_ignored, tracked_paths
+from .modify import merge_gitignore
+from .plan import Plan
+from .rename import RepoInfo
+
+logger = logging.getLogger(__name__)
+
+# GitHub rejects any single push larger than this
+MAX_PUSH_SIZE = 2 * 1024**3
+
+
+@dataclasses.dataclass
+class PreflightReport:
+    """
+    What we could learn about one afs repo without changing anything.
+
+    errors are problems that would make the migration fail,
+    warnings are things that are worth a look but won't stop it.
+    """
+
+    afs_path: str
+    name: str = ""
+    empty: bool = False
+    head: str = ""
+    branches: int = 0
+    tags: int = 0
+    other_refs: int = 0
+    pack_size: int = 0
+    loose_size: int = 0
+    largest_blob: int = 0
+    newly_ignored: list[str] = dataclasses.field(default_factory=list)
+    oversized_blobs: list[dict[str, str | int]] = dataclasses.field(
+        default_factory=list
+    )
+    errors: list[str] = dataclasses.field(default_factory=list)
+    warnings: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _git(afs_path: str, *args: str, input: str | None = None) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=afs_path,
+        input=input,
+        capture_output=True,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+
+
+def check_repo(
+    afs_path: str,
+    max_blob_size: int = MAX_BLOB_SIZE,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> PreflightReport:
+    """
+    Run every read-only check on one afs repo.
+
+    Pass resolve=False if afs_path is already a resolved path.
+    If a plan is provided, the name comes from the plan, which also
+    catches names that collide with another repo's.
+
+    This never raises for a problem with the repo itself,
+    problems are recorded in the report's errors instead.
+    """
+    report = PreflightReport(afs_path=afs_path)
+    try:
+        if plan is not None:
+            report.name = plan.get_info(afs_path).name
+        else:
+            report.name = RepoInfo.from_afs(
+                afs_source=afs_path, org="", resolve=resolve
+            ).name
+    except (ValueError, IndexError) as exc:
+        report.errors.append(f"Invalid name: {exc}")
+    try:
+        _check_refs(report)
+        if not report.empty:
+            if _check_head(report):
+                _check_gitignore(report)
+        _check_sizes(report)
+        _check_blobs(report, max_blob_size=max_blob_size)
+    except subprocess.CalledProcessError as exc:
+        report.errors.append(f"git {exc.cmd[1]} failed: {exc.stderr.strip()}")
+    except OSError as exc:
+        report.errors.append(f"Cannot read repo: {exc}")
+    for error in report.errors:
+        logger.warning(f"{afs_path}: {error}")
+    return report
+
+
+def _check_refs(report: PreflightReport) -> None:
+    refs = _git(report.afs_path, "for-each-ref", "--format=%(refname)").split()
+    for ref in refs:
+        if ref.startswith("refs/heads/"):
+            report.branches += 1
+        elif ref.startswith("refs/tags/"):
+            report.tags += 1
+        else:
+            report.other_refs += 1
+    if not refs:
+        report.empty = True
+        report.errors.append("Empty repo: there are no branches or tags to migrate")
+
+
+def _check_head(report: PreflightReport) -> bool:
+    """HEAD becomes master, so it must point at a commit. Returns True if so."""
+    head = subprocess.run(
+        ["git", "symbolic-ref", "-q", "HEAD"],
+        cwd=report.afs_path,
+        capture_output=True,
+        universal_newlines=True,
+    ).stdout.strip()
+    report.head = head or "detached"
+    # One batch-check call answers both questions without reading any content
+    lines = _git(
+        report.afs_path,
+        "cat-file",
+        "--batch-check=%(objecttype)",
+        input="HEAD^{commit}\nHEAD:.github\n",
+    ).splitlines()
+    if lines[0] != "commit":
+        report.errors.append(f"Broken HEAD: {report.head} does not point at a commit")
+        return False
+    if not lines[1].endswith("missing"):
+        report.errors.append("HEAD already has a .github folder")
+    return True
+
+
+def _check_gitignore(report: PreflightReport) -> None:
+    """Find tracked files that our merged gitignore would start ignoring."""
+    try:
+        old = _git(report.afs_path, "cat-file", "blob", "HEAD:.gitignore")
+    except subprocess.CalledProcessError:
+        old = ""
+    new = merge_gitignore(old) if old else get_assets().gitignore.data.decode()
+    report.newly_ignored = newly_ignored(
+        tracked_paths(report.afs_path), old.splitlines(), new.splitlines()
+    )
+    if report.newly_ignored:
+        report.warnings.append(
+            f"The new gitignore ignores {len(report.newly_ignored)} tracked files"
+        )
+
+
+def _check_sizes(report: PreflightReport) -> None:
+    stats = {}
+    for line in _git(report.afs_path, "count-objects", "-v").splitlines():
+        key, value = line.split(":", 1)
+        stats[key] = value.strip()
+    # count-objects reports sizes in KiB
+    report.pack_size = int(stats.get("size-pack", 0)) * 1024
+    report.loose_size = int(stats.get("size", 0)) * 1024
+    if report.pack_size + report.loose_size > MAX_PUSH_SIZE:
+        report.warnings.append(
+            "Repo is larger than github's push limit and may need to be pushed in parts"
+        )
+
+
+def _check_blobs(report: PreflightReport, max_blob_size: int) -> None:
+    """
+    Find blobs over the size limit.
+
+    Listing every object's size from the object database is cheap,
+    only if we find a large blob do we walk the history to find its
+    path and to check that a push would actually include it.
+    """
+    oversized = {}
+    output = _git(
+        report.afs_path,
+        "cat-file",
+        "--batch-all-objects",
+        "--batch-check=%(objecttype) %(objectname) %(objectsize)",
+    )
+    for line in output.splitlines():
+        objtype, oid, size = line.split()
+        if objtype != "blob":
+            continue
+        report.largest_blob = max(report.largest_blob, int(size))
+        if int(size) > max_blob_size:
+            oversized[oid] = int(size)
+    if not oversized:
+        return
+    paths = {}
+    for line in _git(report.afs_path, "rev-list", "--objects", "--all").splitlines():
+        oid, _, path = line.partition(" ")
+        if oid in oversized:
+            paths[oid] = path
+    for oid, size in sorted(oversized.items(), key=lambda item: -item[1]):
+        if oid not in paths:
+            report.warnings.append(f"Unreachable large blob {oid} will not be pushed")
+            continue
+        report.oversized_blobs.append({"oid": oid, "path": paths[oid], "size": size})
+        report.errors.append(
+            f"{paths[oid]} is {size} bytes, over github's {max_blob_size} byte limit"
+        )
+
+
+def preflight_many(
+    paths: Iterable[str],
+    jobs: int = 1,
+    max_blob_size: int = MAX_BLOB_SIZE,
+    resolve: bool = True,
+    plan: Plan | None = None,
+) -> list[PreflightReport]:
+    """Check many afs repos at the same time, returning reports in order."""
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return list(
+            executor.map(
+                lambda path: check_repo(
+                    path, max_blob_size=max_blob_size, resolve=resolve, plan=plan
+                ),
+                paths,
+            )
+        )
+
+
+def write_report(reports: list[PreflightReport], fd: TextIO) -> None:
+    """Write the reports and a short summary as json."""
+    failed = [report for report in reports if not report.ok]
+    json.dump(
+        {
+            "summary": {
+                "total": len(reports),
+                "ok": len(reports) - len(failed),
+                "failed": len(failed),
+                "empty": sum(1 for report in reports if report.empty),
+            },
+            "repos": [
+                dict(dataclasses.asdict(report), ok=report.ok) for report in reports
+            ],
+        },
+        fd,
+        indent=2,
+    )
+    fd.write("\n")
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping
+
+logger = logging.getLogger(__name__)
+
+MUTATING_VERBS = frozenset(("POST", "PATCH", "PUT", "DELETE"))
+
+
+class RateLimiter:
+    """
+    Pace GitHub API requests based on what GitHub tells us.
+
+    One instance is meant to be shared by every thread in the process,
+    see ``default_limiter``.
+
+    - Mutating requests (POST, PATCH, PUT, DELETE) are spaced out by at
+      least write_interval seconds, as GitHub recommends.
+    - Read requests go through immediately.
+    - When X-RateLimit-Remaining drops below low_water, all requests are
+      spread out evenly over the time left until X-RateLimit-Reset.
+    - When the limit is exhausted, or GitHub sends Retry-After, all
+      requests wait until GitHub says we may try again.
+    """
+
+    def __init__(
+        self,
+        write_interval: float = 1.0,
+        low_water: int = 50,
+        secondary_backoff: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.write_interval = write_interval
+        self.low_water = low_water
+        self.secondary_backoff = secondary_backoff
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._next_write = 0.0
+        self._next_any = 0.0
+        self._blocked_until = 0.0
+        self._remaining: int | None = None
+        self._reset_at = 0.0
+
+    def acquire(self, verb: str) -> float:
+        """
+        Block until a request with this HTTP verb may be sent.
+
+        Returns the number of seconds we waited.
+        """
+        with self._lock:
+            now = self.clock()
+            start = max(now, self._blocked_until, self._next_any)
+            if self._remaining is not None and self._remaining < self.low_water:
+                # Spread what is left of the budget until the reset
+                spacing = max(self._reset_at - now, 0) / max(self._remaining, 1)
+                self._next_any = start + spacing
+                if self._remaining > 0:
+                    self._remaining -= 1
+            if verb.upper() in MUTATING_VERBS:
+                start = max(start, self._next_write)
+                self._next_write = start + self.write_interval
+            delay = start - now
+        if delay > 0:
+            logger.debug(f"Waiting {delay:.2f}s before {verb} to respect rate limits")
+            self.sleep(delay)
+        return max(delay, 0)
+
+    def update(self, headers: Mapping[str, str] | None, status: int = 200) -> bool:
+        """
+        Record the rate limit information from a response's headers.
+
+        Returns True if the response was a rate limit rejection that is
+        worth retrying after waiting, False otherwise.
+        """
+        headers = headers or {}
+        remaining = _get_header(headers, "X-RateLimit-Remaining")
+        reset = _get_header(headers, "X-RateLimit-Reset")
+        retry_after = _get_header(headers, "Retry-After")
+        with self._lock:
+            now = self.clock()
+            if remaining is not None and reset is not None:
+                try:
+                    self._remaining = int(remaining)
+                    reset_in = float(reset) - self.wall_clock()
+                except ValueError:
+                    logger.debug(
+                        f"Ignoring bad rate limit headers {remaining=} {reset=}"
+                    )
+                else:
+                    self._reset_at = now + max(reset_in, 0)
+                    if self._remaining == 0:
+                        self._blocked_until = max(self._blocked_until, self._reset_at)
+            if retry_after is not None:
+                wait = self._parse_retry_after(retry_after)
+                self._blocked_until = max(self._blocked_until, now + wait)
+            if status not in (403, 429):
+                return False
+            if retry_after is not None or self._remaining == 0:
+                return True
+            if remaining is None:
+                # Secondary rate limits don't always say how long to wait
+                self._blocked_until = max(
+                    self._blocked_until, now + self.secondary_backoff
+                )
+                return True
+            return False
+
+    def _parse_retry_after(self, value: str) -> float:
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - self.wall_clock(), 0)
+        except (TypeError, ValueError):
+            return self.secondary_backoff
+
+
+def _get_header(headers: Mapping[str, str], name: str) -> str | None:
+    """Case-insensitive header lookup that works for dicts and HTTPMessages."""
+    value = headers.get(name)
+    if value is not None:
+        return value
+    lower = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower:
+            return value
+    return None
+
+
+# The one limiter shared by every GitHub client in this process
+default_limiter = RateLimiter()
@@ -4,6 +4,15 @@ from pathlib import Path
 
 T = typing.TypeVar("T")
 
+# The custom properties every migrated repo is created with
+CUSTOM_PROPERTIES = {
+    "type": "EPICS IOC",
+    "protect_default": "true",
+    "protect_master": "true",
+    "protect_gh_pages": "false",
+    "required_checks": "None",
+}
+
 
 @dataclasses.dataclass(frozen=True)
 class RepoInfo:
@@ -18,11 +27,13 @@ class RepoInfo:
     area: str
 
     @classmethod
-    def from_afs(cls: type[T], afs_source: str, org: str) -> T:
+    def from_afs(cls: type[T], afs_source: str, org: str, resolve: bool = True) -> T:
         """
         Create a RepoInfo instance given the pull path to the afs source.
+
+        Pass resolve=False if afs_source is already a resolved path.
         """
-        name = rename(afs_source)
+        name = rename(afs_source, resolve=resolve)
         area = name.split("-")[1]
         github_url = f"https://github.com/{org}/{name}.git"
         github_ssh = f"git@github.com:{org}/{name}.git"
@@ -34,6 +45,11 @@ class RepoInfo:
             area=area,
         )
 
+    @property
+    def topics(self) -> list[str]:
+        """The github topics the repo is given."""
+        return ["epics", "epics-ioc", f"ecs-epics-ioc-{self.area}"]
+
 
 afs_areas = [
     "common",
@@ -64,7 +80,7 @@ area_renames = {
 }
 
 
-def rename(old_path: str) -> str:
+def rename(old_path: str, resolve: bool = True) -> str:
     """
     Given an old path or partial path to an afs repository, get the new name.
 
@@ -74,9 +90,14 @@ def rename(old_path: str) -> str:
 
     We also support one layer deeper because it exists for some reason
     - /some/long/path/ioc/xpp/ccm/piMotion.git -> ioc-xpp-ccm-piMotion
+
+    Resolving the path touches the filesystem, which is slow on afs.
+    Pass resolve=False if old_path is already a resolved path.
     """
     # Split the old path and take the last 3
-    path = Path(old_path).resolve()
+    path = Path(old_path)
+    if resolve:
+        path = path.resolve()
     if path.parts[-3] == "ioc":
         ioc_literal = path.parts[-3]
         area = path.parts[-2]
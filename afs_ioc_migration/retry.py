@@ -0,0 +1,91 @@
+import dataclasses
+import random
+import re
+from urllib.error import HTTPError, URLError
+
+# How a failed migration stage should be handled
+TRANSIENT_API = "transient api"
+TRANSIENT_PUSH = "transient push"
+PERMANENT = "permanent"
+
+# Status codes github uses when trying again later should work
+_TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+# What git says when the network, not the repo, is the problem
+_TRANSIENT_GIT = re.compile(
+    "|".join(
+        (
+            r"connection (?:reset|refused|timed out|closed)",
+            r"could not resolve host",
+            r"temporary failure in name resolution",
+            r"remote end hung up unexpectedly",
+            r"early eof",
+            r"broken pipe",
+            r"rpc failed",
+            r"operation timed out",
+            r"(?:ssh|kex)_exchange_identification",
+        )
+    ),
+    re.IGNORECASE,
+)
+
+
+def classify(exc: BaseException) -> str:
+    """
+    Decide if a failure is worth trying again.
+
+    github errors that mean "not now" (server errors, 429, and 403s from
+    a rate limit) and network errors reaching the api are transient api
+    failures. git errors that say the connection dropped, e.g. during
+    a push over ssh, are transient push failures. Anything else, such
+    as a bad token, a repo that already exists, or a broken afs repo,
+    will fail the same way next time, so it is permanent.
+    """
+    if isinstance(exc, HTTPError):
+        if exc.code in _TRANSIENT_STATUS:
+            return TRANSIENT_API
+        headers = exc.headers or {}
+        if exc.code == 403 and (
+            "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+        ):
+            return TRANSIENT_API
+        return PERMANENT
+    # Not imported up front, the cli only needs it once something failed
+    import socket
+
+    if isinstance(exc, (URLError, ConnectionError, TimeoutError, socket.gaierror)):
+        return TRANSIENT_API
+    # Both GitCommandError and CalledProcessError keep git's stderr
+    stderr = getattr(exc, "stderr", None) or ""
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors="replace")
+    if _TRANSIENT_GIT.search(stderr):
+        return TRANSIENT_PUSH
+    return PERMANENT
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """
+    How often and how soon to try a repo again after a transient failure.
+
+    The wait doubles with every attempt, from base_delay up to max_delay,
+    and is jittered between half and all of that so that repos that
+    failed together don't all come back at once. If github said how
+    long to wait in Retry-After, we wait at least that long.
+    """
+
+    max_attempts: int = 5
+    base_delay: float = 5.0
+    max_delay: float = 300.0
+
+    def delay(self, attempt: int, exc: BaseException | None = None) -> float:
+        """Seconds to wait after the given attempt, counting from 1, failed."""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        if isinstance(exc, HTTPError) and exc.headers is not None:
+            try:
+                delay = max(delay, float(exc.headers.get("Retry-After", 0)))
+            except ValueError:
+                pass
+        return delay
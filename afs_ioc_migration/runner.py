@@ -0,0 +1,185 @@
+import logging
+from typing import Iterable
+
+from .constants import DRY_RUN_DIR, LEASE_TTL
+from .coordinator import Coordinator
+from .dryrun import prune_outputs
+from .github_client import get_client
+from .journal import Journal
+from .logs import grouped_logging
+from .org_index import OrgIndex
+from .pipeline import MigrationPipeline, RepoResult
+from .retry import RetryPolicy
+from .schedule import RepoCost, largest_first
+from .timing import SpanRecorder
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_many(
+    paths: Iterable[str],
+    org: str,
+    dry_run: bool,
+    jobs: int = 1,
+    stop_on_error: bool = False,
+    publish_jobs: int = 0,
+    queue_size: int = 0,
+    use_org_index: bool = True,
+    journal_path: str = "",
+    schedule_largest_first: bool = False,
+    known_costs: dict[str, RepoCost] | None = None,
+    timings_path: str = "",
+    prometheus_path: str = "",
+    api_url: str = "",
+    dry_run_budget: int = 0,
+    retry: RetryPolicy | None = None,
+    work_dir: str = "",
+    lease_ttl: float = LEASE_TTL,
+    **prepare_kwargs,
+) -> int:
+    """
+    Migrate many afs repos, overlapping the local and network work.
+
+    Returns the number of repos that failed to migrate.
+
+    Up to jobs repos are prepared locally at the same time, and up to
+    publish_jobs (default: same as jobs) are pushed to github at the
+    same time, with at most queue_size (default: same as jobs) prepared
+    repos waiting in between. See MigrationPipeline for the details.
+
+    Transient failures, e.g. github server errors, rate limits and dropped
+    pushes, send the repo to the back of the queue to try again after
+    a backoff from retry (default: RetryPolicy()), while the other repos
+    carry on. A permanent HTTPError, e.g. a bad token, stops the run,
+    as does any other error that isn't retried if stop_on_error is True.
+    When we stop, no new repos are started, the repos already in
+    progress are allowed to finish, and then the error is re-raised.
+
+    With more than one job, each repo's log lines are held back and
+    written together once that repo is done.
+
+    If use_org_index is True, we list every repo in the org once up front
+    instead of asking github about each repo separately.
+
+    If journal_path is provided, finished stages are recorded in a sqlite
+    journal there so that a rerun can skip everything already done.
+
+    If schedule_largest_first is True, we estimate each repo's cost from
+    its size on disk and start the most expensive repos first,
+    logging the predicted and actual time of each repo at the end.
+    Repos in known_costs, e.g. from an inventory manifest, are not measured.
+
+    Every stage of every repo is timed, and a summary of the slowest
+    stages and repos is logged at the end. If timings_path is provided,
+    each span is also appended there as a json line, and if
+    prometheus_path is provided, the per-stage summary is written there
+    for the node exporter's textfile collector.
+
+    If api_url is provided, every api call goes to that server instead of
+    api.github.com, e.g. the fake github in the benchmark package.
+
+    If dry_run_budget is provided, dry runs remove the oldest outputs
+    in the dry run directory, before and after the run, until the rest
+    use at most that many bytes. Outputs from this run are never removed.
+
+    If work_dir is provided, this is one of several workers, possibly on
+    other hosts, sharing the migration through that directory on a shared
+    filesystem. The first worker's paths become the shared work list, and
+    every worker claims repos from it with leases that expire lease_ttl
+    seconds after the worker stops renewing them, e.g. because it died.
+    See Coordinator for the details. Only the repos this worker migrated
+    count towards the returned number of failures.
+
+    Any other keyword arguments are passed on to every prepare_repo call,
+    see that function for the options.
+    """
+    jobs = max(jobs, 1)
+    publish_jobs = publish_jobs or jobs
+    queue_size = queue_size or jobs
+    org_index = OrgIndex.fetch(org, gh=get_client(api_url)) if use_org_index else None
+    journal = Journal(journal_path) if journal_path else None
+    recorder = SpanRecorder(path=timings_path, prometheus_path=prometheus_path)
+    dry_run_dir = prepare_kwargs.get("dry_run_dir") or DRY_RUN_DIR
+    if dry_run and dry_run_budget:
+        prune_outputs(dry_run_dir=dry_run_dir, budget=dry_run_budget)
+    predictions = {}
+    if schedule_largest_first:
+        costs = largest_first(paths, jobs=jobs, known=known_costs)
+        predictions = {cost.afs_path: cost.predicted for cost in costs}
+        paths = list(predictions)
+    coordinator = None
+    if work_dir:
+        coordinator = Coordinator(work_dir, ttl=lease_ttl)
+        paths = coordinator.share(paths, org=org, dry_run=dry_run)
+        coordinator.start()
+    with grouped_logging(enabled=jobs > 1 or publish_jobs > 1) as grouper:
+        pipeline = MigrationPipeline(
+            org=org,
+            dry_run=dry_run,
+            prepare_jobs=jobs,
+            publish_jobs=publish_jobs,
+            queue_size=queue_size,
+            stop_on_error=stop_on_error,
+            grouper=grouper,
+            journal=journal,
+            org_index=org_index,
+            recorder=recorder,
+            api_url=api_url,
+            retry=retry,
+            coordinator=coordinator,
+            **prepare_kwargs,
+        )
+        try:
+            results = pipeline.run(paths)
+        finally:
+            if coordinator is not None:
+                coordinator.close()
+                logger.info(
+                    f"Work list in {work_dir}: "
+                    + ", ".join(
+                        f"{count} {state}"
+                        for state, count in coordinator.status(paths).items()
+                    )
+                )
+            if journal is not None:
+                journal.close()
+            recorder.close()
+            recorder.log_summary()
+    if dry_run and dry_run_budget:
+        prune_outputs(
+            dry_run_dir=dry_run_dir,
+            budget=dry_run_budget,
+            keep=frozenset(result.path for result in results if result.path),
+        )
+    if predictions:
+        log_predictions(results=results, predictions=predictions)
+    n_retried = sum(1 for result in results if result.attempts > 1)
+    if n_retried:
+        logger.info(f"{n_retried} repos needed more than one attempt")
+    n_skipped = sum(1 for result in results if result.skipped)
+    if n_skipped:
+        logger.info(f"Skipped {n_skipped} repos already migrated in earlier runs")
+    return sum(1 for result in results if not result.ok)
+
+
+def log_predictions(results: list[RepoResult], predictions: dict[str, float]) -> None:
+    """Compare the predicted and actual time of every repo we worked on."""
+    # With a coordinator, we may have worked on repos we didn't predict
+    worked = [
+        result
+        for result in results
+        if not result.skipped and result.afs_path in predictions
+    ]
+    for result in worked:
+        predicted = predictions[result.afs_path]
+        logger.info(
+            f"{result.afs_path}: predicted {predicted:.1f}s, "
+            f"actual {result.duration:.1f}s"
+        )
+    predicted_total = sum(predictions[result.afs_path] for result in worked)
+    actual_total = sum(result.duration for result in worked)
+    if predicted_total:
+        logger.info(
+            f"Predicted {predicted_total:.0f}s of work in total, actual "
+            f"{actual_total:.0f}s ({actual_total / predicted_total:.2f}x)"
+        )
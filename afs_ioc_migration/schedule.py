@@ -0,0 +1,109 @@
+import dataclasses
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# A rough cost model for predicting how long one repo takes to migrate.
+# Compare against the predicted vs actual lines in the log to tune these.
+SECONDS_PER_REPO = 10.0
+SECONDS_PER_MB = 0.5
+SECONDS_PER_REF = 0.05
+
+
+@dataclasses.dataclass(frozen=True)
+class RepoCost:
+    """How big an afs repo is on disk and how long we expect it to take."""
+
+    afs_path: str
+    size: int = 0
+    refs: int = 0
+
+    @property
+    def predicted(self) -> float:
+        """Predicted seconds of work to migrate this repo."""
+        return (
+            SECONDS_PER_REPO
+            + SECONDS_PER_MB * self.size / 1024**2
+            + SECONDS_PER_REF * self.refs
+        )
+
+
+def _dir_size(path: str) -> int:
+    """Total size of the files under path, 0 if it doesn't exist."""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            total += _dir_size(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _count_refs(path: str) -> int:
+    """Count the loose ref files under path, 0 if it doesn't exist."""
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    return sum(
+        _count_refs(entry.path) if entry.is_dir(follow_symlinks=False) else 1
+        for entry in entries
+    )
+
+
+def estimate_cost(afs_path: str) -> RepoCost:
+    """
+    Estimate the cost of migrating a bare repo from the filesystem alone.
+
+    This only lists directories and reads packed-refs, it never runs git.
+    Refs that are both packed and loose are counted twice, which is
+    close enough for scheduling.
+    """
+    refs = _count_refs(os.path.join(afs_path, "refs"))
+    try:
+        with open(os.path.join(afs_path, "packed-refs")) as fd:
+            refs += sum(1 for line in fd if line[0] not in "#^")
+    except OSError:
+        pass
+    return RepoCost(
+        afs_path=afs_path,
+        size=_dir_size(os.path.join(afs_path, "objects")),
+        refs=refs,
+    )
+
+
+def largest_first(
+    paths: Iterable[str], jobs: int = 1, known: dict[str, RepoCost] | None = None
+) -> list[RepoCost]:
+    """
+    Estimate every repo's cost and order them from most to least expensive.
+
+    Repos in known, e.g. from an inventory manifest, are not measured again.
+
+    When workers take repos from a shared queue in this order, the long
+    repos start right away and the short ones fill in the gaps at the end,
+    instead of one huge repo late in the list running on its own.
+    """
+    known = known or {}
+
+    def get_cost(afs_path: str) -> RepoCost:
+        if afs_path in known:
+            return known[afs_path]
+        return estimate_cost(afs_path)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        costs = list(executor.map(get_cost, paths))
+    costs.sort(key=lambda cost: cost.predicted, reverse=True)
+    total = sum(cost.predicted for cost in costs)
+    logger.info(
+        f"Scheduled {len(costs)} repos largest first, "
+        f"predicting {total:.0f}s of work in total"
+    )
+    return costs
@@ -0,0 +1,243 @@
+import dataclasses
+import logging
+import subprocess
+
+from .cache import update_mirror, use_alternates
+from .plumbing import MAINTENANCE_SUBJECTS, commit_maintenance, git
+from .rename import RepoInfo
+from .timing import RepoTimer, repo_bytes
+
+logger = logging.getLogger(__name__)
+
+MASTER = "refs/heads/master"
+# The merge commit that brings new afs commits into github master
+SYNC_SUBJECT = "MAINT: merge new commits from afs"
+
+
+class SyncConflictError(RuntimeError): ...
+
+
+def ls_remote(url: str) -> dict[str, str]:
+    """
+    Map HEAD and every branch and tag of a remote to its id, without fetching.
+
+    Peeled tag lines are left out, so annotated tags map to the tag object.
+    """
+    output = subprocess.run(
+        ["git", "ls-remote", url],
+        capture_output=True,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    refs = {}
+    for line in output.splitlines():
+        sha, ref = line.split("\t", 1)
+        if ref == "HEAD" or (
+            ref.startswith(("refs/heads/", "refs/tags/")) and not ref.endswith("^{}")
+        ):
+            refs[ref] = sha
+    return refs
+
+
+def is_ancestor(repo_path: str, ancestor: str, descendant: str) -> bool:
+    """True if ancestor is in descendant's history, False if not or if it's missing."""
+    return (
+        subprocess.run(
+            ["git", "merge-base", "--is-ancestor", ancestor, descendant],
+            cwd=repo_path,
+            capture_output=True,
+        ).returncode
+        == 0
+    )
+
+
+@dataclasses.dataclass
+class RefUpdate:
+    """One ref to push to github, and what github has there now."""
+
+    ref: str
+    new: str
+    # Empty if github doesn't have this ref yet
+    old: str = ""
+
+    @property
+    def refspec(self) -> str:
+        return f"{self.new}:{self.ref}"
+
+
+@dataclasses.dataclass
+class SyncPlan:
+    """What a delta sync will push to a github repo that already has commits."""
+
+    updates: list[RefUpdate] = dataclasses.field(default_factory=list)
+    # Refs we won't touch, with the reason
+    conflicts: dict[str, str] = dataclasses.field(default_factory=dict)
+    up_to_date: int = 0
+
+    def describe(self) -> str:
+        return (
+            f"{len(self.updates)} refs to push, {self.up_to_date} up to date, "
+            f"{len(self.conflicts)} conflicts"
+        )
+
+
+def synced_head(path: str, master: str) -> str:
+    """
+    The afs HEAD that master was last built from, if master is all ours.
+
+    That is the commit below our maintenance commits, or the afs parent
+    of our last sync merge. Returns an empty string if master ends in
+    anyone else's commits.
+    """
+    subjects = (
+        git(
+            path,
+            "log",
+            "--format=%s",
+            f"--max-count={len(MAINTENANCE_SUBJECTS)}",
+            master,
+        )
+        .decode()
+        .splitlines()
+    )
+    if subjects[:1] == [SYNC_SUBJECT]:
+        rev = f"{master}^2"
+    elif tuple(reversed(subjects)) == MAINTENANCE_SUBJECTS:
+        rev = f"{master}~{len(MAINTENANCE_SUBJECTS)}"
+    else:
+        return ""
+    return git(path, "rev-parse", rev).decode().strip()
+
+
+def build_sync_repo(
+    info: RepoInfo,
+    path: str,
+    github_refs: dict[str, str],
+    github_url: str,
+    cache_dir: str = "",
+    timer: RepoTimer | None = None,
+) -> SyncPlan:
+    """
+    Fetch what github is missing from afs into path and plan the pushes.
+
+    github_refs is ls_remote of github_url. Branches and tags that are
+    the same on both sides are never fetched. New ones are pushed as is,
+    branches that moved forward on afs are fast-forwarded, and anything
+    that would need a force push on github is reported as a conflict.
+
+    github master is afs HEAD with our maintenance commits on top, or
+    one of our sync merges. If afs HEAD moved forward since then, the
+    new afs commits are merged into master, so master only ever moves
+    forward and can stay protected on github. The merge has the tree
+    we would get by making the maintenance commits again on the new
+    HEAD, which we do without a checkout. If github master has commits
+    that aren't ours, it's a conflict.
+
+    If a cache_dir is provided, afs is fetched through the local mirror
+    there, see build_local_repo.
+    """
+    if timer is None:
+        timer = RepoTimer(repo=info.afs_source)
+    plan = SyncPlan()
+    with timer.span("compare"):
+        afs_refs = ls_remote(info.afs_source)
+        if "HEAD" not in afs_refs:
+            raise RuntimeError(f"{info.afs_source} has no HEAD to sync")
+        wanted = {}
+        for ref, sha in afs_refs.items():
+            if ref in ("HEAD", MASTER):
+                continue
+            if github_refs.get(ref) == sha:
+                plan.up_to_date += 1
+            elif ref.startswith("refs/tags/") and ref in github_refs:
+                plan.conflicts[ref] = "tag points somewhere else on github"
+            else:
+                wanted[ref] = sha
+        extra = set(github_refs) - set(afs_refs) - {MASTER, "HEAD"}
+        if extra:
+            logger.info(f"Leaving {len(extra)} refs that only exist on github alone")
+
+    logger.info(f"Fetching afs HEAD and {len(wanted)} new or moved refs")
+    with timer.span("fetch") as span:
+        git(path, "init", "--quiet")
+        source = info.afs_source
+        if cache_dir:
+            source = update_mirror(afs_path=info.afs_source, cache_dir=cache_dir)
+            use_alternates(repo_path=path, mirror=source)
+        git(
+            path,
+            "fetch",
+            "--quiet",
+            "--no-tags",
+            source,
+            "+HEAD:refs/remotes/afs_remote/HEAD",
+            *(f"+{ref}:refs/remotes/afs_remote/{ref}" for ref in wanted),
+        )
+        if MASTER in github_refs:
+            # Everything github has in common with afs is already here
+            git(
+                path,
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                github_url,
+                f"+{MASTER}:refs/remotes/github/master",
+            )
+        if timer.recording:
+            span.bytes = repo_bytes(path)
+
+    for ref, sha in wanted.items():
+        old = github_refs.get(ref, "")
+        if old and not is_ancestor(path, old, sha):
+            plan.conflicts[ref] = "github has commits that are not on afs"
+        else:
+            logger.info(f"{'Updating' if old else 'Adding'} {ref}")
+            plan.updates.append(RefUpdate(ref=ref, new=sha, old=old))
+
+    afs_head = afs_refs["HEAD"]
+    old_master = github_refs.get(MASTER, "")
+    base = synced_head(path, "refs/remotes/github/master") if old_master else ""
+    if old_master and is_ancestor(path, afs_head, old_master):
+        # Also true if people carried on from our commits on github
+        plan.up_to_date += 1
+    elif old_master and not (base and is_ancestor(path, base, afs_head)):
+        plan.conflicts[MASTER] = "github master has commits that are not ours"
+    else:
+        logger.info("Committing standard files on top of the new afs HEAD")
+        with timer.span("maintenance"):
+            new_master = commit_maintenance(repo_path=path, info=info)
+            if old_master:
+                new_master = (
+                    git(
+                        path,
+                        "commit-tree",
+                        f"{new_master}^{{tree}}",
+                        "-p",
+                        old_master,
+                        "-p",
+                        afs_head,
+                        "-m",
+                        SYNC_SUBJECT,
+                    )
+                    .decode()
+                    .strip()
+                )
+                git(path, "update-ref", "refs/heads/master", new_master)
+        plan.updates.append(RefUpdate(ref=MASTER, new=new_master, old=old_master))
+
+    logger.info(f"Sync plan: {plan.describe()}")
+    return plan
+
+
+def push_sync(path: str, url: str, plan: SyncPlan) -> None:
+    """
+    Push the planned updates in one go.
+
+    Every update is a new ref or a fast-forward, so nothing is force
+    pushed. github rejects any ref that moved in the meantime in a way
+    our update doesn't build on, so those pushes are never overwritten.
+    """
+    if not plan.updates:
+        logger.info("Nothing to push, github is up to date")
+        return
+    git(path, "push", "--quiet", url, *(update.refspec for update in plan.updates))
@@ -12,3 +12,14 @@ def xfail_git_setup():
         ok = False
     if not ok:
         pytest.xfail(reason="git user.name or user.email not configured")
+
+
+class FakePreparedRepo:
+    """Stands in for transfer.PreparedRepo in tests that skip git and github."""
+
+    def __init__(self, afs_path: str) -> None:
+        self.afs_path = afs_path
+        self.cleaned_up = False
+
+    def cleanup(self) -> None:
+        self.cleaned_up = True
@@ -0,0 +1,52 @@
+import subprocess
+from pathlib import Path
+
+from ..assets import get_assets, object_id, write_object
+from .conftest import xfail_git_setup
+
+
+def git(*args: str, cwd: Path, input: bytes | None = None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=str(cwd), input=input, capture_output=True, check=True
+    ).stdout.decode()
+
+
+def test_assets_loaded_once():
+    assert get_assets() is get_assets()
+
+
+def test_ids_match_git(tmp_path: Path):
+    xfail_git_setup()
+    subprocess.run(["git", "init", "--bare", str(tmp_path)], check=True)
+    assets = get_assets()
+    for blob in (assets.license, assets.gitignore):
+        assert object_id("blob", blob.data) == blob.oid
+        assert (
+            git("hash-object", "--stdin", cwd=tmp_path, input=blob.data).strip()
+            == blob.oid
+        )
+    assets.write_objects(tmp_path / "objects")
+    # Git can read every object we wrote, and makes the same tree from them
+    mktree_input = "".join(
+        f"{blob.mode} blob {blob.oid}\t{name}\n"
+        for name, blob in assets.github_folder.blobs.items()
+    )
+    assert (
+        git("mktree", cwd=tmp_path, input=mktree_input.encode()).strip()
+        == assets.github_folder.oid
+    )
+    assert git("cat-file", "-t", assets.github_folder.oid, cwd=tmp_path) == "tree\n"
+    assert (
+        git("cat-file", "blob", assets.license.oid, cwd=tmp_path)
+        == assets.license.data.decode()
+    )
+    git("fsck", "--strict", cwd=tmp_path)
+
+
+def test_write_object_again(tmp_path: Path):
+    oid = write_object(tmp_path, "blob", b"hello\n")
+    path = tmp_path / oid[:2] / oid[2:]
+    mtime = path.stat().st_mtime_ns
+    assert write_object(tmp_path, "blob", b"hello\n") == oid
+    assert path.stat().st_mtime_ns == mtime
+    assert [child.name for child in path.parent.iterdir()] == [oid[2:]]
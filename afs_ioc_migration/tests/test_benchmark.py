@@ -0,0 +1,178 @@
+import io
+import subprocess
+from pathlib import Path
+from urllib.error import HTTPError
+
+import pytest
+from fastcore.net import HTTP4xxClientError
+
+from .. import ratelimit
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.run import (
+    DRY_RUN,
+    LOCAL,
+    SERVER,
+    compare,
+    read_baseline,
+    run_benchmark,
+    write_results,
+)
+from ..benchmark.server import FakeGitHub, Faults
+from ..github_client import GitHubClient
+from ..org_index import OrgIndex
+from ..ratelimit import RateLimiter
+from .conftest import xfail_git_setup
+
+SPEC = FleetSpec(
+    repos=3, areas=("tst", "xpp"), commits=5, files=4, branches=2, tags=1, seed=1
+)
+
+
+def refs(path: str | Path) -> list[str]:
+    return subprocess.check_output(
+        ["git", "for-each-ref", "--format=%(refname)"], cwd=path, text=True
+    ).split()
+
+
+def test_generate_fleet(tmp_path: Path):
+    paths = generate_fleet(tmp_path, SPEC, jobs=2)
+    assert paths == [
+        str(tmp_path / "ioc" / "tst" / "bench0000.git"),
+        str(tmp_path / "ioc" / "xpp" / "bench0001.git"),
+        str(tmp_path / "ioc" / "tst" / "bench0002.git"),
+    ]
+    assert refs(paths[0]) == [
+        "refs/heads/branch00",
+        "refs/heads/branch01",
+        "refs/heads/master",
+        "refs/tags/v0.0.0",
+    ]
+    count = subprocess.check_output(
+        ["git", "rev-list", "--count", "master"], cwd=paths[0], text=True
+    )
+    assert int(count) == SPEC.commits
+    # The same spec always makes the same fleet
+    again = generate_fleet(tmp_path / "again", SPEC)
+    head = ["git", "rev-parse", "master"]
+    assert subprocess.check_output(head, cwd=paths[1]) == subprocess.check_output(
+        head, cwd=again[1]
+    )
+
+
+@pytest.mark.parametrize("checkout", [True, False])
+def test_run_benchmark_local(tmp_path: Path, checkout: bool):
+    xfail_git_setup()
+    paths = generate_fleet(tmp_path / "fleet", SPEC)
+    result = run_benchmark(
+        paths, mode=LOCAL, workdir=tmp_path, spec=SPEC, jobs=2, checkout=checkout
+    )
+    assert result.failed == 0
+    assert result.repos_per_minute > 0
+    assert result.megabytes_per_second > 0
+    assert set(result.stage_stats()) == {"prepare", "publish"}
+    # Every branch and tag was pushed on top of the maintenance commits
+    pushed = tmp_path / "github" / "pcdshub" / "ioc-xpp-bench0001.git"
+    assert {"refs/heads/master", "refs/heads/branch01", "refs/tags/v0.0.0"} <= set(
+        refs(pushed)
+    )
+    subjects = subprocess.check_output(
+        ["git", "log", "--format=%s", "master"], cwd=pushed, text=True
+    ).splitlines()
+    assert subjects[0] == "MAINT: update readme"
+    assert subjects[-1] == "Initial commit"
+
+
+def test_baseline_compare(tmp_path: Path):
+    xfail_git_setup()
+    paths = generate_fleet(tmp_path / "fleet", SPEC)
+    result = run_benchmark(paths, mode=DRY_RUN, workdir=tmp_path, spec=SPEC)
+    assert result.failed == 0
+    # Dry runs leave nothing behind
+    assert not list((tmp_path / "dry_run").iterdir())
+
+    fd = io.StringIO()
+    write_results([result], fd)
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(fd.getvalue())
+    baseline = read_baseline(str(baseline_path))[DRY_RUN]
+    assert baseline["spec"] == result.spec
+
+    comparison = compare(result, baseline)
+    assert comparison["repos_per_minute"]["change"] == pytest.approx(0)
+
+    # Half the throughput is a 50% regression
+    baseline["metrics"]["repos_per_minute"] *= 2
+    comparison = compare(result, baseline)
+    assert comparison["repos_per_minute"]["regression"] == pytest.approx(0.5)
+
+
+@pytest.fixture
+def fast_limiter(monkeypatch: pytest.MonkeyPatch) -> RateLimiter:
+    limiter = RateLimiter(write_interval=0, secondary_backoff=0)
+    monkeypatch.setattr(ratelimit, "default_limiter", limiter)
+    return limiter
+
+
+def test_fake_github_api(tmp_path: Path, fast_limiter: RateLimiter):
+    with FakeGitHub(tmp_path, Faults(rate_limit=100)) as fake:
+        gh = GitHubClient(api_url=fake.url, token="fake", limiter=fast_limiter)
+        try:
+            with pytest.raises(HTTP4xxClientError) as exc_info:
+                gh.repos.list_commits("pcdshub", "ioc-tst-new")
+            assert exc_info.value.code == 404
+            gh.repos.create_in_org(org="pcdshub", name="ioc-tst-new")
+            with pytest.raises(HTTP4xxClientError) as exc_info:
+                gh.repos.list_commits("pcdshub", "ioc-tst-new")
+            assert exc_info.value.code == 409
+            assert exc_info.value.headers["X-RateLimit-Remaining"] == "97"
+            gh.repos.replace_all_topics(
+                owner="pcdshub", repo="ioc-tst-new", names=["a"]
+            )
+            assert fake.repos.topics == {"pcdshub/ioc-tst-new": ["a"]}
+            index = OrgIndex.fetch("pcdshub", gh=gh)
+            assert not index.get("IOC-TST-NEW").has_commits
+        finally:
+            gh.close()
+    assert (tmp_path / "pcdshub" / "ioc-tst-new.git" / "HEAD").is_file()
+    assert fake.counts[("create_in_org", 201)] == 1
+
+
+def test_fake_github_faults(tmp_path: Path, fast_limiter: RateLimiter):
+    faults = Faults(secondary_rate=1.0, retry_after=0)
+    with FakeGitHub(tmp_path, faults) as fake:
+        gh = GitHubClient(
+            api_url=fake.url, token="fake", limiter=fast_limiter, max_retries=2
+        )
+        try:
+            with pytest.raises(HTTP4xxClientError) as exc_info:
+                gh.repos.list_commits("pcdshub", "ioc-tst-new")
+            assert exc_info.value.code == 403
+            # Each rejection was retried after waiting as long as we were told
+            assert fake.counts[("list_commits", 403)] == 3
+
+            fake.faults = Faults(server_error_rate=1.0)
+            with pytest.raises(HTTPError) as exc_info:
+                gh.repos.list_commits("pcdshub", "ioc-tst-new")
+            assert exc_info.value.code == 502
+
+            # The primary limit was used up by the earlier requests
+            fake.faults = Faults(rate_limit=1)
+            gh.aio.max_retries = 0
+            with pytest.raises(HTTPError) as exc_info:
+                gh.repos.list_commits("pcdshub", "ioc-tst-new")
+            assert exc_info.value.code == 403
+            assert exc_info.value.headers["X-RateLimit-Remaining"] == "0"
+        finally:
+            gh.close()
+
+
+def test_run_benchmark_server(tmp_path: Path, fast_limiter: RateLimiter):
+    xfail_git_setup()
+    paths = generate_fleet(tmp_path / "fleet", SPEC)
+    result = run_benchmark(
+        paths, mode=SERVER, workdir=tmp_path, spec=SPEC, jobs=2, checkout=False
+    )
+    assert result.failed == 0
+    assert result.spans["create"]["api_calls"] == SPEC.repos
+    pushed = tmp_path / "github" / "pcdshub" / "ioc-tst-bench0002.git"
+    assert "refs/heads/branch00" in refs(pushed)
@@ -0,0 +1,72 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ..cache import mirror_path, update_mirror, use_alternates
+from .conftest import xfail_git_setup
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.check_output(["git", *args], cwd=str(cwd), text=True).strip()
+
+
+@pytest.fixture(scope="function")
+def afs_repo(tmp_path: Path) -> tuple[Path, Path]:
+    """A working clone and the bare afs-like repo it pushes to."""
+    xfail_git_setup()
+    src = tmp_path / "src"
+    bare = tmp_path / "ioc" / "tst" / "cached.git"
+    subprocess.run(["git", "init", str(src)], check=True)
+    (src / "file.txt").write_text("one\n")
+    git("add", "file.txt", cwd=src)
+    git("commit", "-m", "one", cwd=src)
+    subprocess.run(["git", "clone", "--bare", str(src), str(bare)], check=True)
+    return src, bare
+
+
+def test_mirror_path_unique(tmp_path: Path):
+    first = mirror_path(str(tmp_path), "/a/ioc/tst/same.git")
+    second = mirror_path(str(tmp_path), "/b/ioc/tst/same.git")
+    assert first != second
+    assert first.name.startswith("same-")
+
+
+def test_update_mirror_incremental(tmp_path: Path, afs_repo: tuple[Path, Path]):
+    src, bare = afs_repo
+    cache_dir = tmp_path / "cache"
+    mirror = update_mirror(str(bare), str(cache_dir))
+    assert git("rev-parse", "HEAD", cwd=Path(mirror)) == git(
+        "rev-parse", "HEAD", cwd=src
+    )
+
+    # New commits and branches on afs show up after a refresh
+    (src / "file.txt").write_text("two\n")
+    git("commit", "-am", "two", cwd=src)
+    git("push", str(bare), "HEAD", cwd=src)
+    git("push", str(bare), "HEAD:refs/heads/feature", cwd=src)
+    assert update_mirror(str(bare), str(cache_dir)) == mirror
+    assert git("rev-parse", "HEAD", cwd=Path(mirror)) == git(
+        "rev-parse", "HEAD", cwd=src
+    )
+    assert git("rev-parse", "feature", cwd=Path(mirror)) == git(
+        "rev-parse", "HEAD", cwd=src
+    )
+
+    # Deleted afs branches are pruned
+    git("push", str(bare), ":refs/heads/feature", cwd=src)
+    update_mirror(str(bare), str(cache_dir))
+    assert "feature" not in git("branch", "--list", cwd=Path(mirror))
+
+
+def test_clone_borrows_mirror_objects(tmp_path: Path, afs_repo: tuple[Path, Path]):
+    src, bare = afs_repo
+    mirror = update_mirror(str(bare), str(tmp_path / "cache"))
+    clone = tmp_path / "clone"
+    subprocess.run(["git", "init", str(clone)], check=True)
+    use_alternates(str(clone), mirror)
+    git("fetch", "--quiet", mirror, "refs/heads/*:refs/remotes/afs_remote/*", cwd=clone)
+    # Everything is reachable, but no objects were copied into the clone
+    assert git("log", "--format=%s", "afs_remote/master", cwd=clone) == "one"
+    assert git("count-objects", cwd=clone).startswith("0 objects")
+    assert "size-pack: 0" in git("count-objects", "-v", cwd=clone)
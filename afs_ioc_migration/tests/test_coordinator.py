@@ -0,0 +1,196 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from .. import pipeline
+from ..coordinator import Coordinator, repo_key
+from ..pipeline import MigrationPipeline
+from .conftest import FakePreparedRepo
+
+PATHS = [f"/afs/ioc/tst/repo{num:02}.git" for num in range(24)]
+
+
+def migrate_worker(root: str, worker: str, log: str) -> None:
+    """Stands in for a worker on another host, logging every repo it migrates."""
+    with Coordinator(root, worker=worker, ttl=2.0) as coordinator:
+        paths = coordinator.share(PATHS, org="pcdshub", dry_run=False)
+        for afs_path in coordinator.claims(paths):
+            time.sleep(0.01)
+            with open(log, "a") as fd:
+                fd.write(f"{afs_path} {worker}\n")
+            coordinator.finish(afs_path, ok=True)
+
+
+def die_holding_leases(root: str, claimed: multiprocessing.Event) -> None:
+    """Claim a few repos and then hang until killed, like a host that went down."""
+    coordinator = Coordinator(root, worker="doomed", ttl=1.0)
+    coordinator.start()
+    paths = coordinator.share(PATHS, org="pcdshub", dry_run=False)
+    coordinator.claim(paths[0])
+    coordinator.claim(paths[1])
+    claimed.set()
+    time.sleep(60)
+
+
+@pytest.fixture
+def spawn() -> multiprocessing.context.SpawnContext:
+    return multiprocessing.get_context("spawn")
+
+
+def test_workers_share_without_overlap(tmp_path: Path, spawn):
+    log = tmp_path / "migrated.txt"
+    workers = [
+        spawn.Process(
+            target=migrate_worker,
+            args=(str(tmp_path / "work"), f"host{num}", str(log)),
+        )
+        for num in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+    migrated = [line.split()[0] for line in log.read_text().splitlines()]
+    # Every repo exactly once
+    assert sorted(migrated) == PATHS
+    # And the work was actually shared
+    assert len({line.split()[1] for line in log.read_text().splitlines()}) > 1
+    status = Coordinator(str(tmp_path / "work")).status(PATHS)
+    assert status == {"ok": len(PATHS), "failed": 0, "leased": 0, "pending": 0}
+
+
+def test_dead_worker_repos_are_reclaimed(tmp_path: Path, spawn):
+    root = str(tmp_path / "work")
+    claimed = spawn.Event()
+    doomed = spawn.Process(target=die_holding_leases, args=(root, claimed))
+    doomed.start()
+    assert claimed.wait(timeout=30)
+
+    with Coordinator(root, worker="survivor", ttl=1.0) as coordinator:
+        # Leased, and the heartbeat keeps it that way while the worker lives
+        assert not coordinator.claim(PATHS[0])
+        time.sleep(1.5)
+        assert not coordinator.claim(PATHS[0])
+        doomed.kill()
+        doomed.join()
+
+        start = time.monotonic()
+        claims = list(coordinator.claims(PATHS[:3]))
+        assert claims == [PATHS[2], PATHS[0], PATHS[1]]
+        # Had to wait for the dead worker's leases to run out
+        assert time.monotonic() - start >= 0.3
+        assert coordinator.reclaimed(PATHS[0])
+        assert not coordinator.reclaimed(PATHS[2])
+
+
+def test_lost_lease_is_never_finished(tmp_path: Path):
+    root = str(tmp_path / "work")
+    # No heartbeat, like a worker that was paused for too long
+    paused = Coordinator(root, worker="paused", ttl=0.5)
+    assert paused.claim(PATHS[0])
+    assert paused.held(PATHS[0])
+    time.sleep(0.6)
+    assert not paused.held(PATHS[0])
+
+    with Coordinator(root, worker="other", ttl=0.5) as other:
+        assert other.claim(PATHS[0])
+        # Even once it wakes up and renews, the repo stays lost
+        os.utime(Path(root) / "leases" / repo_key(PATHS[0]) / "1")
+        assert not paused.held(PATHS[0])
+        paused.finish(PATHS[0], ok=True)
+        assert not other.is_done(PATHS[0])
+        other.finish(PATHS[0], ok=False, error="boom")
+    done = Path(root) / "done" / f"{repo_key(PATHS[0])}.json"
+    assert json.loads(done.read_text()) == {
+        "worker": "other",
+        "ok": False,
+        "error": "boom",
+    }
+    # Failed repos are done too, no one claims them again
+    assert not Coordinator(root, worker="third").claim(PATHS[0])
+
+
+def test_work_list_must_match(tmp_path: Path):
+    coordinator = Coordinator(str(tmp_path))
+    with pytest.raises(ValueError):
+        coordinator.share([], org="pcdshub", dry_run=False)
+    assert coordinator.share(PATHS, org="pcdshub", dry_run=True) == PATHS
+    # Later workers can join without a list of their own
+    assert coordinator.share([], org="pcdshub", dry_run=True) == PATHS
+    with pytest.raises(ValueError):
+        coordinator.share([], org="pcdshub", dry_run=False)
+
+
+def test_pipelines_share_work(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    published = []
+    lock = threading.Lock()
+
+    def fake_publish_repo(prepared: FakePreparedRepo, cleanup: bool) -> str:
+        time.sleep(0.01)
+        with lock:
+            published.append(prepared.afs_path)
+        return prepared.afs_path
+
+    monkeypatch.setattr(
+        pipeline, "prepare_repo", lambda afs_path, **kwargs: FakePreparedRepo(afs_path)
+    )
+    monkeypatch.setattr(pipeline, "publish_repo", fake_publish_repo)
+    results = {}
+
+    def run(worker: str) -> None:
+        with Coordinator(str(tmp_path), worker=worker, ttl=2.0) as coordinator:
+            paths = coordinator.share(PATHS, org="pcdshub", dry_run=False)
+            results[worker] = MigrationPipeline(
+                org="pcdshub",
+                dry_run=False,
+                prepare_jobs=2,
+                publish_jobs=2,
+                coordinator=coordinator,
+            ).run(paths)
+
+    threads = [threading.Thread(target=run, args=(f"w{num}",)) for num in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(published) == PATHS
+    assert sum(len(worker_results) for worker_results in results.values()) == len(PATHS)
+    assert Coordinator(str(tmp_path)).status(PATHS)["ok"] == len(PATHS)
+
+
+def test_reclaimed_repos_skip_org_index(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    calls = {}
+
+    def fake_prepare_repo(afs_path: str, **kwargs) -> FakePreparedRepo:
+        calls[afs_path] = kwargs
+        return FakePreparedRepo(afs_path)
+
+    monkeypatch.setattr(pipeline, "prepare_repo", fake_prepare_repo)
+    monkeypatch.setattr(
+        pipeline, "publish_repo", lambda prepared, cleanup: prepared.afs_path
+    )
+    root = str(tmp_path / "work")
+    # Claimed by a worker that died before it finished
+    Coordinator(root, worker="dead", ttl=0.5).claim(PATHS[0])
+    time.sleep(0.6)
+
+    with Coordinator(root, worker="survivor", ttl=0.5) as coordinator:
+        MigrationPipeline(
+            org="pcdshub",
+            dry_run=False,
+            coordinator=coordinator,
+            org_index="stale index",
+        ).run(PATHS[:2])
+    # The dead worker may have created the repo after the index was fetched
+    assert calls[PATHS[0]]["sync"]
+    assert calls[PATHS[0]]["org_index"] is None
+    assert calls[PATHS[1]]["org_index"] == "stale index"
+    assert "sync" not in calls[PATHS[1]]
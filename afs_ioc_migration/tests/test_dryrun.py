@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.github import LocalGitHub
+from ..constants import BUNDLE, SUMMARY
+from ..dryrun import prune_outputs
+from ..plumbing import MAINTENANCE_SUBJECTS
+from ..transfer import migrate_repo
+from .conftest import xfail_git_setup
+
+
+@pytest.mark.parametrize("output", [SUMMARY, BUNDLE])
+def test_dry_run_summary(tmp_path: Path, output: str):
+    xfail_git_setup()
+    spec = FleetSpec(repos=1, commits=3, files=5, branches=2, tags=1)
+    (afs_path,) = generate_fleet(tmp_path / "fleet", spec)
+    dry_run_dir = tmp_path / "dry_run"
+    path = migrate_repo(
+        afs_path=afs_path,
+        org="pcdshub",
+        dry_run=True,
+        dry_run_dir=str(dry_run_dir),
+        checkout=False,
+        gh=LocalGitHub(tmp_path / "github"),
+        dry_run_output=output,
+    )
+    # Only the summary is left, the clone is gone
+    assert [str(child) for child in dry_run_dir.iterdir()] == [path]
+    summary = json.loads((Path(path) / "summary.json").read_text())
+    assert summary["name"] == "ioc-tst-bench0000"
+    assert len(summary["new_commits"]) == len(MAINTENANCE_SUBJECTS)
+    assert set(summary["refs"]) == {
+        "refs/heads/master",
+        "refs/heads/branch00",
+        "refs/heads/branch01",
+        "refs/tags/v0.0.0",
+    }
+    # The source files, the readme, gitignore and license, and the .github folder
+    assert summary["tree"]["files"] == spec.files + 5
+    patches = sorted((Path(path) / "patches").iterdir())
+    assert [patch.name for patch in patches] == [
+        "0001-MAINT-add-standard-license-file.patch",
+        "0002-MAINT-update-gitignore.patch",
+        "0003-MAINT-add-github-templates.patch",
+        "0004-MAINT-update-readme.patch",
+    ]
+
+    bundle = Path(path) / "ioc-tst-bench0000.bundle"
+    assert bundle.exists() == (output == BUNDLE)
+    if output == BUNDLE:
+        # The bundle only needs the afs repo to apply
+        subprocess.run(
+            ["git", "bundle", "verify", "--quiet", str(bundle)],
+            cwd=afs_path,
+            check=True,
+        )
+
+
+def test_prune_outputs(tmp_path: Path):
+    for num in range(4):
+        output = tmp_path / f"repo{num}_abc"
+        output.mkdir()
+        (output / "summary.json").write_bytes(b"x" * 1000)
+        os.utime(output, (1000 + num, 1000 + num))
+    removed = prune_outputs(str(tmp_path), budget=2500, keep=frozenset())
+    assert removed == [str(tmp_path / "repo0_abc"), str(tmp_path / "repo1_abc")]
+
+    # Outputs we keep are never removed, even when over budget
+    keep = frozenset({str(tmp_path / "repo2_abc")})
+    removed = prune_outputs(str(tmp_path), budget=0, keep=keep)
+    assert removed == [str(tmp_path / "repo3_abc")]
+    assert [path.name for path in tmp_path.iterdir()] == ["repo2_abc"]
+
+
+def test_prune_only_outputs(tmp_path: Path):
+    xfail_git_setup()
+    # Someone ran a dry run with --dry-run-dir . next to their own work
+    subprocess.run(["git", "init", "--quiet", str(tmp_path / "src")], check=True)
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "todo.txt").write_text("x" * 1000)
+    (tmp_path / ".cache_dir").mkdir()
+    (tmp_path / ".cache_dir" / "summary.json").write_text("{}")
+    (tmp_path / "my_stuff").mkdir()
+    (tmp_path / "my_stuff" / "file.txt").write_text("x")
+    output = tmp_path / "repo0_abc"
+    output.mkdir()
+    (output / "summary.json").write_text("{}")
+
+    removed = prune_outputs(str(tmp_path), budget=0)
+    assert removed == [str(output)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        ".cache_dir",
+        "my_stuff",
+        "notes",
+        "src",
+    ]
+    assert (tmp_path / "src" / ".git").is_dir()
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+from urllib.error import HTTPError
+
+import pytest
+from fastcore.net import HTTP4xxClientError, HTTP5xxServerError, HTTP404NotFoundError
+
+from ..benchmark.server import FakeGitHub, Faults
+from ..github_client import GitHubClient
+from ..org_index import OrgIndex
+from ..ratelimit import RateLimiter
+
+
+@pytest.fixture
+def fake(tmp_path: Path) -> Iterator[FakeGitHub]:
+    with FakeGitHub(tmp_path) as fake:
+        yield fake
+
+
+def make_client(url: str, **kwargs) -> GitHubClient:
+    return GitHubClient(
+        api_url=url,
+        token="fake",
+        limiter=RateLimiter(write_interval=0, secondary_backoff=0),
+        **kwargs,
+    )
+
+
+def test_same_errors_as_ghapi(fake: FakeGitHub):
+    client = make_client(fake.url)
+    try:
+        with pytest.raises(HTTP404NotFoundError):
+            client.repos.list_commits("pcdshub", "ioc-tst-new")
+        client.repos.create_in_org("pcdshub", "ioc-tst-new", visibility="internal")
+        with pytest.raises(HTTP4xxClientError) as exc_info:
+            client.repos.list_commits("pcdshub", "ioc-tst-new")
+        assert exc_info.value.code == 409
+        assert exc_info.value.headers["X-RateLimit-Limit"] == "5000"
+        client.repos.replace_all_topics("pcdshub", "ioc-tst-new", ["epics"])
+        assert fake.repos.topics == {"pcdshub/ioc-tst-new": ["epics"]}
+        index = OrgIndex.fetch("pcdshub", gh=client)
+        assert "ioc-tst-new" in index
+
+        fake.faults = Faults(server_error_rate=1.0)
+        with pytest.raises(HTTPError) as exc_info:
+            client.repos.list_commits("pcdshub", "ioc-tst-new")
+        assert exc_info.value.code == 502
+        assert isinstance(exc_info.value, HTTP5xxServerError)
+        # Every request went over the one kept-alive connection
+        assert len(client.aio._idle) == 1
+    finally:
+        client.close()
+
+
+def test_requests_overlap_up_to_the_limit(fake: FakeGitHub):
+    fake.faults = Faults(latency=0.2)
+    client = make_client(fake.url, max_in_flight=4)
+    try:
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            errors = list(
+                executor.map(
+                    lambda num: pytest.raises(
+                        HTTP404NotFoundError,
+                        client.repos.list_commits,
+                        "pcdshub",
+                        f"repo{num}",
+                    ),
+                    range(8),
+                )
+            )
+        elapsed = time.monotonic() - start
+        assert len(errors) == 8
+        # Two rounds of four, not eight one after another
+        assert 0.4 <= elapsed < 1.2
+        assert len(client.aio._idle) == 4
+    finally:
+        client.close()
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    """Answers with a chunked body, then closes every other connection."""
+
+    protocol_version = "HTTP/1.1"
+    requests = 0
+
+    def do_GET(self) -> None:
+        ChunkedHandler.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        if ChunkedHandler.requests % 2:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        for chunk in (b'[{"sha": ', b'"abc"}]'):
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args) -> None: ...
+
+
+def test_chunked_and_closed_connections():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChunkedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = make_client(f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        for _ in range(4):
+            assert client.repos.list_commits("pcdshub", "repo") == [{"sha": "abc"}]
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+class RenamedHandler(BaseHTTPRequestHandler):
+    """Redirects the old name of a renamed repo, with no reason phrases."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/repos/pcdshub/old/"):
+            self.send_response(301, "")
+            self.send_header("Location", "/repositories/1/commits?per_page=1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/repos/pcdshub/elsewhere/"):
+            self.send_response(301)
+            self.send_header("Location", "https://example.com/repositories/2")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps([{"sha": "abc", "path": self.path}]).encode()
+        self.send_response(200, "")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None: ...
+
+
+def test_redirects_and_empty_reasons():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RenamedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = make_client(f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        assert client.repos.list_commits("pcdshub", "old") == [
+            {"sha": "abc", "path": "/repositories/1/commits?per_page=1"}
+        ]
+        # Never to another server, which shouldn't get our token
+        with pytest.raises(HTTPError) as exc_info:
+            client.repos.list_commits("pcdshub", "elsewhere")
+        assert exc_info.value.code == 301
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,155 @@
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from ..gitignore import Matcher, Pattern, merge, newly_ignored, tracked_paths
+from .conftest import xfail_git_setup
+
+patterns = [
+    "O.*",
+    "/bin",
+    "db/",
+    "**/build",
+    "docs/**",
+    "a/**/z.txt",
+    "*.log",
+    "!keep.log",
+    "cfg/*.sub",
+    "[Tt]emp?",
+    "\\#notes",
+    "trailing   ",
+]
+
+paths = [
+    "O.linux-x86_64/main.o",
+    "src/O.Common/thing.h",
+    "bin/rhel7/ioc",
+    "iocBoot/bin/st.cmd",
+    "db/thing.db",
+    "app/db/other.db",
+    "db",
+    "build",
+    "deep/down/build/out.o",
+    "docs/index.md",
+    "docs",
+    "a/z.txt",
+    "a/b/c/z.txt",
+    "ab/z.txt",
+    "ioc.log",
+    "keep.log",
+    "sub/keep.log",
+    "cfg/x.sub",
+    "cfg/more/x.sub",
+    "temp1",
+    "Temp2/file",
+    "tempest",
+    "#notes",
+    "trailing",
+    "st.cmd",
+]
+
+
+def test_matches_git(tmp_path: Path):
+    xfail_git_setup()
+    subprocess.run(["git", "init", str(tmp_path)], check=True)
+    (tmp_path / ".gitignore").write_text("\n".join(patterns) + "\n")
+    result = subprocess.run(
+        ["git", "check-ignore", "--no-index", "--stdin"],
+        cwd=tmp_path,
+        input="\n".join(paths) + "\n",
+        capture_output=True,
+        text=True,
+    )
+    git_ignored = set(result.stdout.splitlines())
+    matcher = Matcher(patterns)
+    assert {path for path in paths if matcher.is_ignored(path)} == git_ignored
+
+
+def test_tracked_paths_not_utf8(tmp_path: Path):
+    xfail_git_setup()
+    subprocess.run(["git", "init", str(tmp_path)], check=True)
+    with open(bytes(tmp_path) + b"/caf\xe9.log", "w") as fd:
+        fd.write("latin-1 name")
+    (tmp_path / "st.cmd").write_text("")
+    subprocess.run(["git", "add", "-A"], cwd=tmp_path, check=True)
+    subprocess.run(["git", "commit", "-m", "names"], cwd=tmp_path, check=True)
+    paths = tracked_paths(str(tmp_path))
+    assert paths == ["caf\ufffd.log", "st.cmd"]
+    assert newly_ignored(paths, [], ["*.log"]) == ["caf\ufffd.log"]
+
+
+@pytest.mark.parametrize(
+    "line,key",
+    [
+        ("foo", (False, "foo", False, False)),
+        ("/foo", (False, "foo", True, False)),
+        ("foo/", (False, "foo", False, True)),
+        ("**/foo", (False, "foo", False, False)),
+        ("foo   ", (False, "foo", False, False)),
+        ("!foo", (True, "foo", False, False)),
+        ("a/b", (False, "a/b", True, False)),
+        ("/a/b", (False, "a/b", True, False)),
+        ("**/a/b", (False, "**/a/b", True, False)),
+    ],
+)
+def test_pattern_key(line: str, key: tuple[bool, str, bool, bool]):
+    assert Pattern.parse(line).key == key
+
+
+@pytest.mark.parametrize("line", ["/foo", "foo/", "/foo/", "!/foo", "**/foo"])
+def test_slashes_round_trip(line: str):
+    assert Pattern.parse(line).text == line
+
+
+@pytest.mark.parametrize("line", ["\\#foo", "\\!foo", "!#foo", "!!foo"])
+def test_escapes_round_trip(line: str):
+    assert Pattern.parse(line).text == line
+    assert merge(["*.o"], [line]) == ["*.o", "", "# From original afs gitignore", line]
+
+
+def test_merge_dedups():
+    ours = ["# Built files", "O.*", "db", ""]
+    theirs = [
+        "# Built files",
+        "/O.*",
+        "**/db",
+        "db/",
+        "cats",
+        "cats  ",
+        "/cats/",
+        "# Built files",
+        "# Mine",
+        "",
+        "!dogs",
+        "dogs",
+    ]
+    assert merge(ours, theirs) == ours + [
+        "",
+        "# From original afs gitignore",
+        "/O.*",
+        "db/",
+        "cats",
+        "/cats/",
+        "# Mine",
+        "!dogs",
+        "dogs",
+    ]
+    assert merge(ours, ["O.*", "# Built files"]) == ours
+
+
+def test_newly_ignored_fast():
+    tree = [
+        f"area{area}/src{num}/{name}"
+        for area in range(50)
+        for num in range(100)
+        for name in ("Makefile", "thing.c", "x.log", "db/x.db")
+    ]
+    old = ["*.log"]
+    new = ["*.log", "db", "O.*", "*.swp", "*~", "bin", "lib", "include"]
+    start = time.monotonic()
+    hidden = newly_ignored(tree, old, new)
+    assert time.monotonic() - start < 5
+    assert len(hidden) == len(tree) // 4
+    assert all(path.endswith("db/x.db") for path in hidden)
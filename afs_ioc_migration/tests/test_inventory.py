@@ -0,0 +1,53 @@
+import io
+import os
+from pathlib import Path
+
+from ..inventory import read_manifest, scan, select, write_manifest
+
+
+def make_tree(tmp_path: Path) -> Path:
+    ioc = tmp_path / "afs" / "ioc"
+    for repo in ("tst/one.git", "tst/two.git", "xpp/ccm/three.git"):
+        (ioc / repo / "refs" / "heads").mkdir(parents=True)
+        (ioc / repo / "refs" / "heads" / "master").write_text("abc\n")
+    # Not repos: a file, a working copy's .git, and something too deep
+    (ioc / "README").write_text("hello\n")
+    (ioc / "tst" / "checkout" / ".git").mkdir(parents=True)
+    (ioc / "xpp" / "a" / "b" / "deep.git").mkdir(parents=True)
+    # An area that is a symlink to somewhere else
+    (tmp_path / "elsewhere" / "four.git").mkdir(parents=True)
+    os.symlink(tmp_path / "elsewhere", ioc / "rix")
+    return ioc
+
+
+def test_scan(tmp_path: Path):
+    ioc = make_tree(tmp_path)
+    costs = scan([str(ioc)], jobs=4)
+    assert [cost.afs_path for cost in costs] == sorted(
+        [
+            str(tmp_path / "elsewhere" / "four.git"),
+            str(ioc / "tst" / "one.git"),
+            str(ioc / "tst" / "two.git"),
+            str(ioc / "xpp" / "ccm" / "three.git"),
+        ]
+    )
+    assert sorted(cost.refs for cost in costs) == [0, 1, 1, 1]
+
+
+def test_manifest_round_trip(tmp_path: Path):
+    costs = scan([str(make_tree(tmp_path))])
+    fd = io.StringIO()
+    write_manifest(costs, fd)
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(fd.getvalue())
+    assert read_manifest(str(manifest)) == costs
+
+
+def test_select(tmp_path: Path):
+    costs = scan([str(make_tree(tmp_path))])
+    assert select(costs, []) == costs
+    assert [cost.afs_path.split("/")[-1] for cost in select(costs, ["*/tst/*"])] == [
+        "one.git",
+        "two.git",
+    ]
+    assert len(select(costs, ["*/tst/one.git", "*three*"])) == 2
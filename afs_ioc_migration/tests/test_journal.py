@@ -0,0 +1,82 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from .. import pipeline
+from ..journal import Journal, journal_key, ref_fingerprint
+from ..pipeline import MigrationPipeline
+from .conftest import FakePreparedRepo, xfail_git_setup
+
+
+@pytest.fixture(scope="function")
+def journal(tmp_path: Path) -> Journal:
+    return Journal(str(tmp_path / "journal.db"))
+
+
+def test_mark_and_reload(tmp_path: Path, journal: Journal):
+    journal.mark("some/repo.git", "locked", "abc")
+    journal.mark("some/repo.git", "prepared", "abc")
+    journal.close()
+    reopened = Journal(str(tmp_path / "journal.db"))
+    assert reopened.finished("some/repo.git") == {"locked": "abc", "prepared": "abc"}
+    # Keys are absolute paths, so relative and absolute spellings match
+    assert reopened.finished(journal_key("some/repo.git")) == {
+        "locked": "abc",
+        "prepared": "abc",
+    }
+    assert not reopened.is_complete("some/repo.git")
+    reopened.mark("some/repo.git", "pushed", "abc")
+    assert reopened.is_complete("some/repo.git")
+    assert reopened.is_complete("some/repo.git", fingerprint="abc")
+    assert not reopened.is_complete("some/repo.git", fingerprint="def")
+
+
+def test_bad_stage(journal: Journal):
+    with pytest.raises(ValueError):
+        journal.mark("some/repo.git", "finished", "abc")
+
+
+def test_changed_fingerprint_redoes_content(journal: Journal):
+    for stage in ("locked", "prepared", "created", "topics"):
+        journal.mark("some/repo.git", stage, "old")
+    finished = journal.check_fingerprint("some/repo.git", "new")
+    assert set(finished) == {"locked", "created", "topics"}
+    assert "prepared" not in journal.finished("some/repo.git")
+
+
+def test_ref_fingerprint(tmp_path: Path):
+    xfail_git_setup()
+    src = tmp_path / "src"
+    bare = tmp_path / "ioc" / "tst" / "fingerprint.git"
+    subprocess.run(["git", "init", str(src)], check=True)
+    subprocess.run(["git", "commit", "--allow-empty", "-m", "one"], cwd=src, check=True)
+    subprocess.run(["git", "clone", "--bare", str(src), str(bare)], check=True)
+    first = ref_fingerprint(str(bare))
+    assert first == ref_fingerprint(str(bare))
+    subprocess.run(["git", "commit", "--allow-empty", "-m", "two"], cwd=src, check=True)
+    subprocess.run(["git", "push", str(bare), "HEAD"], cwd=src, check=True)
+    assert ref_fingerprint(str(bare)) != first
+
+
+def test_pipeline_skips_complete_repos(
+    monkeypatch: pytest.MonkeyPatch, journal: Journal
+):
+    prepared_paths = []
+
+    def fake_prepare_repo(afs_path: str, **kwargs) -> FakePreparedRepo:
+        prepared_paths.append(afs_path)
+        return FakePreparedRepo(afs_path)
+
+    monkeypatch.setattr(pipeline, "prepare_repo", fake_prepare_repo)
+    monkeypatch.setattr(pipeline, "publish_repo", lambda prepared, cleanup: "")
+    journal.mark("ioc/tst/done.git", "pushed", "abc")
+    journal.mark("ioc/tst/partial.git", "created", "abc")
+    results = MigrationPipeline(org="pcdshub", dry_run=False, journal=journal).run(
+        ["ioc/tst/done.git", "ioc/tst/partial.git", "ioc/tst/new.git"]
+    )
+    assert prepared_paths == ["ioc/tst/partial.git", "ioc/tst/new.git"]
+    assert [result.afs_path for result in results if result.skipped] == [
+        "ioc/tst/done.git"
+    ]
+    assert all(result.ok for result in results)
@@ -1,9 +1,22 @@
+import os
 import subprocess
 from pathlib import Path
 
 import pytest
 
-from ..lock_repo import AlreadyLockedError, lock_file_repo
+from ..lock_repo import (
+    LOCKED,
+    OTHER_HOOK,
+    UNLOCKED,
+    AlreadyLockedError,
+    NotLockedError,
+    hook_status,
+    lock_file_repo,
+    lock_many,
+    status_many,
+    unlock_file_repo,
+    unlock_many,
+)
 from ..rename import RepoInfo
 from .conftest import xfail_git_setup
 
@@ -123,3 +136,44 @@ def test_hooks_block_push(tmp_path: Path):
         subprocess.run(
             ["git", "push", "origin", "master"], cwd=str(wrk_src), check=True
         )
+
+
+def test_unlock_restores_other_hook(fake_already_other_hook_repo: Path):
+    hooks = fake_already_other_hook_repo / "hooks"
+    orig_text = (hooks / "pre-receive").read_text()
+    assert hook_status(str(fake_already_other_hook_repo), org="pcdshub") == OTHER_HOOK
+    lock_file_repo(path=str(fake_already_other_hook_repo), org="pcdshub")
+    assert hook_status(str(fake_already_other_hook_repo), org="pcdshub") == LOCKED
+    unlock_file_repo(path=str(fake_already_other_hook_repo), org="pcdshub")
+    assert (hooks / "pre-receive").read_text() == orig_text
+    assert sorted(path.name for path in hooks.iterdir()) == ["pre-receive"]
+    with pytest.raises(NotLockedError):
+        unlock_file_repo(path=str(fake_already_other_hook_repo), org="pcdshub")
+
+
+def test_unlock_removes_hook(fake_already_done_repo: Path):
+    unlock_file_repo(path=str(fake_already_done_repo), org="pcdshub")
+    assert hook_status(str(fake_already_done_repo), org="pcdshub") == UNLOCKED
+    assert list((fake_already_done_repo / "hooks").iterdir()) == []
+
+
+def test_lock_many(tmp_path: Path, fake_not_a_repo: Path):
+    paths = []
+    for num in range(20):
+        repo = tmp_path / "ioc" / "tst" / f"repo{num}.git"
+        (repo / "hooks").mkdir(parents=True)
+        paths.append(str(repo))
+    lock_file_repo(path=paths[0], org="pcdshub")
+    # Already locked repos are fine, repos we can't name are failures
+    assert lock_many(paths + [str(fake_not_a_repo)], org="pcdshub", jobs=8) == 1
+    statuses = status_many(paths + [str(fake_not_a_repo)], org="pcdshub", jobs=8)
+    assert [statuses[path] for path in paths] == [LOCKED] * len(paths)
+    assert statuses[str(fake_not_a_repo)].startswith("error")
+    for path in paths:
+        # Only the hook, no temporary files left behind
+        assert sorted(p.name for p in (Path(path) / "hooks").iterdir()) == [
+            "pre-receive"
+        ]
+        assert os.access(Path(path) / "hooks" / "pre-receive", os.X_OK)
+    assert unlock_many(paths, org="pcdshub", jobs=8) == 0
+    assert set(status_many(paths, org="pcdshub").values()) == {UNLOCKED}
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Slow to import, and only needed to talk to github or to make commits
+HEAVY = ("ghapi", "fastcore", "git", "jinja2", "asyncio")
+# The standard library modules the cli can't start without
+STDLIB = ("argparse", "collections", "dataclasses", "json", "logging", "typing")
+# What our own modules may add to that, in seconds
+IMPORT_BUDGET = 0.03
+
+
+def import_times(*args: str) -> dict[str, float]:
+    """
+    Run python with args and return every module it imported.
+
+    Each is mapped to the seconds it took to import, including what it
+    imported itself, or 0 for modules imported by another one.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        universal_newlines=True,
+        cwd=Path(__file__).parents[2],
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        nested = name.startswith("  ")
+        times[name.strip()] = 0.0 if nested else int(cumulative) / 1e6
+    return times
+
+
+def imported(*args: str) -> dict[str, float]:
+    """Run the cli and return every module it imported, see import_times."""
+    return import_times("-m", "afs_ioc_migration", *args)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--help"],
+        ["migrate", "--help"],
+        ["verify", "--help"],
+        ["plan", "/tmp/ioc/tst/ioc-tst-example.git"],
+        ["lock", "--help"],
+        ["status", "/tmp/ioc/tst/ioc-tst-example.git"],
+    ],
+)
+def test_quick_commands_skip_heavy_imports(args: list[str]):
+    times = imported(*args)
+    assert "afs_ioc_migration" in times
+    assert [name for name in times if name.split(".")[0] in HEAVY] == []
+
+
+def test_startup_time():
+    # Best of a few, to keep a busy machine from failing the test
+    stdlib = f"import {', '.join(STDLIB)}"
+    bare = min(sum(import_times("-c", stdlib).values()) for _ in range(3))
+    best = min(sum(imported("--help").values()) for _ in range(3))
+    assert best - bare < IMPORT_BUDGET
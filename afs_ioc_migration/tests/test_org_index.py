@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from ..github_client import GitHubClient
+from ..org_index import OrgIndex, OrgRepo
+from ..ratelimit import RateLimiter
+from ..rename import RepoInfo
+from ..transfer import RepoExistsError, check_repo_exists
+
+CREATED = "2024-06-01T00:00:00Z"
+PUSHED = "2024-06-02T00:00:00Z"
+
+
+def make_repos(count: int) -> list[dict]:
+    repos = []
+    for num in range(count):
+        empty = num % 2 == 0
+        repos.append(
+            {
+                "name": f"ioc-tst-repo{num}",
+                "size": 0 if empty else 10,
+                "created_at": CREATED,
+                "pushed_at": CREATED if empty else PUSHED,
+                "topics": ["epics"],
+            }
+        )
+    return repos
+
+
+class OrgReposHandler(BaseHTTPRequestHandler):
+    repos: list[dict] = []
+    pages_served: list[int] = []
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["30"])[0])
+        self.pages_served.append(page)
+        start = (page - 1) * per_page
+        body = json.dumps(self.repos[start : start + per_page]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None: ...
+
+
+@pytest.fixture(scope="function")
+def fake_github() -> Iterator[str]:
+    OrgReposHandler.repos = make_repos(25)
+    OrgReposHandler.pages_served = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OrgReposHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_paginates(fake_github: str):
+    gh = GitHubClient(api_url=fake_github, token="", limiter=RateLimiter())
+    try:
+        index = OrgIndex.fetch("pcdshub", gh=gh, per_page=10)
+    finally:
+        gh.close()
+    assert OrgReposHandler.pages_served == [1, 2, 3]
+    assert len(index) == 25
+    assert not index.get("ioc-tst-repo0").has_commits
+    assert index.get("ioc-tst-repo1").has_commits
+    assert index.get("IOC-TST-REPO1").topics == ("epics",)
+    assert "ioc-tst-repo99" not in index
+
+
+@pytest.mark.parametrize(
+    "data,has_commits",
+    [
+        ({"size": 0, "created_at": CREATED, "pushed_at": CREATED}, False),
+        ({"size": 0, "created_at": CREATED, "pushed_at": None}, False),
+        ({"size": 0, "created_at": CREATED, "pushed_at": PUSHED}, True),
+        ({"size": 5, "created_at": CREATED, "pushed_at": CREATED}, True),
+    ],
+)
+def test_org_repo_has_commits(data: dict, has_commits: bool):
+    assert OrgRepo.from_api({"name": "ioc-tst-x", **data}).has_commits == has_commits
+
+
+def test_check_repo_exists_with_index():
+    index = OrgIndex(
+        org="pcdshub",
+        repos={
+            "ioc-tst-empty": OrgRepo(name="ioc-tst-empty", has_commits=False),
+            "ioc-tst-full": OrgRepo(name="ioc-tst-full", has_commits=True),
+        },
+    )
+
+    def info(name: str) -> RepoInfo:
+        return RepoInfo.from_afs(f"/fake/path/ioc/tst/{name}.git", org="pcdshub")
+
+    assert not check_repo_exists(
+        info=info("new"), org="pcdshub", dry_run=False, org_index=index
+    )
+    assert check_repo_exists(
+        info=info("empty"), org="pcdshub", dry_run=False, org_index=index
+    )
+    assert check_repo_exists(
+        info=info("full"), org="pcdshub", dry_run=True, org_index=index
+    )
+    with pytest.raises(RepoExistsError):
+        check_repo_exists(
+            info=info("full"), org="pcdshub", dry_run=False, org_index=index
+        )
@@ -0,0 +1,229 @@
+import subprocess
+import threading
+import time
+from urllib.error import HTTPError
+
+import pytest
+from fastcore.net import HTTP5xxServerError
+
+from .. import pipeline
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.github import LocalGitHub
+from ..pipeline import MigrationPipeline
+from ..retry import RetryPolicy
+from .conftest import FakePreparedRepo, xfail_git_setup
+
+
+class StageTracker:
+    """Fake stages that record how many of each were running at once."""
+
+    def __init__(self, prepare_time: float = 0.02, publish_time: float = 0.02):
+        self.prepare_time = prepare_time
+        self.publish_time = publish_time
+        self.lock = threading.Lock()
+        self.running = {"prepare": 0, "publish": 0}
+        self.peak = {"prepare": 0, "publish": 0}
+        self.overlapped = False
+        self.prepared: list[FakePreparedRepo] = []
+        # Repos that fail the next few times they get to a stage
+        self.failures: dict[tuple[str, str], list[Exception]] = {}
+        self.order: list[str] = []
+
+    def _enter(self, stage: str) -> None:
+        with self.lock:
+            self.running[stage] += 1
+            self.peak[stage] = max(self.peak[stage], self.running[stage])
+            if self.running["prepare"] and self.running["publish"]:
+                self.overlapped = True
+
+    def _exit(self, stage: str) -> None:
+        with self.lock:
+            self.running[stage] -= 1
+
+    def prepare_repo(self, afs_path: str, org: str, dry_run: bool, **kwargs):
+        self._enter("prepare")
+        try:
+            time.sleep(self.prepare_time)
+            if "badprep" in afs_path:
+                raise RuntimeError(f"{afs_path} failed to prepare")
+            if self.failures.get((afs_path, "prepare")):
+                raise self.failures[(afs_path, "prepare")].pop(0)
+            prepared = FakePreparedRepo(afs_path)
+            self.prepared.append(prepared)
+            return prepared
+        finally:
+            self._exit("prepare")
+
+    def publish_repo(self, prepared: FakePreparedRepo, cleanup: bool = True) -> str:
+        self._enter("publish")
+        try:
+            time.sleep(self.publish_time)
+            if cleanup:
+                prepared.cleanup()
+            if "badpush" in prepared.afs_path:
+                raise RuntimeError(f"{prepared.afs_path} failed to push")
+            if self.failures.get((prepared.afs_path, "publish")):
+                raise self.failures[(prepared.afs_path, "publish")].pop(0)
+            with self.lock:
+                self.order.append(prepared.afs_path)
+            return f"done-{prepared.afs_path}"
+        finally:
+            self._exit("publish")
+
+
+@pytest.fixture(scope="function")
+def tracker(monkeypatch: pytest.MonkeyPatch) -> StageTracker:
+    tracker = StageTracker()
+    monkeypatch.setattr(pipeline, "prepare_repo", tracker.prepare_repo)
+    monkeypatch.setattr(pipeline, "publish_repo", tracker.publish_repo)
+    return tracker
+
+
+def test_stages_overlap_within_limits(tracker: StageTracker):
+    paths = [f"repo{num}" for num in range(8)]
+    results = MigrationPipeline(
+        org="pcdshub", dry_run=True, prepare_jobs=2, publish_jobs=1, queue_size=1
+    ).run(paths)
+    assert sorted(result.afs_path for result in results) == sorted(paths)
+    assert all(result.ok for result in results)
+    assert all(result.path == f"done-{result.afs_path}" for result in results)
+    assert tracker.overlapped
+    assert tracker.peak["prepare"] <= 2
+    assert tracker.peak["publish"] == 1
+
+
+def test_errors_attributed_to_repo_and_stage(tracker: StageTracker):
+    paths = ["repo0", "badprep1", "repo2", "badpush3", "repo4"]
+    results = MigrationPipeline(
+        org="pcdshub", dry_run=True, prepare_jobs=2, publish_jobs=2
+    ).run(paths)
+    by_path = {result.afs_path: result for result in results}
+    assert set(by_path) == set(paths)
+    assert by_path["badprep1"].stage == "prepare"
+    assert "badprep1" in str(by_path["badprep1"].error)
+    assert by_path["badpush3"].stage == "publish"
+    assert "badpush3" in str(by_path["badpush3"].error)
+    assert [path for path, res in by_path.items() if res.ok] == [
+        "repo0",
+        "repo2",
+        "repo4",
+    ]
+
+
+def test_stop_cleans_up_waiting_repos(tracker: StageTracker):
+    tracker.publish_time = 0.05
+    paths = ["badpush0"] + [f"repo{num}" for num in range(1, 10)]
+    with pytest.raises(RuntimeError):
+        MigrationPipeline(
+            org="pcdshub",
+            dry_run=True,
+            prepare_jobs=2,
+            publish_jobs=1,
+            queue_size=2,
+            stop_on_error=True,
+        ).run(paths)
+    # We stopped early, and nothing prepared was left on disk
+    assert len(tracker.prepared) < len(paths)
+    assert all(prepared.cleaned_up for prepared in tracker.prepared)
+
+
+FAST_RETRY = RetryPolicy(max_attempts=3, base_delay=0.05)
+
+
+def server_error(afs_path: str) -> HTTPError:
+    return HTTPError(afs_path, 502, "bad gateway", None, None)
+
+
+def test_transient_failure_goes_to_back_of_queue(tracker: StageTracker):
+    tracker.failures[("repo0", "prepare")] = [server_error("repo0")]
+    paths = [f"repo{num}" for num in range(4)]
+    results = MigrationPipeline(
+        org="pcdshub", dry_run=True, prepare_jobs=1, publish_jobs=1, retry=FAST_RETRY
+    ).run(paths)
+    by_path = {result.afs_path: result for result in results}
+    assert all(result.ok for result in results)
+    assert by_path["repo0"].attempts == 2
+    assert by_path["repo1"].attempts == 1
+    # The others didn't wait for it
+    assert tracker.order[-1] == "repo0"
+
+
+def test_transient_push_keeps_prepared_repo(tracker: StageTracker):
+    dropped = subprocess.CalledProcessError(
+        128, ["git", "push"], stderr="fatal: Connection reset by peer"
+    )
+    tracker.failures[("repo1", "publish")] = [dropped]
+    results = MigrationPipeline(
+        org="pcdshub", dry_run=True, prepare_jobs=2, publish_jobs=2, retry=FAST_RETRY
+    ).run(["repo0", "repo1"])
+    assert all(result.ok for result in results)
+    # Only published again, not prepared again, and cleaned up at the end
+    assert [prepared.afs_path for prepared in tracker.prepared].count("repo1") == 1
+    assert all(prepared.cleaned_up for prepared in tracker.prepared)
+
+
+def test_transient_failure_gives_up(tracker: StageTracker):
+    tracker.failures[("repo1", "publish")] = [server_error("repo1")] * 3
+    results = MigrationPipeline(
+        org="pcdshub", dry_run=True, prepare_jobs=2, publish_jobs=2, retry=FAST_RETRY
+    ).run(["repo0", "repo1", "repo2"])
+    by_path = {result.afs_path: result for result in results}
+    # Counted as failed, but the run carries on
+    assert not by_path["repo1"].ok
+    assert by_path["repo1"].attempts == 3
+    assert by_path["repo0"].ok and by_path["repo2"].ok
+    assert all(prepared.cleaned_up for prepared in tracker.prepared)
+
+
+def test_permanent_http_error_stops(tracker: StageTracker):
+    tracker.failures[("repo0", "publish")] = [
+        HTTPError("repo0", 401, "bad credentials", None, None)
+    ]
+    with pytest.raises(HTTPError):
+        MigrationPipeline(
+            org="pcdshub",
+            dry_run=True,
+            prepare_jobs=1,
+            publish_jobs=1,
+            retry=FAST_RETRY,
+        ).run([f"repo{num}" for num in range(6)])
+    assert len(tracker.order) < 5
+
+
+def test_create_that_failed_after_taking_effect(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    xfail_git_setup()
+    (afs_path,) = generate_fleet(tmp_path / "fleet", FleetSpec(repos=1))
+    github = LocalGitHub(tmp_path / "github")
+    create_in_org = github.repos.create_in_org
+    calls = []
+
+    def flaky_create_in_org(org: str, name: str, **kwargs) -> dict:
+        calls.append(name)
+        result = create_in_org(org, name, **kwargs)
+        if len(calls) == 1:
+            # Made the repo, but the response never got back to us
+            raise HTTP5xxServerError(f"/orgs/{org}/repos", 502, "Bad Gateway", {}, None)
+        return result
+
+    monkeypatch.setattr(github.repos, "create_in_org", flaky_create_in_org)
+    (result,) = MigrationPipeline(
+        org="pcdshub",
+        dry_run=False,
+        retry=RetryPolicy(base_delay=0),
+        checkout=False,
+        gh=github,
+        push_url_template=github.push_url_template,
+    ).run([afs_path])
+    assert result.ok
+    assert result.attempts == 2
+    # The retry saw the repo was there and didn't try to make it again
+    assert calls == ["ioc-tst-bench0000"]
+    pushed = github.repos.path("pcdshub", "ioc-tst-bench0000")
+    assert (
+        subprocess.run(
+            ["git", "rev-parse", "--verify", "master"], cwd=pushed, capture_output=True
+        ).returncode
+        == 0
+    )
@@ -0,0 +1,75 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from ..plan import Plan
+from ..transfer import prepare_repo
+
+paths = [
+    "/afs/epics/ioc/xpp/ccm/foo.git",
+    "/afs/epics/ioc/xpp/ccm-foo.git",
+    "/afs/epics/ioc/rixs/bar.git",
+    "/afs/epics/ioc/rix/Bar.git",
+    "/afs/epics/ioc/lcls/thing.git",
+    "/afs/epics/ioc/rixs/only.git",
+    "/afs/epics/ioc/common/ims.git",
+]
+
+
+@pytest.fixture(scope="module")
+def plan() -> Plan:
+    return Plan.build(paths, org="pcdshub")
+
+
+def test_collisions(plan: Plan):
+    assert plan.collisions == {
+        "ioc-xpp-ccm-foo": paths[0:2],
+        # github names are case insensitive
+        "ioc-rix-bar": paths[2:4],
+    }
+    assert [repo.afs_path for repo in plan.invalid] == [paths[4]]
+    assert "non-ecs area" in plan.repos[paths[4]].error
+    assert [repo.area_renamed for repo in plan.repos.values()] == [
+        False,
+        False,
+        True,
+        False,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_get_info(plan: Plan):
+    assert plan.get_info(paths[5]).name == "ioc-rix-only"
+    assert plan.get_info(paths[6]).github_url == (
+        "https://github.com/pcdshub/ioc-common-ims.git"
+    )
+    for afs_path in paths[:5] + ["/afs/epics/ioc/tst/unplanned.git"]:
+        with pytest.raises(ValueError):
+            plan.get_info(afs_path)
+
+
+def test_round_trip(tmp_path: Path, plan: Plan):
+    fd = io.StringIO()
+    plan.write(fd)
+    assert json.loads(fd.getvalue())["summary"] == {
+        "total": 7,
+        "invalid": 1,
+        "collisions": 2,
+        "area_renamed": 2,
+    }
+    plan_path = tmp_path / "plan.json"
+    plan_path.write_text(fd.getvalue())
+    loaded = Plan.read(str(plan_path))
+    assert loaded.org == "pcdshub"
+    assert loaded.repos == plan.repos
+    assert loaded.collisions == plan.collisions
+
+
+def test_prepare_refuses_collisions(plan: Plan):
+    # This fails before touching afs or github
+    with pytest.raises(ValueError, match="the same as"):
+        prepare_repo(afs_path=paths[0], org="pcdshub", dry_run=True, plan=plan)
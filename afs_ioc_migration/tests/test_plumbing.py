@@ -0,0 +1,127 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from git import Repo
+
+from ..plumbing import commit_maintenance, create_branches
+from ..rename import RepoInfo
+from ..transfer import commit_with_checkout
+from .conftest import xfail_git_setup
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.check_output(["git", *args], cwd=str(cwd), text=True).strip()
+
+
+@pytest.fixture(scope="function")
+def afs_repo(tmp_path: Path) -> Path:
+    """An afs-like bare repo that already has some of our standard files."""
+    xfail_git_setup()
+    src = tmp_path / "src"
+    bare = tmp_path / "ioc" / "tst" / "plumbing.git"
+    subprocess.run(["git", "init", str(src)], check=True)
+    (src / ".gitignore").write_text("/O.*\n*.pyc\nbuild/\n")
+    (src / "README").write_text("Some notes\r\nabout this ioc\n")
+    (src / "readme.txt").write_text("More notes\n")
+    (src / "st.cmd").write_text("#!/bin/sh\n")
+    (src / "st.cmd").chmod(0o755)
+    (src / "db").mkdir()
+    (src / "db" / "thing.db").write_text("record(ai, x) {}\n")
+    git("add", ".", cwd=src)
+    git("commit", "-m", "Initial commit", cwd=src)
+    subprocess.run(["git", "clone", "--bare", str(src), str(bare)], check=True)
+    return bare
+
+
+def fetch(afs_path: Path, path: Path) -> Repo:
+    repo = Repo.init(path=str(path), mkdir=True)
+    remote = repo.create_remote(name="afs_remote", url=str(afs_path))
+    remote.fetch(["*:refs/remotes/afs_remote/*"])
+    return repo
+
+
+def test_same_commits_as_checkout(tmp_path: Path, afs_repo: Path):
+    info = RepoInfo.from_afs(afs_source=str(afs_repo), org="pcdshub")
+
+    with_checkout = tmp_path / "with_checkout"
+    repo = fetch(afs_repo, with_checkout)
+    repo.create_head("master", repo.remotes.afs_remote.refs.HEAD).checkout()
+    commit_with_checkout(repo=repo, path=str(with_checkout), info=info)
+
+    without_checkout = tmp_path / "without_checkout"
+    fetch(afs_repo, without_checkout)
+    commit_maintenance(repo_path=str(without_checkout), info=info)
+
+    # Each of the four commits has the same message and the same tree
+    log_format = "--format=%T %s"
+    assert git("log", log_format, "master", cwd=without_checkout) == git(
+        "log", log_format, "master", cwd=with_checkout
+    )
+    assert git("log", "--format=%s", "-1", "master", cwd=without_checkout) == (
+        "MAINT: update readme"
+    )
+    assert git("symbolic-ref", "HEAD", cwd=without_checkout) == "refs/heads/master"
+    # Nothing was ever checked out
+    assert sorted(p.name for p in without_checkout.iterdir()) == [".git"]
+    assert not (without_checkout / ".git" / "index").exists()
+
+
+def test_name_not_utf8(tmp_path: Path, afs_repo: Path):
+    src = tmp_path / "src"
+    (src / os.fsdecode(b"caf\xe9.txt")).write_text("Latin-1 name\n")
+    git("add", ".", cwd=src)
+    git("commit", "-m", "Add a file", cwd=src)
+    git("push", "--quiet", str(afs_repo), "HEAD", cwd=src)
+    info = RepoInfo.from_afs(afs_source=str(afs_repo), org="pcdshub")
+
+    path = tmp_path / "clone"
+    fetch(afs_repo, path)
+    commit_maintenance(repo_path=str(path), info=info)
+
+    names = subprocess.check_output(
+        ["git", "ls-tree", "-z", "--name-only", "master"], cwd=str(path)
+    ).split(b"\0")
+    assert b"caf\xe9.txt" in names
+
+
+def test_existing_github_folder(tmp_path: Path, afs_repo: Path):
+    src = tmp_path / "src"
+    (src / ".github").mkdir()
+    (src / ".github" / "CODEOWNERS").write_text("* @someone\n")
+    git("add", ".", cwd=src)
+    git("commit", "-m", "Add github folder", cwd=src)
+    git("push", str(afs_repo), "HEAD", cwd=src)
+
+    info = RepoInfo.from_afs(afs_source=str(afs_repo), org="pcdshub")
+    path = tmp_path / "clone"
+    fetch(afs_repo, path)
+    with pytest.raises(FileExistsError):
+        commit_maintenance(repo_path=str(path), info=info)
+    assert git("for-each-ref", "refs/heads", cwd=path) == ""
+
+
+def test_create_branches(tmp_path: Path, afs_repo: Path):
+    head = git("rev-parse", "HEAD", cwd=afs_repo)
+    # Many release branches, and a master that afs HEAD no longer points to
+    updates = "".join(f"create refs/heads/release/R{num}\n" for num in range(500))
+    subprocess.run(
+        ["git", "update-ref", "--stdin"],
+        cwd=afs_repo,
+        input=updates.replace("\n", f" {head}\n"),
+        text=True,
+        check=True,
+    )
+    git("branch", "main", "master", cwd=afs_repo)
+    git("symbolic-ref", "HEAD", "refs/heads/main", cwd=afs_repo)
+
+    info = RepoInfo.from_afs(afs_source=str(afs_repo), org="pcdshub")
+    path = tmp_path / "clone"
+    fetch(afs_repo, path)
+    master = commit_maintenance(repo_path=str(path), info=info)
+    assert create_branches(repo_path=str(path)) == 501
+    assert git("rev-parse", "release/R499", cwd=path) == head
+    assert git("rev-parse", "main", cwd=path) == head
+    # Our master was left alone
+    assert git("rev-parse", "master", cwd=path) == master
@@ -0,0 +1,100 @@
+import io
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ..preflight import check_repo, preflight_many, write_report
+from .conftest import xfail_git_setup
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.check_output(["git", *args], cwd=str(cwd), text=True).strip()
+
+
+@pytest.fixture(scope="function")
+def src(tmp_path: Path) -> Path:
+    """A working clone to make afs-like bare repos from."""
+    xfail_git_setup()
+    src = tmp_path / "src"
+    subprocess.run(["git", "init", str(src)], check=True)
+    (src / "small.txt").write_text("small\n")
+    (src / "big.bin").write_bytes(b"x" * 1000)
+    (src / "db").mkdir()
+    (src / "db" / "thing.db").write_text("record(ai, x) {}\n")
+    git("add", ".", cwd=src)
+    git("commit", "-m", "Initial commit", cwd=src)
+    git("tag", "v1", cwd=src)
+    git("branch", "feature", cwd=src)
+    return src
+
+
+def make_bare(src: Path, path: Path) -> str:
+    subprocess.run(["git", "clone", "--bare", str(src), str(path)], check=True)
+    return str(path)
+
+
+def test_good_repo(tmp_path: Path, src: Path):
+    report = check_repo(make_bare(src, tmp_path / "ioc" / "tst" / "good.git"))
+    assert report.ok, report.errors
+    assert report.name == "ioc-tst-good"
+    assert report.head.startswith("refs/heads/")
+    assert (report.branches, report.tags, report.other_refs) == (2, 1, 0)
+    assert report.largest_blob == 1000
+    assert report.pack_size + report.loose_size > 0
+    # Our standard gitignore ignores db, which would hide tracked files
+    assert report.newly_ignored == ["db/thing.db"]
+    assert len(report.warnings) == 1
+
+
+def test_problem_repos(tmp_path: Path, src: Path):
+    empty = tmp_path / "ioc" / "tst" / "empty.git"
+    subprocess.run(["git", "init", "--bare", str(empty)], check=True)
+    report = check_repo(str(empty))
+    assert report.empty
+    assert not report.ok
+
+    report = check_repo(make_bare(src, tmp_path / "ioc" / "bad" / "area.git"))
+    assert report.name == ""
+    assert any("non-ecs area" in error for error in report.errors)
+
+    broken = make_bare(src, tmp_path / "ioc" / "tst" / "broken.git")
+    git("symbolic-ref", "HEAD", "refs/heads/missing", cwd=Path(broken))
+    report = check_repo(broken)
+    assert any("Broken HEAD" in error for error in report.errors)
+
+    report = check_repo(make_bare(src, tmp_path / "ioc" / "tst" / "big.git"), 999)
+    assert report.oversized_blobs == [
+        {
+            "oid": git("rev-parse", "HEAD:big.bin", cwd=src),
+            "path": "big.bin",
+            "size": 1000,
+        }
+    ]
+    assert not report.ok
+
+    (src / ".github").mkdir()
+    (src / ".github" / "CODEOWNERS").write_text("* @someone\n")
+    git("add", ".", cwd=src)
+    git("commit", "-m", "Add github folder", cwd=src)
+    report = check_repo(make_bare(src, tmp_path / "ioc" / "tst" / "github.git"))
+    assert report.errors == ["HEAD already has a .github folder"]
+
+
+def test_preflight_many_report(tmp_path: Path, src: Path):
+    paths = [
+        make_bare(src, tmp_path / "ioc" / "tst" / f"repo{num}.git") for num in range(4)
+    ]
+    paths.insert(2, str(tmp_path / "ioc" / "tst" / "notarepo.git"))
+    (tmp_path / "ioc" / "tst" / "notarepo.git").mkdir()
+    reports = preflight_many(paths, jobs=3)
+    assert [report.afs_path for report in reports] == paths
+    assert [report.ok for report in reports] == [True, True, False, True, True]
+
+    fd = io.StringIO()
+    write_report(reports, fd)
+    loaded = json.loads(fd.getvalue())
+    assert loaded["summary"] == {"total": 5, "ok": 4, "failed": 1, "empty": 0}
+    assert loaded["repos"][2]["ok"] is False
+    assert loaded["repos"][0]["name"] == "ioc-tst-repo0"
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+
+from ..github_client import GitHubClient
+from ..ratelimit import RateLimiter
+
+
+class FakeClock:
+    """Clock whose sleep just moves time forward."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def wall_clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(scope="function")
+def fake_clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(scope="function")
+def limiter(fake_clock: FakeClock) -> RateLimiter:
+    return RateLimiter(
+        write_interval=1.0,
+        low_water=10,
+        clock=fake_clock.clock,
+        wall_clock=fake_clock.wall_clock,
+        sleep=fake_clock.sleep,
+    )
+
+
+def test_reads_not_paced(limiter: RateLimiter, fake_clock: FakeClock):
+    for _ in range(5):
+        limiter.acquire("GET")
+    assert fake_clock.sleeps == []
+
+
+def test_writes_paced(limiter: RateLimiter, fake_clock: FakeClock):
+    for _ in range(3):
+        limiter.acquire("POST")
+    assert fake_clock.sleeps == [1.0, 1.0]
+
+
+def test_retry_after(limiter: RateLimiter, fake_clock: FakeClock):
+    assert limiter.update({"Retry-After": "30"}, status=429)
+    limiter.acquire("GET")
+    assert fake_clock.sleeps == [30.0]
+
+
+def test_exhausted_waits_for_reset(limiter: RateLimiter, fake_clock: FakeClock):
+    headers = {
+        "X-RateLimit-Remaining": "0",
+        "X-RateLimit-Reset": str(fake_clock.now + 120),
+    }
+    assert limiter.update(headers, status=403)
+    limiter.acquire("GET")
+    assert fake_clock.sleeps == [120.0]
+
+
+def test_low_budget_spreads_requests(limiter: RateLimiter, fake_clock: FakeClock):
+    headers = {
+        "x-ratelimit-remaining": "5",
+        "x-ratelimit-reset": str(fake_clock.now + 50),
+    }
+    assert not limiter.update(headers)
+    limiter.acquire("GET")
+    limiter.acquire("GET")
+    assert fake_clock.sleeps == [10.0]
+
+
+def test_threads_share_write_spacing():
+    limiter = RateLimiter(write_interval=0.05)
+    stamps = []
+    lock = threading.Lock()
+
+    def write():
+        limiter.acquire("POST")
+        with lock:
+            stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=write) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stamps.sort()
+    gaps = [later - earlier for earlier, later in zip(stamps, stamps[1:])]
+    assert all(gap >= 0.04 for gap in gaps)
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """Rejects the first request with a secondary rate limit, then succeeds."""
+
+    requests: list[str] = []
+
+    def do_GET(self) -> None:
+        self.requests.append(self.path)
+        if len(self.requests) == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "7")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps([{"sha": "abc"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None: ...
+
+
+@pytest.fixture(scope="function")
+def fake_github() -> Iterator[str]:
+    FakeGitHubHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_retries_rate_limit(fake_github: str, fake_clock: FakeClock):
+    limiter = RateLimiter(
+        clock=fake_clock.clock,
+        wall_clock=time.time,
+        sleep=fake_clock.sleep,
+    )
+    gh = GitHubClient(api_url=fake_github, token="", limiter=limiter)
+    try:
+        commits = gh.repos.list_commits("pcdshub", "ioc-tst-limits")
+    finally:
+        gh.close()
+    assert commits[0]["sha"] == "abc"
+    assert (
+        FakeGitHubHandler.requests
+        == ["/repos/pcdshub/ioc-tst-limits/commits?per_page=1"] * 2
+    )
+    assert fake_clock.sleeps == [7.0]
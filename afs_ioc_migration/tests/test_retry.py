@@ -0,0 +1,64 @@
+import socket
+import subprocess
+from email.message import Message
+from urllib.error import HTTPError, URLError
+
+import pytest
+from git import GitCommandError
+
+from ..retry import PERMANENT, TRANSIENT_API, TRANSIENT_PUSH, RetryPolicy, classify
+
+
+def http_error(code: int, **headers: str) -> HTTPError:
+    msg = Message()
+    for key, value in headers.items():
+        msg[key.replace("_", "-")] = value
+    return HTTPError("https://api.github.com", code, "error", msg, None)
+
+
+@pytest.mark.parametrize(
+    "exc, kind",
+    [
+        (http_error(502), TRANSIENT_API),
+        (http_error(429), TRANSIENT_API),
+        (http_error(403, Retry_After="60"), TRANSIENT_API),
+        (http_error(403, X_RateLimit_Remaining="0"), TRANSIENT_API),
+        (http_error(403), PERMANENT),
+        (http_error(401), PERMANENT),
+        (http_error(422), PERMANENT),
+        (URLError(socket.gaierror("no such host")), TRANSIENT_API),
+        (ConnectionResetError(), TRANSIENT_API),
+        (
+            GitCommandError(
+                ["git", "push"],
+                128,
+                stderr="fatal: the remote end hung up unexpectedly",
+            ),
+            TRANSIENT_PUSH,
+        ),
+        (
+            subprocess.CalledProcessError(
+                128, ["git", "push"], stderr=b"ssh: Could not resolve host github.com"
+            ),
+            TRANSIENT_PUSH,
+        ),
+        (
+            subprocess.CalledProcessError(
+                1, ["git", "push"], stderr="error: failed to push some refs"
+            ),
+            PERMANENT,
+        ),
+        (RuntimeError("empty repo"), PERMANENT),
+    ],
+)
+def test_classify(exc: Exception, kind: str):
+    assert classify(exc) == kind
+
+
+def test_delay():
+    policy = RetryPolicy(base_delay=10, max_delay=60)
+    for attempt, cap in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+        for _ in range(20):
+            assert cap / 2 <= policy.delay(attempt) <= cap
+    # github knows best
+    assert policy.delay(1, http_error(403, Retry_After="120")) == 120
@@ -0,0 +1,117 @@
+import logging
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+
+import pytest
+
+from .. import pipeline, runner
+from .conftest import FakePreparedRepo
+
+logger = logging.getLogger("afs_ioc_migration.transfer")
+
+
+def fake_prepare_repo(
+    afs_path: str, org: str, dry_run: bool, **kwargs
+) -> FakePreparedRepo:
+    """Log a few lines slowly so that concurrent repos would interleave."""
+    for step in range(2):
+        logger.info(f"{afs_path} step {step}")
+        time.sleep(0.01)
+    if "bad" in afs_path:
+        raise RuntimeError(f"{afs_path} is bad")
+    return FakePreparedRepo(afs_path)
+
+
+def fake_publish_repo(prepared: FakePreparedRepo, cleanup: bool = True) -> str:
+    logger.info(f"{prepared.afs_path} step 2")
+    time.sleep(0.01)
+    if "http" in prepared.afs_path:
+        raise HTTPError(prepared.afs_path, 401, "bad credentials", None, None)
+    prepared.cleanup()
+    return prepared.afs_path
+
+
+@pytest.fixture(autouse=True)
+def fake_stages(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(pipeline, "prepare_repo", fake_prepare_repo)
+    monkeypatch.setattr(pipeline, "publish_repo", fake_publish_repo)
+
+
+def test_migrate_many_groups_logs(caplog: pytest.LogCaptureFixture):
+    paths = [f"repo{num}" for num in range(6)]
+    with caplog.at_level(logging.INFO):
+        n_errors = runner.migrate_many(
+            paths, org="pcdshub", dry_run=True, jobs=3, use_org_index=False
+        )
+    assert n_errors == 0
+    step_lines = [
+        rec.getMessage() for rec in caplog.records if " step " in rec.getMessage()
+    ]
+    assert len(step_lines) == 3 * len(paths)
+    # Each repo's steps must be contiguous, even though the repos overlapped
+    for chunk_start in range(0, len(step_lines), 3):
+        chunk = step_lines[chunk_start : chunk_start + 3]
+        repo_name = chunk[0].split()[0]
+        assert chunk == [f"{repo_name} step {step}" for step in range(3)]
+
+
+def test_migrate_many_counts_errors():
+    paths = ["good1", "bad1", "good2", "bad2", "good3"]
+    assert (
+        runner.migrate_many(
+            paths, org="pcdshub", dry_run=True, jobs=2, use_org_index=False
+        )
+        == 2
+    )
+
+
+def test_migrate_many_stop_on_error():
+    paths = ["good1", "bad1", "good2", "good3", "good4", "good5"]
+    with pytest.raises(RuntimeError):
+        runner.migrate_many(
+            paths,
+            org="pcdshub",
+            dry_run=True,
+            jobs=2,
+            stop_on_error=True,
+            use_org_index=False,
+        )
+
+
+def test_migrate_many_http_error():
+    paths = ["good1", "http1", "good2"]
+    with pytest.raises(HTTPError):
+        runner.migrate_many(
+            paths, org="pcdshub", dry_run=True, jobs=2, use_org_index=False
+        )
+
+
+def test_migrate_many_largest_first(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    paths = []
+    for num, size in enumerate((10, 3000, 100)):
+        path = tmp_path / f"repo{num}.git"
+        (path / "objects" / "pack").mkdir(parents=True)
+        (path / "objects" / "pack" / "pack-1.pack").write_bytes(b"x" * size)
+        paths.append(str(path))
+    with caplog.at_level(logging.INFO):
+        runner.migrate_many(
+            paths,
+            org="pcdshub",
+            dry_run=True,
+            use_org_index=False,
+            schedule_largest_first=True,
+        )
+    started = [
+        rec.getMessage().split()[0]
+        for rec in caplog.records
+        if rec.getMessage().endswith(" step 0")
+    ]
+    assert started == [paths[1], paths[2], paths[0]]
+    predicted_lines = [
+        rec.getMessage()
+        for rec in caplog.records
+        if "predict" in rec.getMessage().lower()
+    ]
+    # The schedule, each repo, and the total
+    assert len(predicted_lines) == 1 + len(paths) + 1
@@ -0,0 +1,48 @@
+import subprocess
+from pathlib import Path
+
+from ..schedule import RepoCost, estimate_cost, largest_first
+from .conftest import xfail_git_setup
+
+
+def test_estimate_cost(tmp_path: Path):
+    xfail_git_setup()
+    src = tmp_path / "src"
+    bare = tmp_path / "ioc" / "tst" / "cost.git"
+    subprocess.run(["git", "init", str(src)], check=True)
+    (src / "file.txt").write_text("x" * 10000)
+    subprocess.run(["git", "add", "file.txt"], cwd=src, check=True)
+    subprocess.run(["git", "commit", "-m", "one"], cwd=src, check=True)
+    subprocess.run(["git", "tag", "v1"], cwd=src, check=True)
+    subprocess.run(["git", "clone", "--bare", str(src), str(bare)], check=True)
+    cost = estimate_cost(str(bare))
+    # One branch and one tag, whether packed or loose
+    assert cost.refs == 2
+    assert cost.size > 0
+    assert cost.predicted > RepoCost(afs_path="").predicted
+
+
+def test_missing_repo_costs_nothing(tmp_path: Path):
+    assert estimate_cost(str(tmp_path / "missing.git")) == RepoCost(
+        afs_path=str(tmp_path / "missing.git")
+    )
+
+
+def test_largest_first(tmp_path: Path):
+    paths = []
+    for num, (size, refs) in enumerate(((100, 0), (5000, 0), (100, 3), (0, 0))):
+        path = tmp_path / f"repo{num}.git"
+        (path / "objects" / "ab").mkdir(parents=True)
+        (path / "objects" / "ab" / "cdef").write_bytes(b"x" * size)
+        (path / "refs" / "heads").mkdir(parents=True)
+        for ref in range(refs):
+            (path / "refs" / "heads" / f"branch{ref}").write_text("abc\n")
+        paths.append(str(path))
+    costs = largest_first(paths, jobs=2)
+    # Each ref costs more than a few kB of objects
+    assert [cost.afs_path for cost in costs] == [
+        paths[2],
+        paths[1],
+        paths[0],
+        paths[3],
+    ]
@@ -0,0 +1,165 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.github import LocalGitHub
+from ..journal import Journal
+from ..pipeline import MigrationPipeline
+from ..sync import SYNC_SUBJECT, SyncConflictError, ls_remote
+from ..transfer import RepoExistsError, migrate_repo
+from .conftest import xfail_git_setup
+
+SPEC = FleetSpec(repos=1, commits=3, files=3, branches=2, tags=1)
+
+
+def rev_parse(path: str | Path, rev: str) -> str:
+    return subprocess.check_output(
+        ["git", "rev-parse", rev], cwd=path, universal_newlines=True
+    ).strip()
+
+
+def late_push(path: str | Path, ref: str, msg: str) -> str:
+    """Add an empty commit to ref, bypassing the lock hook like an early push."""
+    parent = rev_parse(path, ref)
+    sha = subprocess.check_output(
+        ["git", "commit-tree", f"{parent}^{{tree}}", "-p", parent, "-m", msg],
+        cwd=path,
+        universal_newlines=True,
+    ).strip()
+    subprocess.run(["git", "update-ref", ref, sha], cwd=path, check=True)
+    return sha
+
+
+def migrate(afs_path: str, github: LocalGitHub, **kwargs) -> str:
+    return migrate_repo(
+        afs_path=afs_path,
+        org="pcdshub",
+        dry_run=False,
+        checkout=False,
+        gh=github,
+        push_url_template=github.push_url_template,
+        **kwargs,
+    )
+
+
+def test_ls_remote(tmp_path: Path):
+    (afs_path,) = generate_fleet(tmp_path, SPEC)
+    refs = ls_remote(afs_path)
+    assert set(refs) == {
+        "HEAD",
+        "refs/heads/master",
+        "refs/heads/branch00",
+        "refs/heads/branch01",
+        "refs/tags/v0.0.0",
+    }
+    # The annotated tag itself, not the commit it points to
+    assert refs["refs/tags/v0.0.0"] == rev_parse(afs_path, "v0.0.0")
+
+
+def test_sync_late_pushes(tmp_path: Path):
+    xfail_git_setup()
+    (afs_path,) = generate_fleet(tmp_path / "fleet", SPEC)
+    github = LocalGitHub(tmp_path / "github")
+    migrate(afs_path, github)
+    pushed = github.repos.path("pcdshub", "ioc-tst-bench0000")
+    # Like a protected master branch
+    subprocess.run(
+        ["git", "config", "receive.denyNonFastForwards", "true"], cwd=pushed, check=True
+    )
+    before = ls_remote(str(pushed))
+
+    # Nothing changed, so there is nothing to push
+    migrate(afs_path, github, sync=True)
+    assert ls_remote(str(pushed)) == before
+
+    head = late_push(afs_path, "refs/heads/master", "Late fix")
+    branch = late_push(afs_path, "refs/heads/branch00", "Late branch work")
+    subprocess.run(["git", "branch", "new", "master"], cwd=afs_path, check=True)
+    with pytest.raises(RepoExistsError):
+        migrate(afs_path, github)
+    migrate(afs_path, github, sync=True)
+
+    after = ls_remote(str(pushed))
+    assert after["refs/heads/branch00"] == branch
+    assert after["refs/heads/new"] == head
+    assert after["refs/heads/branch01"] == before["refs/heads/branch01"]
+    assert after["refs/tags/v0.0.0"] == before["refs/tags/v0.0.0"]
+    # The new afs commits were merged into master, not put in its place
+    assert rev_parse(pushed, "master^1") == before["refs/heads/master"]
+    assert rev_parse(pushed, "master^2") == head
+    subjects = subprocess.check_output(
+        ["git", "log", "--format=%s", "master"], cwd=pushed, universal_newlines=True
+    ).splitlines()
+    assert subjects[0] == SYNC_SUBJECT
+    assert subjects.count("MAINT: update readme") == 1
+    readme = subprocess.check_output(
+        ["git", "show", "master:README.md"], cwd=pushed, universal_newlines=True
+    )
+    assert readme == subprocess.check_output(
+        ["git", "show", "master^1:README.md"], cwd=pushed, universal_newlines=True
+    )
+
+    # And again, on top of our own merge
+    merged = rev_parse(pushed, "master")
+    head = late_push(afs_path, "refs/heads/master", "Later fix")
+    migrate(afs_path, github, sync=True)
+    assert rev_parse(pushed, "master^1") == merged
+    assert rev_parse(pushed, "master^2") == head
+
+
+def test_sync_conflicts(tmp_path: Path):
+    xfail_git_setup()
+    (afs_path,) = generate_fleet(tmp_path / "fleet", SPEC)
+    github = LocalGitHub(tmp_path / "github")
+    migrate(afs_path, github)
+    pushed = github.repos.path("pcdshub", "ioc-tst-bench0000")
+
+    # Both sides moved branch01 and master in different directions
+    late_push(afs_path, "refs/heads/branch01", "On afs")
+    github_branch = late_push(pushed, "refs/heads/branch01", "On github")
+    late_push(afs_path, "refs/heads/master", "On afs")
+    github_master = late_push(pushed, "refs/heads/master", "On github")
+    # And a new branch that can be synced regardless
+    subprocess.run(["git", "branch", "new", "master"], cwd=afs_path, check=True)
+
+    with pytest.raises(SyncConflictError) as exc_info:
+        migrate(afs_path, github, sync=True)
+    assert "refs/heads/branch01" in str(exc_info.value)
+    assert "refs/heads/master" in str(exc_info.value)
+    after = ls_remote(str(pushed))
+    assert after["refs/heads/branch01"] == github_branch
+    assert after["refs/heads/master"] == github_master
+    assert after["refs/heads/new"] == rev_parse(afs_path, "new")
+
+
+def test_sync_with_journal(tmp_path: Path):
+    xfail_git_setup()
+    (afs_path,) = generate_fleet(tmp_path / "fleet", SPEC)
+    github = LocalGitHub(tmp_path / "github")
+    journal = Journal(str(tmp_path / "journal.db"))
+    pushed = github.repos.path("pcdshub", "ioc-tst-bench0000")
+
+    def sync() -> list:
+        return MigrationPipeline(
+            org="pcdshub",
+            dry_run=False,
+            journal=journal,
+            checkout=False,
+            gh=github,
+            push_url_template=github.push_url_template,
+            sync=True,
+        ).run([afs_path])
+
+    migrate(afs_path, github, journal=journal)
+    # Nothing changed on afs, so the journal can skip it
+    (result,) = sync()
+    assert result.skipped
+
+    head = late_push(afs_path, "refs/heads/master", "Late fix")
+    (result,) = sync()
+    assert result.ok and not result.skipped
+    assert rev_parse(pushed, "master^2") == head
+    (result,) = sync()
+    assert result.skipped
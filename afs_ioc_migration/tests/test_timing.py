@@ -0,0 +1,104 @@
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.github import LocalGitHub
+from ..timing import RepoTimer, SpanRecorder, percentile, pushed_bytes, repo_bytes
+from ..transfer import migrate_repo
+from .conftest import xfail_git_setup
+
+
+def test_percentile():
+    values = [float(num) for num in range(1, 101)]
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile([3.0], 0.95) == 3
+
+
+def test_recorder_files(tmp_path: Path):
+    jsonl = tmp_path / "spans.jsonl"
+    prom = tmp_path / "migration.prom"
+    recorder = SpanRecorder(path=str(jsonl), prometheus_path=str(prom))
+    timer = RepoTimer(repo="one", recorder=recorder)
+    with timer.span("fetch") as span:
+        span.bytes = 1024
+    with pytest.raises(RuntimeError):
+        with timer.span("push"):
+            raise RuntimeError("push failed")
+    other = RepoTimer(repo="two", recorder=recorder)
+    with other.span("fetch") as span:
+        span.api_calls = 2
+    recorder.close()
+
+    lines = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [(line["repo"], line["stage"]) for line in lines] == [
+        ("one", "fetch"),
+        ("one", "push"),
+        ("two", "fetch"),
+    ]
+    assert "push failed" in lines[1]["error"]
+
+    summary = recorder.summary()
+    assert summary["stages"]["fetch"]["count"] == 2
+    assert summary["stages"]["fetch"]["bytes"] == 1024
+    assert summary["stages"]["fetch"]["api_calls"] == 2
+    assert summary["stages"]["push"]["errors"] == 1
+    assert {repo for repo, _ in summary["slowest"]} == {"one", "two"}
+
+    text = prom.read_text()
+    assert "# TYPE afs_migration_stage_seconds summary" in text
+    assert 'afs_migration_stage_seconds_count{stage="fetch"} 2' in text
+    assert 'afs_migration_stage_bytes_total{stage="fetch"} 1024' in text
+    assert 'afs_migration_stage_errors_total{stage="push"} 1' in text
+
+
+@pytest.mark.parametrize("checkout", [True, False])
+def test_migrate_repo_spans(tmp_path: Path, checkout: bool):
+    xfail_git_setup()
+    spec = FleetSpec(repos=1, commits=3, files=3)
+    (afs_path,) = generate_fleet(tmp_path / "fleet", spec)
+    github = LocalGitHub(tmp_path / "github")
+    recorder = SpanRecorder()
+    migrate_repo(
+        afs_path=afs_path,
+        org="pcdshub",
+        dry_run=False,
+        checkout=checkout,
+        gh=github,
+        push_url_template=github.push_url_template,
+        recorder=recorder,
+    )
+    stages = recorder.summary()["stages"]
+    expected = {"lock", "check", "fetch", "branches", "create", "topics", "push"}
+    if checkout:
+        expected |= {"checkout", "license", "gitignore", "github_folder", "readme"}
+    else:
+        expected.add("maintenance")
+    assert set(stages) == expected
+    assert stages["fetch"]["bytes"] > 0
+    assert stages["push"]["bytes"] > 0
+    assert sum(stats["api_calls"] for stats in stages.values()) == 3
+
+
+def test_pushed_bytes(tmp_path: Path):
+    xfail_git_setup()
+    src = tmp_path / "src"
+    subprocess.run(["git", "init", "--quiet", str(src)], check=True)
+    for num in range(2):
+        (src / f"file{num}.txt").write_bytes(bytes(range(256)) * 64 * (num + 1))
+        subprocess.run(["git", "add", "."], cwd=src, check=True)
+        subprocess.run(["git", "commit", "-qm", f"commit {num}"], cwd=src, check=True)
+    everything = pushed_bytes(str(src), include=["--all"])
+    assert 0 < pushed_bytes(str(src), include=["HEAD"], exclude=["HEAD~"]) < everything
+    assert pushed_bytes(str(src), include=[]) == 0
+
+    # A clone that borrows every object still pushes all of them
+    shared = tmp_path / "shared"
+    subprocess.run(
+        ["git", "clone", "--quiet", "--shared", str(src), str(shared)], check=True
+    )
+    assert repo_bytes(str(shared)) < everything
+    assert pushed_bytes(str(shared), include=["HEAD"]) == everything
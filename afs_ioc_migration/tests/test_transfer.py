@@ -1,10 +1,19 @@
 import subprocess
 from pathlib import Path
 
-from ..transfer import migrate_repo
+import pytest
+
+from ..rename import RepoInfo
+from ..transfer import build_local_repo, migrate_repo
 from .conftest import xfail_git_setup
 
 
+def git(path: str | Path, *args: str) -> str:
+    return subprocess.check_output(
+        ["git", *args], cwd=path, universal_newlines=True
+    ).strip()
+
+
 def test_transfer_dry_run(tmp_path: Path):
     xfail_git_setup()
 
@@ -60,3 +69,34 @@ def test_transfer_dry_run(tmp_path: Path):
     after_commits = get_commits(repo_temp_path)
     assert "Initial commit" in after_commits
     assert len(after_commits) > 1
+
+
+@pytest.mark.parametrize("checkout", [True, False])
+def test_build_local_repo_branches(tmp_path: Path, checkout: bool):
+    xfail_git_setup()
+    src_path = tmp_path / "repo"
+    afs_path = tmp_path / "ioc" / "tst" / "branches.git"
+    subprocess.run(["git", "init", "-q", "-b", "master", str(src_path)], check=True)
+    subprocess.run(
+        ["git", "commit", "-q", "--allow-empty", "-m", "Initial commit"],
+        cwd=src_path,
+        check=True,
+    )
+    subprocess.run(["git", "branch", "feature"], cwd=src_path, check=True)
+    subprocess.run(
+        ["git", "clone", "-q", "--bare", str(src_path), str(afs_path)], check=True
+    )
+    afs_head = git(afs_path, "rev-parse", "HEAD")
+
+    info = RepoInfo.from_afs(afs_source=str(afs_path), org="pcdshub", resolve=False)
+    path = tmp_path / "clone"
+    path.mkdir()
+    build_local_repo(info=info, path=str(path), checkout=checkout)
+
+    # Branch names are not padded, and afs master doesn't replace ours
+    assert git(path, "for-each-ref", "--format=%(refname)", "refs/heads").split() == [
+        "refs/heads/feature",
+        "refs/heads/master",
+    ]
+    assert git(path, "rev-parse", "feature") == afs_head
+    assert git(path, "rev-parse", "master~4") == afs_head
@@ -26,4 +26,4 @@ fi
 REPO_ROOT="$(realpath "${THIS_DIR}"/../..)"
 export PYTHONPATH="${REPO_ROOT}:${PYTHONPATH}"
 
-python -m afs_ioc_migration $@ "${TARGET_REPO}"
+python -m afs_ioc_migration migrate $@ "${TARGET_REPO}"
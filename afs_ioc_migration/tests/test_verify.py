@@ -0,0 +1,92 @@
+import subprocess
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from ..benchmark.fleet import FleetSpec, generate_fleet
+from ..benchmark.server import FakeGitHub
+from ..github_client import GitHubClient
+from ..ratelimit import RateLimiter
+from ..transfer import migrate_repo
+from ..verify import verify_many
+from .conftest import xfail_git_setup
+
+SPEC = FleetSpec(repos=3, commits=3, files=3, branches=2, tags=1)
+
+
+@pytest.fixture
+def fake(tmp_path: Path) -> Iterator[FakeGitHub]:
+    with FakeGitHub(tmp_path / "github") as fake:
+        yield fake
+
+
+@pytest.fixture
+def client(fake: FakeGitHub) -> Iterator[GitHubClient]:
+    client = GitHubClient(
+        api_url=fake.url,
+        token="fake",
+        limiter=RateLimiter(write_interval=0, secondary_backoff=0),
+    )
+    yield client
+    client.close()
+
+
+def git(path: str | Path, *args: str) -> str:
+    return subprocess.check_output(
+        ["git", *args], cwd=path, universal_newlines=True
+    ).strip()
+
+
+def test_verify(tmp_path: Path, fake: FakeGitHub, client: GitHubClient):
+    xfail_git_setup()
+    paths = generate_fleet(tmp_path / "fleet", SPEC)
+    for afs_path in paths:
+        migrate_repo(
+            afs_path=afs_path,
+            org="pcdshub",
+            dry_run=False,
+            checkout=False,
+            gh=client,
+            push_url_template=fake.push_url_template,
+        )
+
+    def verify() -> list:
+        return verify_many(
+            paths,
+            org="pcdshub",
+            jobs=4,
+            gh=client,
+            push_url_template=fake.push_url_template,
+        )
+
+    reports = verify()
+    assert [report.errors for report in reports] == [[], [], []]
+    # Two branches and a tag, besides master
+    assert reports[0].matched == 3
+    # One paginated read each for the topics and properties
+    assert fake.counts[("list_for_org", 200)] == 1
+    assert fake.counts[("custom_properties_for_repos_get_organization_values", 200)]
+
+    # A tag that never arrived and a branch that moved on afs
+    first = fake.repos.path("pcdshub", "ioc-tst-bench0000")
+    git(first, "tag", "-d", "v0.0.0")
+    git(paths[0], "update-ref", "refs/heads/branch00", "master")
+    # Master pushed without our commits and a topic that was never set
+    second = fake.repos.path("pcdshub", "ioc-tst-bench0001")
+    git(second, "update-ref", "refs/heads/master", git(paths[1], "rev-parse", "HEAD"))
+    client.repos.replace_all_topics("pcdshub", "ioc-tst-bench0001", ["epics"])
+    # Someone's new branch on github is fine
+    third = fake.repos.path("pcdshub", "ioc-tst-bench0002")
+    git(third, "branch", "feature", "master")
+
+    first_report, second_report, third_report = verify()
+    assert first_report.missing == ["refs/tags/v0.0.0"]
+    assert first_report.mismatched == ["refs/heads/branch00"]
+    assert len(first_report.errors) == 2
+    assert second_report.errors == [
+        "Missing topics: ecs-epics-ioc-tst, epics-ioc",
+        "github master does not end with our maintenance commits",
+    ]
+    assert third_report.ok
+    assert third_report.extra == ["refs/heads/feature"]
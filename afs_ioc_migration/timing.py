@@ -0,0 +1,229 @@
+import collections
+import contextlib
+import dataclasses
+import json
+import logging
+import math
+import os
+import subprocess
+import threading
+import time
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Span:
+    """How long one stage of one repo's migration took, and what it moved."""
+
+    repo: str
+    stage: str
+    # Wall clock time the stage started, for lining spans up with the logs
+    start: float
+    seconds: float = 0.0
+    bytes: int = 0
+    api_calls: int = 0
+    error: str = ""
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """The nearest-rank percentile of values, e.g. fraction=0.95 for p95."""
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def repo_bytes(path: str) -> int:
+    """
+    Bytes of objects stored in a repo, from git count-objects.
+
+    This only stats the object files. Objects borrowed from a cached
+    mirror through alternates are not counted.
+    """
+    output = subprocess.run(
+        ["git", "count-objects", "-v"],
+        cwd=path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    kib = 0
+    for line in output.splitlines():
+        key, _, value = line.partition(": ")
+        if key in ("size", "size-pack"):
+            kib += int(value)
+    return kib * 1024
+
+
+def pushed_bytes(path: str, include: Iterable[str], exclude: Iterable[str] = ()) -> int:
+    """
+    Bytes of the objects a push of include sends to a remote that has exclude.
+
+    This is the on-disk size from git rev-list --disk-usage, which is
+    close to the size of the pack git sends. Unlike repo_bytes, objects
+    borrowed from a cached mirror through alternates are counted.
+    """
+    include = list(include)
+    exclude = list(exclude)
+    if not include:
+        return 0
+    output = subprocess.run(
+        [
+            "git",
+            "rev-list",
+            "--objects",
+            "--disk-usage",
+            *include,
+            *(["--not", *exclude] if exclude else []),
+        ],
+        cwd=path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return int(output.strip() or 0)
+
+
+class SpanRecorder:
+    """
+    Collects the spans of every repo in a run, from any number of threads.
+
+    If path is given, each span is appended to it as one json line as soon
+    as it ends, so the file is useful even if the run dies. If
+    prometheus_path is given, close writes per-stage totals and p50/p95
+    durations there in the Prometheus textfile format.
+    """
+
+    def __init__(self, path: str = "", prometheus_path: str = "") -> None:
+        self.spans: list[Span] = []
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._fd = open(path, "a") if path else None
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if self._fd is not None:
+                self._fd.write(json.dumps(dataclasses.asdict(span)) + "\n")
+                self._fd.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                self._fd.close()
+                self._fd = None
+        if self.prometheus_path:
+            write_prometheus(self.summary(), self.prometheus_path)
+
+    def summary(self, slowest: int = 5) -> dict:
+        """Per-stage statistics and the repos that took the longest in total."""
+        with self._lock:
+            spans = list(self.spans)
+        by_stage: dict[str, list[Span]] = collections.defaultdict(list)
+        by_repo: dict[str, float] = collections.defaultdict(float)
+        for span in spans:
+            by_stage[span.stage].append(span)
+            by_repo[span.repo] += span.seconds
+        stages = {}
+        for stage, stage_spans in by_stage.items():
+            seconds = [span.seconds for span in stage_spans]
+            stages[stage] = {
+                "count": len(stage_spans),
+                "errors": sum(1 for span in stage_spans if span.error),
+                "total": sum(seconds),
+                "p50": percentile(seconds, 0.5),
+                "p95": percentile(seconds, 0.95),
+                "bytes": sum(span.bytes for span in stage_spans),
+                "api_calls": sum(span.api_calls for span in stage_spans),
+            }
+        return {
+            "stages": stages,
+            "slowest": sorted(by_repo.items(), key=lambda item: item[1], reverse=True)[
+                :slowest
+            ],
+        }
+
+    def log_summary(self) -> None:
+        summary = self.summary()
+        if not summary["stages"]:
+            return
+        logger.info("Time per stage:")
+        for stage, stats in sorted(
+            summary["stages"].items(), key=lambda item: item[1]["total"], reverse=True
+        ):
+            logger.info(
+                f"  {stage}: {stats['count']} spans, total {stats['total']:.1f}s, "
+                f"p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                f"{stats['bytes'] / 1024**2:.1f} MiB, {stats['api_calls']} api calls"
+            )
+        logger.info("Slowest repos:")
+        for repo, seconds in summary["slowest"]:
+            logger.info(f"  {repo}: {seconds:.1f}s")
+
+
+class RepoTimer:
+    """
+    Times the stages of one repo's migration.
+
+    Without a recorder, spans are timed but not kept anywhere.
+    """
+
+    def __init__(self, repo: str, recorder: SpanRecorder | None = None) -> None:
+        self.repo = repo
+        self.recorder = recorder
+
+    @property
+    def recording(self) -> bool:
+        """False if nobody will see the spans, so extra measurements can be skipped."""
+        return self.recorder is not None
+
+    @contextlib.contextmanager
+    def span(self, stage: str) -> Iterator[Span]:
+        """Time the body as one stage. Add bytes and api_calls to the span."""
+        span = Span(repo=self.repo, stage=stage, start=time.time())
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            span.seconds = time.perf_counter() - start
+            if self.recorder is not None:
+                self.recorder.record(span)
+
+
+def _prometheus_lines(summary: dict) -> Iterable[str]:
+    metrics = (
+        ("afs_migration_stage_seconds", "summary", "Seconds spent in each stage"),
+        ("afs_migration_stage_bytes_total", "counter", "Bytes fetched or pushed"),
+        ("afs_migration_stage_api_calls_total", "counter", "GitHub api calls made"),
+        ("afs_migration_stage_errors_total", "counter", "Stages that raised"),
+    )
+    for name, kind, help_text in metrics:
+        yield f"# HELP {name} {help_text}"
+        yield f"# TYPE {name} {kind}"
+        for stage, stats in sorted(summary["stages"].items()):
+            label = f'stage="{stage}"'
+            if kind == "summary":
+                yield f'{name}{{{label},quantile="0.5"}} {stats["p50"]}'
+                yield f'{name}{{{label},quantile="0.95"}} {stats["p95"]}'
+                yield f"{name}_sum{{{label}}} {stats['total']}"
+                yield f"{name}_count{{{label}}} {stats['count']}"
+            else:
+                key = name.removeprefix("afs_migration_stage_").removesuffix("_total")
+                yield f"{name}{{{label}}} {stats[key]}"
+
+
+def write_prometheus(summary: dict, path: str) -> None:
+    """
+    Write the summary for the node exporter's textfile collector.
+
+    The file is replaced in one step so the collector never reads half of it.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fd:
+        for line in _prometheus_lines(summary):
+            fd.write(line + "\n")
+    os.replace(tmp_path, path)
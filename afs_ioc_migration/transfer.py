@@ -1,15 +1,26 @@
+import dataclasses
 import logging
-import os
+import subprocess
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from fastcore.net import HTTP4xxClientError
-from ghapi.all import GhApi
 from git import Repo
 
+from .cache import update_mirror, use_alternates
+from .constants import BUNDLE, CLONE, DRY_RUN_DIR
+from .dryrun import write_summary
+from .github_client import GitHubClient, get_client
+from .gitignore import report_newly_ignored
+from .journal import Journal, journal_key, ref_fingerprint
 from .lock_repo import AlreadyLockedError, lock_file_repo
 from .modify import add_github_folder, add_gitignore, add_license_file, add_readme_file
-from .rename import RepoInfo
+from .org_index import OrgIndex
+from .plan import Plan
+from .plumbing import commit_maintenance, create_branches, git
+from .rename import CUSTOM_PROPERTIES, RepoInfo
+from .sync import SyncConflictError, SyncPlan, build_sync_repo, ls_remote, push_sync
+from .timing import RepoTimer, SpanRecorder, pushed_bytes, repo_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +28,72 @@ logger = logging.getLogger(__name__)
 class RepoExistsError(RuntimeError): ...
 
 
-def migrate_repo(afs_path: str, org: str, dry_run: bool, dry_run_dir: str = "") -> str:
+@dataclasses.dataclass
+class PreparedRepo:
+    """
+    A local clone of an afs repo with our changes, ready to be published.
+
+    This is what the local stage of a migration hands to the network stage.
+    """
+
+    info: RepoInfo
+    org: str
+    dry_run: bool
+    repo_exists: bool
+    path: str
+    tmpdir: TemporaryDirectory
+    journal: Journal | None = None
+    afs_path: str = ""
+    fingerprint: str = ""
+    finished: dict[str, str] = dataclasses.field(default_factory=dict)
+    # Where to push instead of the github ssh url, and what to use as the api
+    push_url: str = ""
+    gh: GitHubClient | None = None
+    api_url: str = ""
+    timer: RepoTimer | None = None
+    # Set when only the refs github is missing should be pushed
+    sync_plan: SyncPlan | None = None
+    # What a dry run leaves behind, and where
+    dry_run_output: str = CLONE
+    dry_run_dir: str = ""
+    # Set once we have asked github to create the repo, even if that failed
+    create_sent: bool = False
+
+    def mark(self, stage: str) -> None:
+        """Record a finished stage in the journal, if we have one."""
+        if self.journal is not None:
+            self.journal.mark(self.afs_path, stage, self.fingerprint)
+        self.finished[stage] = self.fingerprint
+
+    @property
+    def keep_clone(self) -> bool:
+        """True if this is a dry run that leaves the clone to inspect."""
+        return self.dry_run and self.dry_run_output == CLONE
+
+    def cleanup(self) -> None:
+        """Remove the local clone, unless it is a dry run we want to inspect."""
+        if not self.keep_clone:
+            self.tmpdir.cleanup()
+
+
+def migrate_repo(
+    afs_path: str,
+    org: str,
+    dry_run: bool,
+    dry_run_dir: str = "",
+    org_index: OrgIndex | None = None,
+    journal: Journal | None = None,
+    cache_dir: str = "",
+    checkout: bool = True,
+    resolve: bool = True,
+    plan: Plan | None = None,
+    gh: GitHubClient | None = None,
+    api_url: str = "",
+    push_url_template: str = "",
+    recorder: SpanRecorder | None = None,
+    sync: bool = False,
+    dry_run_output: str = CLONE,
+) -> str:
     """
     Migrate an afs directory repo to pcdshub.
 
@@ -29,156 +105,554 @@ def migrate_repo(afs_path: str, org: str, dry_run: bool, dry_run_dir: str = "")
     - Contents: read and write
     - Custom properties: read and write
     - Metadata: read-only
+
+    This runs prepare_repo and then publish_repo, see those
+    functions for the details of each stage.
+
+    If a journal is provided and says this repo was already migrated,
+    nothing is done and an empty string is returned. When syncing, that
+    is only if nothing was pushed to afs since.
+    """
+    if is_migrated(afs_path=afs_path, journal=journal, dry_run=dry_run, sync=sync):
+        return ""
+    prepared = prepare_repo(
+        afs_path=afs_path,
+        org=org,
+        dry_run=dry_run,
+        dry_run_dir=dry_run_dir,
+        org_index=org_index,
+        journal=journal,
+        cache_dir=cache_dir,
+        checkout=checkout,
+        resolve=resolve,
+        plan=plan,
+        gh=gh,
+        api_url=api_url,
+        push_url_template=push_url_template,
+        recorder=recorder,
+        sync=sync,
+        dry_run_output=dry_run_output,
+    )
+    return publish_repo(prepared)
+
+
+def prepare_repo(
+    afs_path: str,
+    org: str,
+    dry_run: bool,
+    dry_run_dir: str = "",
+    org_index: OrgIndex | None = None,
+    journal: Journal | None = None,
+    cache_dir: str = "",
+    checkout: bool = True,
+    resolve: bool = True,
+    plan: Plan | None = None,
+    gh: GitHubClient | None = None,
+    api_url: str = "",
+    push_url_template: str = "",
+    recorder: SpanRecorder | None = None,
+    sync: bool = False,
+    dry_run_output: str = CLONE,
+) -> PreparedRepo:
+    """
+    The local stage of a migration.
+
+    Lock the afs repo, make sure it isn't already on github,
+    clone it to a temporary directory, and commit our standard changes.
+
+    If an org_index is provided, it is used to check for an existing
+    github repo instead of asking github about this repo specifically.
+
+    If a journal is provided, stages that an earlier run already finished
+    are skipped and each newly finished stage is recorded. Dry runs
+    neither read nor write the journal.
+
+    If a cache_dir is provided, the afs repo is fetched through a local
+    mirror kept there, see build_local_repo.
+
+    If checkout is False, the maintenance commits are made with git
+    plumbing and the clone never gets a working tree or index.
+
+    If resolve is False, afs_path must already be a resolved absolute path,
+    e.g. from an inventory manifest, and we never resolve it again.
+
+    If a plan is provided, the repo's name comes from the plan instead,
+    and we refuse to migrate repos the plan found a problem with.
+
+    gh, api_url and push_url_template let something else stand in for
+    github, e.g. the fake github server or local bare repos in the
+    benchmark package. gh replaces the github api client, api_url points
+    our usual client at a different server, and push_url_template,
+    formatted with org and name, replaces the github ssh url we push to.
+
+    If a recorder is provided, every stage of this repo's migration,
+    here and in publish_repo, is timed as a span and recorded there.
+
+    If sync is True, a github repo that already has commits is caught up
+    instead of refused: only the branches and tags that are new or moved
+    on afs are fetched and pushed, see sync.build_sync_repo.
+
+    dry_run_output picks what a dry run leaves in dry_run_dir: the full
+    clone, or with "summary" or "bundle", only the few small files that
+    dryrun.write_summary writes, and the clone is removed.
+
+    The caller is responsible for either passing the result to
+    publish_repo or calling its cleanup method.
     """
-    # Force afs_path to be an absolute path to avoid issues later
-    afs_path = str(Path(afs_path).resolve())
+    if dry_run:
+        journal = None
+    key = journal_key(afs_path)
+    timer = RepoTimer(repo=key, recorder=recorder)
+
+    if plan is not None:
+        # Get the planned name, or error out now if we shouldn't migrate
+        info = plan.get_info(afs_path)
+        afs_path = info.afs_source
+    else:
+        # Force afs_path to be an absolute path to avoid issues later
+        if resolve:
+            afs_path = str(Path(afs_path).resolve())
+
+        # Get the new name and other info, or error out now if we shouldn't migrate
+        info = RepoInfo.from_afs(afs_source=afs_path, org=org, resolve=False)
 
-    # Get the new name and other info, or error out now if we shouldn't migrate
-    info = RepoInfo.from_afs(afs_source=afs_path, org=org)
+    # The fingerprint tells us if afs changed since an earlier run
+    finished = {}
+    fingerprint = ""
+    if journal is not None:
+        fingerprint = ref_fingerprint(afs_path)
+        finished = journal.check_fingerprint(key, fingerprint)
+        if finished:
+            logger.info(f"Journal: already finished {', '.join(finished)}")
 
     # Lock the afs repo if it isn't locked
     if dry_run:
         logger.info(f"Dry run: skip locking {afs_path}")
+    elif "locked" in finished:
+        logger.info(f"Journal: {afs_path} was locked in an earlier run, continuing.")
     else:
         logger.info(f"Locking afs repo {afs_path}...")
-        try:
-            lock_file_repo(path=afs_path, org=org)
-        except AlreadyLockedError:
-            logger.info(f"{afs_path} is already locked, continuing.")
+        with timer.span("lock"):
+            try:
+                lock_file_repo(path=afs_path, org=org, repo_info=info)
+            except AlreadyLockedError:
+                logger.info(f"{afs_path} is already locked, continuing.")
+            else:
+                logger.info(f"{afs_path} has been locked, continuing.")
+        if journal is not None:
+            journal.mark(key, "locked", fingerprint)
+
+    push_url = push_url_template.format(org=org, name=info.name)
+    if "created" in finished:
+        # We made this repo in an earlier run, it may have partial pushes
+        logger.info(f"Journal: {info.github_url} was created in an earlier run.")
+        repo_exists = True
+    else:
+        with timer.span("check") as span:
+            if org_index is None:
+                span.api_calls += 1
+            try:
+                repo_exists = check_repo_exists(
+                    info=info,
+                    org=org,
+                    dry_run=dry_run,
+                    org_index=org_index,
+                    gh=gh,
+                    api_url=api_url,
+                )
+            except RepoExistsError:
+                if not sync:
+                    raise
+                repo_exists = True
+
+    github_refs = {}
+    if sync and repo_exists:
+        logger.info(f"Listing the refs already on {info.github_url}")
+        with timer.span("compare"):
+            github_refs = ls_remote(push_url or info.github_ssh)
+
+    tmpdir_args = {}
+    if dry_run:
+        path_obj = Path(dry_run_dir or DRY_RUN_DIR).resolve()
+        path_obj.mkdir(exist_ok=True)
+        dry_run_dir = str(path_obj)
+        if dry_run_output == CLONE:
+            tmpdir_args["delete"] = False
+            tmpdir_args["prefix"] = f"{info.name}_"
+            tmpdir_args["dir"] = dry_run_dir
+            logger.info(f"Dry run: create repo in {tmpdir_args['dir']}")
+
+    # Removed by PreparedRepo.cleanup after publishing, or right away on error
+    tmpdir = TemporaryDirectory(**tmpdir_args)
+    sync_plan = None
+    try:
+        if github_refs:
+            logger.info(f"Syncing only what {info.github_url} is missing")
+            sync_plan = build_sync_repo(
+                info=info,
+                path=tmpdir.name,
+                github_refs=github_refs,
+                github_url=push_url or info.github_ssh,
+                cache_dir=cache_dir,
+                timer=timer,
+            )
         else:
-            logger.info(f"{afs_path} has been locked, continuing.")
+            build_local_repo(
+                info=info,
+                path=tmpdir.name,
+                cache_dir=cache_dir,
+                checkout=checkout,
+                timer=timer,
+            )
+    except BaseException:
+        if not tmpdir_args:
+            tmpdir.cleanup()
+        raise
+
+    prepared = PreparedRepo(
+        info=info,
+        org=org,
+        dry_run=dry_run,
+        repo_exists=repo_exists,
+        path=tmpdir.name,
+        tmpdir=tmpdir,
+        journal=journal,
+        afs_path=key,
+        fingerprint=fingerprint,
+        finished=finished,
+        push_url=push_url,
+        gh=gh,
+        api_url=api_url,
+        timer=timer,
+        sync_plan=sync_plan,
+        dry_run_output=dry_run_output,
+        dry_run_dir=dry_run_dir,
+    )
+    prepared.mark("prepared")
+    return prepared
 
-    # Check if the repo is already on github and if it has commits
-    gh = GhApi()
+
+def is_migrated(
+    afs_path: str, journal: Journal | None, dry_run: bool, sync: bool = False
+) -> bool:
+    """
+    Check the journal to see if this repo was fully migrated in an earlier run.
+
+    When syncing, the repo also has to be unchanged on afs since it was
+    pushed, so we read its refs. Otherwise this doesn't touch afs or github.
+    """
+    if journal is None or dry_run:
+        return False
+    fingerprint = None
+    if sync:
+        try:
+            fingerprint = ref_fingerprint(afs_path)
+        except (OSError, subprocess.CalledProcessError):
+            # Not a repo we can read, let prepare_repo report why
+            return False
+    if journal.is_complete(afs_path, fingerprint=fingerprint):
+        logger.info(f"Journal: {afs_path} was already migrated, skipping.")
+        return True
+    return False
+
+
+def check_repo_exists(
+    info: RepoInfo,
+    org: str,
+    dry_run: bool,
+    org_index: OrgIndex | None = None,
+    gh: GitHubClient | None = None,
+    api_url: str = "",
+) -> bool:
+    """
+    Check if the repo is already on github and if it has commits.
+
+    Returns True if the repo exists but is empty, False if it does not exist,
+    and raises RepoExistsError if it has commits (except in dry run mode).
+
+    If org_index is provided, no api call is needed.
+    Otherwise we ask gh, which defaults to the shared github client
+    for api_url, or for api.github.com if that is empty.
+    """
+    if org_index is not None:
+        logger.info(f"Checking org index for existing repo at {info.github_url}")
+        org_repo = org_index.get(info.name)
+        if org_repo is None:
+            logger.info(f"Repo {info.github_url} does not exist, continuing.")
+            return False
+        elif not org_repo.has_commits:
+            logger.info(
+                f"Repo {info.github_url} exists but does not have commits, continuing."
+            )
+            return True
+        return _found_commits(info=info, dry_run=dry_run)
+
+    # All api calls share the process-wide connection pool and rate limiter
+    if gh is None:
+        gh = get_client(api_url)
     logger.info(f"Checking for existing repo commits at {info.github_url}")
     try:
         gh.repos.list_commits(org, info.name)
     except HTTP4xxClientError as exc:
         if exc.code == 404:
             logger.info(f"Repo {info.github_url} does not exist, continuing.")
-            repo_exists = False
+            return False
         elif exc.code == 409:
             logger.info(
                 f"Repo {info.github_url} exists but does not have commits, continuing."
             )
-            repo_exists = True
+            return True
         else:
             # Some unknown 4xx http error
             raise
-    else:
-        if dry_run:
-            logger.warning("Dry run: repo already exists! Continuing...")
-            repo_exists = True
-        else:
-            raise RepoExistsError(
-                f"Repo {info.github_url} exists and has commits, aborting."
-            )
+    return _found_commits(info=info, dry_run=dry_run)
 
-    tmpdir_args = {}
+
+def _found_commits(info: RepoInfo, dry_run: bool) -> bool:
+    """The repo exists and has commits: error out, unless it's a dry run."""
     if dry_run:
-        tmpdir_args["delete"] = False
-        tmpdir_args["prefix"] = f"{info.name}_"
-        if dry_run_dir:
-            path_name = dry_run_dir
-        else:
-            path_name = "dry_run_transfer"
-        path_obj = Path(path_name).resolve()
-        path_obj.mkdir(exist_ok=True)
-        tmpdir_args["dir"] = str(path_obj)
-        logger.info(f"Dry run: create repo in {tmpdir_args['dir']}")
+        logger.warning("Dry run: repo already exists! Continuing...")
+        return True
+    raise RepoExistsError(f"Repo {info.github_url} exists and has commits, aborting.")
+
 
-    # Context manager to remove temp dir after usage
-    with TemporaryDirectory(**tmpdir_args) as path:
-        # Clone from afs to a temporary directory
-        logger.info(f"Cloning HEAD from {afs_path} to {path} as master")
+def build_local_repo(
+    info: RepoInfo,
+    path: str,
+    cache_dir: str = "",
+    checkout: bool = True,
+    timer: RepoTimer | None = None,
+) -> Repo:
+    """
+    Clone the afs repo into path and commit our systemic modifications.
+
+    Afterwards, every afs branch and tag exists locally, ready to push.
+
+    If a cache_dir is provided, we first bring a local mirror of the afs
+    repo up to date, which only reads new objects from afs, and then
+    fetch from that mirror using git alternates so that the clone shares
+    the mirror's objects instead of copying them.
+
+    If checkout is False, we skip the working tree entirely and build
+    the same commits from trees and blobs, see plumbing.commit_maintenance.
+
+    Each step is timed with timer, if provided.
+    """
+    if timer is None:
+        timer = RepoTimer(repo=info.afs_source)
+    # Clone from afs to a temporary directory
+    logger.info(f"Cloning HEAD from {info.afs_source} to {path} as master")
+    with timer.span("fetch") as span:
         repo = Repo.init(path=path, mkdir=False)
-        afs_remote = repo.create_remote(name="afs_remote", url=afs_path)
-        fetch_info = afs_remote.fetch(
-            ["*:refs/remotes/afs_remote/*", "refs/tags/*:refs/tags/*"]
+        source = info.afs_source
+        if cache_dir:
+            source = update_mirror(afs_path=info.afs_source, cache_dir=cache_dir)
+            use_alternates(repo_path=path, mirror=source)
+            logger.info(f"Fetching through cached mirror {source}")
+        repo.create_remote(name="afs_remote", url=source)
+        git(
+            path,
+            "fetch",
+            "--quiet",
+            "afs_remote",
+            "*:refs/remotes/afs_remote/*",
+            "refs/tags/*:refs/tags/*",
         )
+        if timer.recording:
+            span.bytes = repo_bytes(path)
+
+    if checkout:
         logger.info("Checking out HEAD as master")
-        afs_head = repo.create_head("master", afs_remote.refs.HEAD)
-        afs_head.checkout()
+        with timer.span("checkout"):
+            afs_head = repo.create_head("master", "refs/remotes/afs_remote/HEAD")
+            afs_head.checkout()
+        commit_with_checkout(repo=repo, path=path, info=info, timer=timer)
+    else:
+        logger.info("Committing standard files on top of HEAD as master")
+        with timer.span("maintenance"):
+            commit_maintenance(repo_path=path, info=info)
+
+    # Create a same-named head for every single branch on the afs remote
+    with timer.span("branches"):
+        count = create_branches(repo_path=path, remote="afs_remote")
+        logger.info(f"Created {count} branches from afs")
+
+    return repo
+
 
-        # At this point, we have all branches and tags fetched.
-        # The working directory is currently even with afs's head
-        # The head is now named "master" locally,
-        # regardless of whichever strange name it may have upstream.
+def commit_with_checkout(
+    repo: Repo, path: str, info: RepoInfo, timer: RepoTimer | None = None
+) -> None:
+    """Commit our systemic modifications using the checked out working tree."""
+    if timer is None:
+        timer = RepoTimer(repo=info.afs_source)
+    # At this point, we have all branches and tags fetched.
+    # The working directory is currently even with afs's head
+    # The head is now named "master" locally,
+    # regardless of whichever strange name it may have upstream.
 
-        # Make and commit systemic modifications (.gitignore, license, others)
-        logger.info("Adding license file")
+    # Make and commit systemic modifications (.gitignore, license, others)
+    logger.info("Adding license file")
+    with timer.span("license"):
         license = add_license_file(cloned_path=path)
         commit(repo, license, "MAINT: add standard license file")
-        logger.info("Updating gitignore")
+    logger.info("Updating gitignore")
+    with timer.span("gitignore"):
+        old_gitignore_path = Path(path) / ".gitignore"
+        old_gitignore = ""
+        if old_gitignore_path.exists():
+            old_gitignore = old_gitignore_path.read_text()
         gitignore = add_gitignore(cloned_path=path)
+        report_newly_ignored(
+            repo_path=path, old=old_gitignore, new=gitignore.read_text()
+        )
         commit(repo, gitignore, "MAINT: update gitignore")
-        logger.info("Adding github templates")
+    logger.info("Adding github templates")
+    with timer.span("github_folder"):
         github_templates = add_github_folder(cloned_path=path)
         commit(repo, github_templates, "MAINT: add github templates")
-        logger.info("Updating readme")
+    logger.info("Updating readme")
+    with timer.span("readme"):
         new_readme, old_readmes = add_readme_file(cloned_path=path, repo_info=info)
         if old_readmes:
             repo.index.remove([str(p) for p in old_readmes])
         commit(repo, new_readme, "MAINT: update readme")
 
+
+def publish_repo(prepared: PreparedRepo, cleanup: bool = True) -> str:
+    """
+    The network stage of a migration.
+
+    Create the github repo, set its topics, and push every branch and tag.
+    The local clone is cleaned up afterwards, even if something fails,
+    unless cleanup is False, e.g. so that the caller can publish again
+    after a transient failure. Stages that finished are not repeated.
+
+    If the repo was prepared for a sync, only the planned refs are
+    pushed, and SyncConflictError is raised afterwards if there were
+    refs we couldn't update without overwriting something on github.
+
+    Returns the path to the local clone, which only still exists after
+    a dry run, or to the dry run summary if one was asked for.
+    """
+    info = prepared.info
+    org = prepared.org
+    dry_run = prepared.dry_run
+    timer = prepared.timer or RepoTimer(repo=prepared.afs_path)
+    output = prepared.path
+    try:
         # OK, great, we have an updated repo now.
         # If we get this far, we can safely make the github repo.
         # Some sources fail earlier, e.g. if the afs repo is empty...
+        gh = prepared.gh if prepared.gh is not None else get_client(prepared.api_url)
 
         # Create the blank repo if needed
-        if repo_exists:
+        if "created" in prepared.finished:
+            logger.info("Journal: repo was created in an earlier run, skipping.")
+        elif prepared.repo_exists:
             logger.info("Repo already exists, skipping creation.")
         elif dry_run:
             logger.info("Dry run: skipping repository creation.")
+        elif prepared.create_sent and check_repo_exists(
+            info=info, org=org, dry_run=dry_run, gh=gh
+        ):
+            # The last attempt failed, but only after github made the repo
+            logger.info("Repo was created by an earlier attempt, skipping creation.")
+            prepared.mark("created")
         else:
             logger.info(f"Creating repository at {info.github_url}")
-            gh.repos.create_in_org(
-                org=org,
-                name=info.name,
-                visibility="internal",
-                custom_properties={
-                    "type": "EPICS IOC",
-                    "protect_default": "true",
-                    "protect_master": "true",
-                    "protect_gh_pages": "false",
-                    "required_checks": "None",
-                },
-            )
+            with timer.span("create") as span:
+                span.api_calls += 1
+                prepared.create_sent = True
+                gh.repos.create_in_org(
+                    org=org,
+                    name=info.name,
+                    visibility="internal",
+                    custom_properties=CUSTOM_PROPERTIES,
+                )
+            prepared.mark("created")
 
         # Set repo topics
         if dry_run:
             logger.info("Dry run: Skip setting standard repo topics")
+        elif "topics" in prepared.finished:
+            logger.info("Journal: repo topics were set in an earlier run, skipping.")
         else:
             logger.info("Setting standard repo topics")
-            gh.repos.replace_all_topics(
-                owner=org,
-                repo=info.name,
-                names=[
-                    "epics",
-                    "epics-ioc",
-                    f"ecs-epics-ioc-{info.area}",
-                ],
-            )
+            with timer.span("topics") as span:
+                span.api_calls += 1
+                gh.repos.replace_all_topics(
+                    owner=org,
+                    repo=info.name,
+                    names=info.topics,
+                )
+            prepared.mark("topics")
 
         # Time to push everything
-        # Create a same-named head for every single branch on the afs remote
-        for fetch in fetch_info:
-            if "afs_remote/refs/heads" in fetch.name:
-                logger.info(f"Found branch named {fetch.remote_ref_path}")
-                repo.create_head(str(fetch.remote_ref_path), fetch.ref)
+        sync_plan = prepared.sync_plan
         if dry_run:
             logger.info("Dry run: skipping github push")
+            if not prepared.keep_clone:
+                output = write_summary(
+                    repo_path=prepared.path,
+                    info=info,
+                    dry_run_dir=prepared.dry_run_dir,
+                    refs=None
+                    if sync_plan is None
+                    else {update.ref: update.new for update in sync_plan.updates},
+                    bundle=prepared.dry_run_output == BUNDLE,
+                )
+        elif sync_plan is not None:
+            logger.info(f"Pushing {len(sync_plan.updates)} new or moved refs to github")
+            with timer.span("push") as span:
+                if timer.recording:
+                    span.bytes = pushed_bytes(
+                        prepared.path,
+                        include=[update.new for update in sync_plan.updates],
+                        exclude=[
+                            update.old for update in sync_plan.updates if update.old
+                        ],
+                    )
+                push_sync(
+                    path=prepared.path,
+                    url=prepared.push_url or info.github_ssh,
+                    plan=sync_plan,
+                )
+            if sync_plan.conflicts:
+                raise SyncConflictError(
+                    f"Could not sync {info.github_url}: "
+                    + ", ".join(
+                        f"{ref} ({reason})"
+                        for ref, reason in sync_plan.conflicts.items()
+                    )
+                )
+            prepared.mark("pushed")
         else:
             logger.info("Pushing all branches and tags to github")
-            github_remote = repo.create_remote(
-                name="github_remote", url=info.github_ssh
-            )
-            github_remote.push("*")
+            with timer.span("push") as span:
+                if timer.recording:
+                    # "*" pushes every ref, and github starts out empty
+                    span.bytes = pushed_bytes(prepared.path, include=["--all"])
+                repo = Repo(prepared.path)
+                try:
+                    # Left over from an earlier attempt
+                    github_remote = repo.remote("github_remote")
+                except ValueError:
+                    github_remote = repo.create_remote(
+                        name="github_remote", url=prepared.push_url or info.github_ssh
+                    )
+                # Don't record the push as finished if git reported an error
+                github_remote.push("*").raise_if_error()
+            prepared.mark("pushed")
+    finally:
+        if cleanup:
+            prepared.cleanup()
 
-    return path
+    return output
 
 
 def commit(repo: Repo, path: Path, msg: str) -> None:
-    repo.index.add([str(path)])
-    repo.index.write()
+    # git add rather than index.add, which changes the working directory
+    # of the whole process and so breaks clones in other threads
+    repo.git.add("--", str(path))
     repo.index.commit(msg)
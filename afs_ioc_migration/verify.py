@@ -0,0 +1,259 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, TextIO
+
+from .github_client import GitHubClient, get_client
+from .org_index import OrgIndex
+from .plan import Plan
+from .plumbing import MAINTENANCE_SUBJECTS
+from .rename import CUSTOM_PROPERTIES, RepoInfo
+from .sync import MASTER, ls_remote
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class VerifyReport:
+    """
+    How a migrated repo on github compares with its afs source.
+
+    errors are anything that doesn't match what the migration should
+    have left behind. Refs that only exist on github are listed in
+    extra but are not errors, people may have pushed there since.
+    """
+
+    afs_path: str
+    name: str = ""
+    matched: int = 0
+    missing: list[str] = dataclasses.field(default_factory=list)
+    mismatched: list[str] = dataclasses.field(default_factory=list)
+    extra: list[str] = dataclasses.field(default_factory=list)
+    errors: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def fetch_properties(
+    org: str, gh: GitHubClient, per_page: int = 100
+) -> dict[str, dict[str, str]]:
+    """The custom property values of every repo in the org, by lowercase name."""
+    properties = {}
+    page = 1
+    while True:
+        batch = gh.orgs.custom_properties_for_repos_get_organization_values(
+            org, per_page=per_page, page=page
+        )
+        for data in batch:
+            properties[data["repository_name"].lower()] = {
+                prop["property_name"]: prop["value"] for prop in data["properties"]
+            }
+        if len(batch) < per_page:
+            return properties
+        page += 1
+
+
+def compare_refs(
+    report: VerifyReport, afs_refs: dict[str, str], github_refs: dict[str, str]
+) -> None:
+    """
+    Check that every afs branch and tag is on github with the same id.
+
+    master is skipped, it is afs HEAD with our commits on top, see check_master.
+    """
+    for ref, sha in sorted(afs_refs.items()):
+        if ref in ("HEAD", MASTER):
+            continue
+        if ref not in github_refs:
+            report.missing.append(ref)
+        elif github_refs[ref] != sha:
+            report.mismatched.append(ref)
+        else:
+            report.matched += 1
+    if MASTER not in github_refs:
+        report.missing.append(MASTER)
+    report.extra = sorted(set(github_refs) - set(afs_refs) - {"HEAD", MASTER})
+    if report.missing:
+        report.errors.append(f"{len(report.missing)} refs are missing on github")
+    if report.mismatched:
+        report.errors.append(
+            f"{len(report.mismatched)} refs point somewhere else on github"
+        )
+
+
+def check_master(report: VerifyReport, commits: list[dict], afs_head: str) -> None:
+    """
+    Check that github master is afs HEAD with our maintenance commits on top.
+
+    commits are the newest commits on github master, newest first, as
+    the api lists them.
+    """
+    subjects = tuple(
+        (commit["commit"]["message"].splitlines() or [""])[0]
+        for commit in reversed(commits)
+    )
+    if subjects != MAINTENANCE_SUBJECTS:
+        report.errors.append("github master does not end with our maintenance commits")
+        return
+    parents = commits[-1]["parents"]
+    base = parents[0]["sha"] if parents else ""
+    if base != afs_head:
+        report.errors.append(
+            f"github master is built on {base or 'nothing'}, not afs HEAD {afs_head}"
+        )
+
+
+def check_settings(
+    report: VerifyReport,
+    info: RepoInfo,
+    index: OrgIndex,
+    properties: dict[str, dict[str, str]],
+) -> None:
+    """Check the repo's topics and custom properties from the org listings."""
+    org_repo = index.get(info.name)
+    if org_repo is None:
+        report.errors.append(f"{info.github_url} does not exist")
+        return
+    missing_topics = sorted(set(info.topics) - set(org_repo.topics))
+    if missing_topics:
+        report.errors.append(f"Missing topics: {', '.join(missing_topics)}")
+    values = properties.get(info.name.lower(), {})
+    for key, expected in CUSTOM_PROPERTIES.items():
+        if values.get(key) != expected:
+            report.errors.append(
+                f"Custom property {key} is {values.get(key)!r}, expected {expected!r}"
+            )
+
+
+def _ls_remote_error(which: str, exc: BaseException) -> str:
+    if isinstance(exc, subprocess.CalledProcessError):
+        return f"git ls-remote of {which} failed: {exc.stderr.strip()}"
+    return f"git ls-remote of {which} failed: {exc}"
+
+
+def verify_many(
+    paths: Iterable[str],
+    org: str,
+    jobs: int = 1,
+    resolve: bool = True,
+    plan: Plan | None = None,
+    gh: GitHubClient | None = None,
+    api_url: str = "",
+    push_url_template: str = "",
+) -> list[VerifyReport]:
+    """
+    Check that every afs repo arrived on github, returning reports in order.
+
+    Nothing is cloned. Both sides of every repo are listed with git
+    ls-remote, jobs at a time, while the topics and custom properties
+    of the whole org are read with a few paginated api calls.
+    The last commits on github master are then read for every repo
+    at once, to check that they are our maintenance commits on top
+    of afs HEAD.
+
+    gh, api_url and push_url_template stand in for github like they
+    do for migrate_repo.
+    """
+    if gh is None:
+        gh = get_client(api_url)
+    reports = []
+    infos: dict[int, RepoInfo] = {}
+    for num, afs_path in enumerate(paths):
+        report = VerifyReport(afs_path=afs_path)
+        try:
+            if plan is not None:
+                info = plan.get_info(afs_path)
+            else:
+                info = RepoInfo.from_afs(afs_source=afs_path, org=org, resolve=resolve)
+        except (ValueError, IndexError) as exc:
+            report.errors.append(f"Invalid name: {exc}")
+        else:
+            report.name = info.name
+            infos[num] = info
+        reports.append(report)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        listings: dict[int, tuple[Future, Future]] = {
+            num: (
+                executor.submit(ls_remote, info.afs_source),
+                executor.submit(
+                    ls_remote,
+                    push_url_template.format(org=org, name=info.name)
+                    or info.github_ssh,
+                ),
+            )
+            for num, info in infos.items()
+        }
+        # The api reads overlap with the listings
+        index = OrgIndex.fetch(org, gh=gh)
+        properties = fetch_properties(org, gh=gh)
+
+    heads = {}
+    for num, (afs_future, github_future) in listings.items():
+        report = reports[num]
+        check_settings(report, infos[num], index=index, properties=properties)
+        if (exc := afs_future.exception()) is not None:
+            report.errors.append(_ls_remote_error("afs", exc))
+            continue
+        if (exc := github_future.exception()) is not None:
+            report.errors.append(_ls_remote_error("github", exc))
+            continue
+        afs_refs = afs_future.result()
+        github_refs = github_future.result()
+        compare_refs(report, afs_refs=afs_refs, github_refs=github_refs)
+        if "HEAD" not in afs_refs:
+            report.errors.append("afs HEAD does not point at anything")
+        elif MASTER in github_refs:
+            heads[num] = (github_refs[MASTER], afs_refs["HEAD"])
+
+    async def read_masters() -> list:
+        return await asyncio.gather(
+            *(
+                gh.aio.list_commits(
+                    org,
+                    infos[num].name,
+                    sha=github_master,
+                    per_page=len(MAINTENANCE_SUBJECTS),
+                )
+                for num, (github_master, _) in heads.items()
+            ),
+            return_exceptions=True,
+        )
+
+    for (num, (_, afs_head)), commits in zip(heads.items(), gh.run(read_masters())):
+        if isinstance(commits, BaseException):
+            reports[num].errors.append(f"Could not read github master: {commits}")
+        else:
+            check_master(reports[num], commits=commits, afs_head=afs_head)
+
+    for report in reports:
+        for error in report.errors:
+            logger.warning(f"{report.afs_path}: {error}")
+    return reports
+
+
+def write_report(reports: list[VerifyReport], fd: TextIO) -> None:
+    """Write the reports and a short summary as json."""
+    failed = [report for report in reports if not report.ok]
+    json.dump(
+        {
+            "summary": {
+                "total": len(reports),
+                "ok": len(reports) - len(failed),
+                "failed": len(failed),
+                "missing_refs": sum(len(report.missing) for report in reports),
+                "mismatched_refs": sum(len(report.mismatched) for report in reports),
+            },
+            "repos": [
+                dict(dataclasses.asdict(report), ok=report.ok) for report in reports
+            ],
+        },
+        fd,
+        indent=2,
+    )
+    fd.write("\n")
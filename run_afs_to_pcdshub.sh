@@ -1,2 +1,2 @@
 #!/bin/bash
-python -m afs_ioc_migration --org pcdshub --dry-run /afs/slac.stanford.edu/g/cd/swe/git/repos/package/epics/ioc/*/*.git /afs/slac.stanford.edu/g/cd/swe/git/repos/package/epics/ioc/xpp/ccm/*.git 2>&1 | tee -a migration.log
+python -m afs_ioc_migration migrate --org pcdshub --journal migration_journal.db --cache-dir afs_mirrors --dry-run /afs/slac.stanford.edu/g/cd/swe/git/repos/package/epics/ioc/*/*.git /afs/slac.stanford.edu/g/cd/swe/git/repos/package/epics/ioc/xpp/ccm/*.git 2>&1 | tee -a migration.log